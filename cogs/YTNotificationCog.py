@@ -6,6 +6,7 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
 import sqlite3
+from utils.notifications import get_notification_hub
 
 # 載入環境變數
 load_dotenv()
@@ -30,6 +31,9 @@ class YTNotificationCog(commands.Cog):
         
         self.last_video_ids = {}  # 儲存每個頻道的最新影片 ID
         self.channel_names = {}  # 儲存頻道名稱快取
+        self.notifications = get_notification_hub(bot)
+        self.notifications.register("video_published", self.render_video_published)
+        self.notifications.start()
         self.check_new_videos.start()
 
     def get_yt_config(self, guild_id):
@@ -81,7 +85,8 @@ class YTNotificationCog(commands.Cog):
             print("❌ 缺少 YT_API_KEY，YouTube 通知功能將無法工作！")
             return
         
-        youtube = build("youtube", "v3", developerKey=self.api_key)
+        # 依 YouTube 頻道彙整訂閱的 Discord 頻道，每個 YouTube 頻道只查詢一次
+        subscribers = {}
         guild_ids = [row[0] for row in self.cursor.execute("SELECT guild_id FROM yt_config")]
         for guild_id in guild_ids:
             data = self.get_yt_config(guild_id)
@@ -90,96 +95,104 @@ class YTNotificationCog(commands.Cog):
             if not discord_channel_id or not channel_ids:
                 print(f"❌ 伺服器 {guild_id} 缺少通知頻道或追蹤頻道，跳過檢查")
                 continue
-
+            for channel_id in channel_ids:
+                subscribers.setdefault(channel_id, {})[int(discord_channel_id)] = None
+        
+        youtube = build("youtube", "v3", developerKey=self.api_key)
+        for channel_id, targets in subscribers.items():
             try:
-                for channel_id in channel_ids:
-                    # 取得頻道最新影片
-                    request = youtube.search().list(
-                        part="snippet",
-                        channelId=channel_id,
-                        maxResults=1,
-                        order="date",
-                        type="video",
-                        fields="items(id/videoId,snippet(publishedAt,title,channelTitle,thumbnails/high/url))"
-                    )
-                    response = request.execute()
+                # 取得頻道最新影片
+                request = youtube.search().list(
+                    part="snippet",
+                    channelId=channel_id,
+                    maxResults=1,
+                    order="date",
+                    type="video",
+                    fields="items(id/videoId,snippet(publishedAt,title,channelTitle,thumbnails/high/url))"
+                )
+                response = request.execute()
 
-                    if "items" in response and response["items"]:
-                        item = response["items"][0]
-                        video_id = item["id"]["videoId"]
-                        title = item["snippet"]["title"]
-                        published_at = item["snippet"]["publishedAt"]
-                        channel_name = item["snippet"]["channelTitle"]
-                        thumbnail_url = item["snippet"]["thumbnails"]["high"]["url"]
+                if "items" in response and response["items"]:
+                    item = response["items"][0]
+                    video_id = item["id"]["videoId"]
+                    title = item["snippet"]["title"]
+                    published_at = item["snippet"]["publishedAt"]
+                    channel_name = item["snippet"]["channelTitle"]
+                    thumbnail_url = item["snippet"]["thumbnails"]["high"]["url"]
 
-                        # 檢查是否為新影片
-                        if video_id != self.last_video_ids.get(channel_id):
-                            # 首次運行時，只記錄不發送通知
-                            if channel_id not in self.last_video_ids:
-                                print(f"初始化頻道 {channel_name} 的最新影片: {title}")
+                    # 檢查是否為新影片
+                    if video_id != self.last_video_ids.get(channel_id):
+                        # 首次運行時，只記錄不發送通知
+                        if channel_id not in self.last_video_ids:
+                            print(f"初始化頻道 {channel_name} 的最新影片: {title}")
+                            self.last_video_ids[channel_id] = video_id
+                            continue
+                        
+                        # 檢查影片是否真的是最近發布的（避免舊影片被誤判為新影片）
+                        try:
+                            published_time = datetime.fromisoformat(published_at.replace('Z', '+00:00'))
+                            time_diff = datetime.now(published_time.tzinfo) - published_time
+                            
+                            # 只有在 24 小時內發布的影片才算新影片
+                            if time_diff.days > 1:
+                                print(f"影片 {title} 發布超過 24 小時，跳過通知")
                                 self.last_video_ids[channel_id] = video_id
                                 continue
-                            
-                            # 檢查影片是否真的是最近發布的（避免舊影片被誤判為新影片）
-                            try:
-                                published_time = datetime.fromisoformat(published_at.replace('Z', '+00:00'))
-                                time_diff = datetime.now(published_time.tzinfo) - published_time
-                                
-                                # 只有在 24 小時內發布的影片才算新影片
-                                if time_diff.days > 1:
-                                    print(f"影片 {title} 發布超過 24 小時，跳過通知")
-                                    self.last_video_ids[channel_id] = video_id
-                                    continue
-                                    
-                            except Exception as e:
-                                print(f"時間解析錯誤: {e}")
-                                # 如果時間解析失敗，還是繼續處理
-                            
-                            channel = self.bot.get_channel(int(discord_channel_id))
-                            if channel:
-                                # 解析發布時間
-                                try:
-                                    published_time = datetime.fromisoformat(published_at.replace('Z', '+00:00'))
-                                    time_str = published_time.strftime("%Y-%m-%d %H:%M:%S")
-                                except:
-                                    time_str = published_at
-
-                                # 創建類似 Twitch 的 embed
-                                embed = discord.Embed(
-                                    color=0xFF0000  # YouTube 紅色
-                                )
-                                
-                                # 設置標題和描述
-                                embed.add_field(
-                                    name="🔴 新影片發布！",
-                                    value=f"**頻道**: {channel_name}\n**標題**: {title}\n**發布時間**: {time_str}",
-                                    inline=False
-                                )
-                                
-                                # 添加縮圖
-                                embed.set_image(url=thumbnail_url)
-                                
-                                # 設置時間戳
-                                embed.timestamp = datetime.now()
                                 
-                                # 發送訊息
-                                await channel.send(
-                                    f"🔔 **{channel_name}** 發布了新影片！\n"
-                                    f"**{title}**\n"
-                                    f"https://www.youtube.com/watch?v={video_id}",
-                                    embed=embed
-                                )
-                                
-                                print(f"✅ 已發送 {channel_name} 的新影片通知: {title}")
-                                
-                            self.last_video_ids[channel_id] = video_id
-                    else:
-                        print(f"未找到頻道 {channel_id} 的影片資料")
+                        except Exception as e:
+                            print(f"時間解析錯誤: {e}")
+                            # 如果時間解析失敗，還是繼續處理
+                        
+                        self.last_video_ids[channel_id] = video_id
+                        # 交給通知分發：以影片 ID 去重，並行投遞到所有訂閱的伺服器
+                        delivered = await self.notifications.publish("video_published", video_id, {
+                            "video_id": video_id,
+                            "title": title,
+                            "published_at": published_at,
+                            "channel_name": channel_name,
+                            "thumbnail_url": thumbnail_url
+                        }, targets)
+                        if delivered is not None:
+                            print(f"✅ 已發送 {channel_name} 的新影片通知到 {delivered} 個頻道: {title}")
+                else:
+                    print(f"未找到頻道 {channel_id} 的影片資料")
             except HttpError as e:
                 print(f"API 錯誤 (頻道 {channel_id}): {e}")
             except Exception as e:
                 print(f"發生錯誤 (頻道 {channel_id}): {e}")
 
+    def render_video_published(self, data):
+        """產生新影片通知的內容，每部影片只產生一次"""
+        # 解析發布時間
+        try:
+            published_time = datetime.fromisoformat(data["published_at"].replace('Z', '+00:00'))
+            time_str = published_time.strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            time_str = data["published_at"]
+
+        # 創建類似 Twitch 的 embed
+        embed = discord.Embed(
+            color=0xFF0000  # YouTube 紅色
+        )
+        
+        # 設置標題和描述
+        embed.add_field(
+            name="🔴 新影片發布！",
+            value=f"**頻道**: {data['channel_name']}\n**標題**: {data['title']}\n**發布時間**: {time_str}",
+            inline=False
+        )
+        
+        # 添加縮圖
+        embed.set_image(url=data["thumbnail_url"])
+        
+        # 設置時間戳
+        embed.timestamp = datetime.now()
+        
+        content = (f"🔔 **{data['channel_name']}** 發布了新影片！\n"
+                   f"**{data['title']}**\n"
+                   f"https://www.youtube.com/watch?v={data['video_id']}")
+        return content, embed
+
     @check_new_videos.before_loop
     async def before_check(self):
         await self.bot.wait_until_ready()
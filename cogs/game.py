@@ -3,15 +3,120 @@ from discord.ext import commands
 import os
 import random
 import logging
-import requests
-import aiohttp
 import asyncio
-from datetime import datetime, timedelta
+import time
+from collections import deque
 import sqlite3
+from utils.http import get_session
+from utils.oauth import get_token_manager
+from utils.timer_wheel import TimerWheel
+from utils.users import get_user_resolver
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+REDDIT_SUBREDDITS = ["memes", "dankmemes", "wholesomememes", "meme"]
+REDDIT_LISTING_LIMIT = 100
+REDDIT_USER_AGENT = "DiscordBot/1.0 by YourUsername"
+MEMEAPI_BATCH_SIZE = 50
+MEME_BUFFER_SIZE = 100      # 每個來源最多預先保留的迷因數
+MEME_LOW_WATER = 15         # 緩衝低於此數量時於背景補充
+MEME_RECENT_WINDOW = 300    # 最近送出過的迷因數量，這段期間內不重複
+MEME_REFILL_COOLDOWN = 30   # 同一來源兩次補充之間的最短秒數
+GAME_IDLE_TIMEOUT = 300     # 猜數字遊戲閒置多久後自動結束（秒）
+MAX_GAME_SESSIONS = 10000   # 同時進行的遊戲上限
+
+class MemePool:
+    """每個來源各自預先抓取一批迷因，!meme 直接從緩衝取出
+
+    緩衝低於 low-water 時在背景補充；最近送出過的貼文 ID 以滑動視窗記錄，避免短時間內重複。
+    """
+
+    def __init__(self, fetchers):
+        self.fetchers = fetchers  # 來源名稱 -> 回傳迷因列表的 async 函式
+        self.buffers = {source: deque() for source in fetchers}
+        self.recent = deque()
+        self.recent_ids = set()
+        self.refill_tasks = {}
+        self.last_refill = {}
+
+    def start(self):
+        for source in self.fetchers:
+            self.schedule_refill(source)
+
+    def stop(self):
+        for task in self.refill_tasks.values():
+            task.cancel()
+        self.refill_tasks.clear()
+
+    def _remember(self, meme_id):
+        self.recent.append(meme_id)
+        self.recent_ids.add(meme_id)
+        if len(self.recent) > MEME_RECENT_WINDOW:
+            self.recent_ids.discard(self.recent.popleft())
+
+    def schedule_refill(self, source):
+        """啟動背景補充；已在補充中或仍在冷卻時間內則略過"""
+        task = self.refill_tasks.get(source)
+        if task and not task.done():
+            return task
+        if time.monotonic() - self.last_refill.get(source, float("-inf")) < MEME_REFILL_COOLDOWN:
+            return None
+        task = asyncio.create_task(self._refill(source))
+        self.refill_tasks[source] = task
+        return task
+
+    async def _refill(self, source):
+        self.last_refill[source] = time.monotonic()
+        try:
+            memes = await self.fetchers[source]()
+        except Exception as e:
+            logger.error(f"補充 {source} 迷因時發生錯誤: {e}")
+            return
+        buffer = self.buffers[source]
+        buffered_ids = {meme["id"] for meme in buffer}
+        random.shuffle(memes)
+        added = 0
+        for meme in memes:
+            if len(buffer) >= MEME_BUFFER_SIZE:
+                break
+            if meme["id"] in self.recent_ids or meme["id"] in buffered_ids:
+                continue
+            buffer.append(meme)
+            buffered_ids.add(meme["id"])
+            added += 1
+        logger.debug(f"{source} 迷因緩衝補充 {added} 則，目前 {len(buffer)} 則")
+
+    def available(self, source):
+        return len(self.buffers[source])
+
+    async def get(self, source):
+        """取出一則迷因；緩衝為空時等待一次補充，仍無可用迷因則回傳 None"""
+        buffer = self.buffers[source]
+        if not buffer:
+            task = self.schedule_refill(source)
+            if task:
+                await asyncio.shield(task)
+        meme = None
+        while buffer:
+            candidate = buffer.popleft()
+            if candidate["id"] not in self.recent_ids:
+                meme = candidate
+                break
+        if len(buffer) < MEME_LOW_WATER:
+            self.schedule_refill(source)
+        if meme:
+            self._remember(meme["id"])
+        return meme
+
+class GameSession:
+    """一場猜數字遊戲，以 (伺服器, 頻道, 玩家) 為鍵"""
+    __slots__ = ("target_number", "guesses_left")
+
+    def __init__(self, max_guesses):
+        self.target_number = random.randint(1, 100)
+        self.guesses_left = max_guesses
+
 class Game(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -25,14 +130,42 @@ class Game(commands.Cog):
             )
         """)
         self.db.commit()
-        self.active_game = False
-        self.target_number = None
         self.max_guesses = 5
-        self.current_player = None
-        self.guesses_left = 0
-        self.reddit_token = None
-        self.token_expires_at = None
-        self.current_command = None
+        self.sessions = {}
+        # 閒置的遊戲由共用的 timer wheel 過期，不需要每場遊戲一個計時任務
+        self.idle_timers = TimerWheel(self.expire_session)
+        self.reddit_oauth = get_token_manager(
+            "Reddit",
+            "https://www.reddit.com/api/v1/access_token",
+            lambda: (os.getenv("REDDIT_CLIENT_ID"), os.getenv("REDDIT_CLIENT_SECRET")),
+            basic_auth=True,
+            headers={"User-Agent": REDDIT_USER_AGENT}
+        )
+        self.meme_pool = MemePool({
+            "reddit": self._fetch_reddit_memes,
+            "memeapi": self._fetch_memeapi_memes
+        })
+
+    async def cog_load(self):
+        self.meme_pool.start()
+        self.idle_timers.start()
+
+    async def cog_unload(self):
+        self.meme_pool.stop()
+        self.idle_timers.stop()
+        self.reddit_oauth.close()
+
+    @staticmethod
+    def session_key(ctx):
+        return (ctx.guild.id if ctx.guild else 0, ctx.channel.id, ctx.author.id)
+
+    def expire_session(self, key):
+        if self.sessions.pop(key, None):
+            logger.debug(f"猜數字遊戲 {key} 閒置過久，已自動結束")
+
+    def end_session(self, key):
+        self.sessions.pop(key, None)
+        self.idle_timers.cancel(key)
 
     def get_score(self, user_id):
         self.cursor.execute("SELECT score FROM game_scores WHERE user_id = ?", (user_id,))
@@ -45,140 +178,74 @@ class Game(commands.Cog):
                            (user_id, username, score))
         self.db.commit()
 
-    async def get_reddit_token(self, max_attempts=3, attempt=1):
-        logger.debug(f"嘗試獲取 Reddit Token，次數: {attempt}/{max_attempts}")
-        if self.reddit_token and self.token_expires_at and datetime.now() < self.token_expires_at:
-            logger.debug("使用現有 Reddit Token")
-            return True
-        
-        client_id = os.getenv("REDDIT_CLIENT_ID")
-        client_secret = os.getenv("REDDIT_CLIENT_SECRET")
-        
-        if not client_id or not client_secret:
-            logger.error(f"Reddit Client ID 或 Client Secret 未設定: Client_ID={client_id}, Client_Secret={'*' * len(client_secret) if client_secret else 'None'}")
-            return False
-
-        url = "https://www.reddit.com/api/v1/access_token"
-        auth = aiohttp.BasicAuth(client_id, client_secret)
-        data = {"grant_type": "client_credentials"}
-
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, data=data, auth=auth) as response:
-                    response_text = await response.text()
-                    logger.debug(f"Reddit Token 請求狀態: {response.status}, URL: {url}")
-                    
-                    if response.status == 200:
-                        data = await response.json()
-                        self.reddit_token = data["access_token"]
-                        expires_in = data.get("expires_in", 3600)
-                        self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
-                        logger.info("✅ 成功獲取新 Reddit Token")
-                        return True
-                    else:
-                        logger.error(f"❌ Reddit Token 請求失敗: {response.status}, 回應: {response_text}")
-                        if attempt < max_attempts:
-                            logger.warning(f"第 {attempt} 次嘗試失敗，{max_attempts - attempt} 次機會剩餘")
-                            await asyncio.sleep(2)  # 增加等待時間
-                            return await self.get_reddit_token(max_attempts, attempt + 1)
-                        return False
-        except Exception as e:
-            logger.error(f"❌ 獲取 Reddit Token 時發生錯誤: {e}")
-            if attempt < max_attempts:
-                logger.warning(f"第 {attempt} 次嘗試失敗，{max_attempts - attempt} 次機會剩餘")
-                await asyncio.sleep(2)
-                return await self.get_reddit_token(max_attempts, attempt + 1)
-            return False
-
-    async def fetch_meme_from_source(self, source="reddit"):
-        """獲取迷因的核心方法 - 重命名避免衝突"""
-        if source == "reddit":
-            return await self._fetch_reddit_meme()
-        elif source == "memeapi":
-            return await self._fetch_memeapi_meme()
-        else:
-            logger.error(f"不支援的來源: {source}")
-            return None
-
-    async def _fetch_reddit_meme(self):
-        """從 Reddit 獲取迷因"""
-        success = await self.get_reddit_token()
-        if not success:
+    async def _fetch_reddit_memes(self):
+        """從多個 subreddit 同時抓取熱門列表，回傳所有圖片貼文"""
+        token = await self.reddit_oauth.get()
+        if not token:
             logger.error("Reddit Token 獲取失敗")
-            return None
+            return []
 
-        # 嘗試多個 subreddit
-        subreddits = ["memes", "dankmemes", "wholesomememes", "meme"]
-        
-        for subreddit in subreddits:
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "User-Agent": REDDIT_USER_AGENT
+        }
+        session = get_session()
+
+        async def fetch_subreddit(subreddit):
             url = f"https://oauth.reddit.com/r/{subreddit}/hot"
-            headers = {
-                "Authorization": f"Bearer {self.reddit_token}",
-                "User-Agent": "DiscordBot/1.0 by YourUsername"
-            }
-            
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, headers=headers) as response:
-                        logger.debug(f"Reddit API 回應狀態: {response.status}, URL: {url}")
-                        
-                        if response.status == 200:
-                            data = await response.json()
-                            posts = []
-                            
-                            # 過濾出圖片貼文
-                            for post in data.get("data", {}).get("children", []):
-                                post_data = post.get("data", {})
-                                # 檢查是否為圖片
-                                if (post_data.get("post_hint") == "image" or 
-                                    post_data.get("url", "").lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))):
-                                    posts.append(post_data)
-                            
-                            if posts:
-                                post = random.choice(posts)
-                                logger.info(f"Reddit 獲取迷因: {post['title']} - {post['url']}")
-                                return {
-                                    "title": post["title"],
-                                    "url": post["url"],
-                                    "source": f"r/{subreddit}"
-                                }
-                        else:
-                            logger.warning(f"Reddit API 錯誤: {response.status}")
-                            
+                async with session.get(url, headers=headers, params={"limit": REDDIT_LISTING_LIMIT}) as response:
+                    logger.debug(f"Reddit API 回應狀態: {response.status}, URL: {url}")
+                    if response.status == 401:
+                        self.reddit_oauth.invalidate(token)
+                    if response.status != 200:
+                        logger.warning(f"Reddit API 錯誤: {response.status}")
+                        return []
+                    data = await response.json()
             except Exception as e:
                 logger.error(f"Reddit API 錯誤 ({subreddit}): {e}")
-                continue
-        
-        logger.warning("所有 Reddit subreddit 都無法獲取迷因")
-        return None
+                return []
+
+            memes = []
+            # 過濾出圖片貼文
+            for post in data.get("data", {}).get("children", []):
+                post_data = post.get("data", {})
+                if (post_data.get("post_hint") == "image" or
+                    post_data.get("url", "").lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))):
+                    memes.append({
+                        "id": f"reddit:{post_data.get('id')}",
+                        "title": post_data["title"],
+                        "url": post_data["url"],
+                        "source": f"r/{subreddit}"
+                    })
+            return memes
+
+        results = await asyncio.gather(*(fetch_subreddit(subreddit) for subreddit in REDDIT_SUBREDDITS))
+        return [meme for memes in results for meme in memes]
+
+    async def _fetch_memeapi_memes(self):
+        """從 meme-api 一次取得多張迷因"""
+        url = f"https://meme-api.com/gimme/{MEMEAPI_BATCH_SIZE}"
 
-    async def _fetch_memeapi_meme(self):
-        """從 meme-api 獲取迷因"""
-        url = "https://meme-api.com/gimme"
-        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.debug(f"meme-api 回應: {data}")
-                        
-                        if data.get("success") and data.get("url"):
-                            logger.info(f"meme-api 獲取迷因: {data.get('title')} - {data['url']}")
-                            return {
-                                "title": data.get("title", "隨機迷因"),
-                                "url": data["url"],
-                                "source": "meme-api"
-                            }
-                        else:
-                            logger.warning("meme-api 回應無效")
-                            return None
-                    else:
-                        logger.error(f"meme-api 錯誤: {response.status}")
-                        return None
+            async with get_session().get(url) as response:
+                if response.status != 200:
+                    logger.error(f"meme-api 錯誤: {response.status}")
+                    return []
+                data = await response.json()
         except Exception as e:
             logger.error(f"meme-api.com 錯誤: {e}")
-            return None
+            return []
+
+        return [
+            {
+                "id": f"memeapi:{meme.get('postLink') or meme['url']}",
+                "title": meme.get("title", "隨機迷因"),
+                "url": meme["url"],
+                "source": f"meme-api (r/{meme['subreddit']})" if meme.get("subreddit") else "meme-api"
+            }
+            for meme in data.get("memes", []) if meme.get("url")
+        ]
 
     @commands.group(name="game", invoke_without_command=True)
     async def game(self, ctx):
@@ -186,48 +253,58 @@ class Game(commands.Cog):
 
     @game.command(name="start")
     async def start_game(self, ctx):
-        if self.active_game:
-            await ctx.send("❌ 遊戲已在進行中，請先結束當前遊戲。")
+        key = self.session_key(ctx)
+        if key in self.sessions:
+            await ctx.send("❌ 你在這個頻道已有進行中的遊戲，請先結束當前遊戲。")
             return
         
-        self.active_game = True
-        self.target_number = random.randint(1, 100)
-        self.current_player = ctx.author.id
-        self.guesses_left = self.max_guesses
-        await ctx.send(f"✅ 遊戲開始！請猜一個 1-100 之間的數字，你有 {self.guesses_left} 次機會。")
+        if len(self.sessions) >= MAX_GAME_SESSIONS:
+            await ctx.send("❌ 目前進行中的遊戲太多，請稍後再試。")
+            return
+        
+        session = GameSession(self.max_guesses)
+        self.sessions[key] = session
+        self.idle_timers.schedule(key, GAME_IDLE_TIMEOUT)
+        await ctx.send(f"✅ 遊戲開始！請猜一個 1-100 之間的數字，你有 {session.guesses_left} 次機會。")
 
     @game.command(name="guess")
     async def guess_number(self, ctx, number: int):
-        if not self.active_game or self.current_player != ctx.author.id:
-            await ctx.send("❌ 遊戲未開始或你不是當前玩家。")
+        key = self.session_key(ctx)
+        session = self.sessions.get(key)
+        if not session:
+            await ctx.send("❌ 你在這個頻道沒有進行中的遊戲，請先使用 !game start。")
             return
         
-        self.guesses_left -= 1
+        session.guesses_left -= 1
+        self.idle_timers.schedule(key, GAME_IDLE_TIMEOUT)
         
-        if number == self.target_number:
-            score = self.max_guesses - self.guesses_left + 1
+        if number == session.target_number:
+            score = self.max_guesses - session.guesses_left + 1
             current_score = self.get_score(ctx.author.id)
             new_score = max(current_score, score)
             self.save_score(ctx.author.id, new_score)
             await ctx.send(f"✅ 恭喜 {ctx.author.name} 猜對了！得分：{score}，最高分：{new_score}")
-            self.active_game = False
-        elif number < self.target_number:
-            await ctx.send(f"⬆️ 太小了！剩餘 {self.guesses_left} 次機會。")
+            self.end_session(key)
+            return
+        elif number < session.target_number:
+            await ctx.send(f"⬆️ 太小了！剩餘 {session.guesses_left} 次機會。")
         else:
-            await ctx.send(f"⬇️ 太大了！剩餘 {self.guesses_left} 次機會。")
+            await ctx.send(f"⬇️ 太大了！剩餘 {session.guesses_left} 次機會。")
         
-        if self.guesses_left <= 0:
-            await ctx.send(f"❌ 機會用盡，數字是 {self.target_number}。遊戲結束。")
-            self.active_game = False
+        if session.guesses_left <= 0:
+            await ctx.send(f"❌ 機會用盡，數字是 {session.target_number}。遊戲結束。")
+            self.end_session(key)
 
     @game.command(name="end")
     async def end_game(self, ctx):
-        if not self.active_game or self.current_player != ctx.author.id:
-            await ctx.send("❌ 無遊戲進行或你無權結束。")
+        key = self.session_key(ctx)
+        session = self.sessions.get(key)
+        if not session:
+            await ctx.send("❌ 你在這個頻道沒有進行中的遊戲。")
             return
         
-        await ctx.send(f"✅ 遊戲結束，數字是 {self.target_number}。")
-        self.active_game = False
+        await ctx.send(f"✅ 遊戲結束，數字是 {session.target_number}。")
+        self.end_session(key)
 
     @game.command(name="leaderboard")
     async def show_leaderboard(self, ctx):
@@ -237,13 +314,11 @@ class Game(commands.Cog):
             await ctx.send("❌ 目前無得分記錄。")
             return
         
+        names = await get_user_resolver(self.bot).resolve_many([user_id for user_id, _, _ in scores])
         embed = discord.Embed(title="🏆 得分排行", color=discord.Color.gold())
         for user_id, username, score in scores:
-            try:
-                user = await self.bot.fetch_user(user_id)
-                embed.add_field(name=user.name, value=f"{score} 分", inline=False)
-            except:
-                embed.add_field(name=f"未知用戶 ({username})", value=f"{score} 分", inline=False)
+            name = names.get(user_id) or f"未知用戶 ({username})"
+            embed.add_field(name=name, value=f"{score} 分", inline=False)
         
         await ctx.send(embed=embed)
 
@@ -259,14 +334,15 @@ class Game(commands.Cog):
                 await ctx.send("❌ 無效來源，請使用 'reddit' 或 'memeapi'。")
                 return
             
-            # 發送正在處理的訊息
-            processing_msg = await ctx.send("🔄 正在獲取迷因...")
-            
-            # 獲取迷因
-            meme = await self.fetch_meme_from_source(source)
+            # 緩衝中有迷因時直接回覆；緩衝為空才需要等待一次補充
+            if self.meme_pool.available(source):
+                meme = await self.meme_pool.get(source)
+            else:
+                async with ctx.typing():
+                    meme = await self.meme_pool.get(source)
             
             if meme and meme.get("url"):
-                logger.info(f"成功獲取迷因: {meme['title']} - {meme['url']}")
+                logger.info(f"送出迷因: {meme['title']} - {meme['url']}")
                 
                 embed = discord.Embed(
                     title=meme["title"][:256],  # Discord 標題限制
@@ -275,10 +351,10 @@ class Game(commands.Cog):
                 embed.set_image(url=meme["url"])
                 embed.set_footer(text=f"來源: {meme.get('source', source)}")
                 
-                await processing_msg.edit(content="", embed=embed)
+                await ctx.send(embed=embed)
             else:
                 logger.warning(f"無法獲取 {source} 迷因")
-                await processing_msg.edit(content=f"❌ 無法從 {source} 獲取迷因，請稍後再試。")
+                await ctx.send(f"❌ 無法從 {source} 獲取迷因，請稍後再試。")
                 
         except Exception as e:
             logger.error(f"執行 !meme 時發生錯誤: {e}")
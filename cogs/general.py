@@ -1,5 +1,7 @@
 import discord
 from discord.ext import commands
+from utils.outbound import get_outbound, PRIORITY_NAMES
+from utils.notifications import get_notification_hub
 
 class General(commands.Cog):
     def __init__(self, bot):
@@ -69,6 +71,7 @@ class General(commands.Cog):
             name="來自 WeatherCog",
             value="""
 !getweather [city] - 獲取指定城市的當前天氣（預設 Taipei）。
+!weatherchart <city> [days] - 顯示城市的溫度與降雨趨勢圖。
             """,
             inline=False
         )
@@ -110,6 +113,24 @@ class General(commands.Cog):
         embed.add_field(name="創建日期", value=guild.created_at.strftime("%Y/%m/%d %H:%M:%S"), inline=False)
         await ctx.send(embed=embed)
 
+    @commands.command(name="sendqueue")
+    @commands.has_permissions(administrator=True)
+    async def sendqueue(self, ctx):
+        """顯示主動發送訊息的佇列狀態與等待時間（僅限管理員）"""
+        outbound = get_outbound()
+        embed = discord.Embed(title="📤 發送佇列", color=discord.Color.blue())
+        embed.add_field(name="排隊中", value=outbound.queued(), inline=True)
+        embed.add_field(name="已發送", value=outbound.sent, inline=True)
+        embed.add_field(name="合併的編輯", value=outbound.coalesced, inline=True)
+        embed.add_field(name="失敗", value=outbound.failed, inline=True)
+        for priority, name in PRIORITY_NAMES.items():
+            stats = outbound.wait_percentiles(priority)
+            value = f"p50 {stats[1]:.0f} ms / p99 {stats[2]:.0f} ms / 最大 {stats[3]:.0f} ms（{stats[0]} 則）" if stats else "尚無資料"
+            embed.add_field(name=f"{name}等待時間", value=value, inline=False)
+        retrying, abandoned = get_notification_hub(self.bot).pending_counts()
+        embed.add_field(name="通知 outbox", value=f"等待重試 {retrying} 則 / 已放棄 {abandoned} 則", inline=False)
+        await ctx.send(embed=embed)
+
 # 新版 discord.py 的 setup 函數
 async def setup(bot):
     await bot.add_cog(General(bot))
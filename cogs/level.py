@@ -5,6 +5,8 @@ import random
 import math
 from datetime import datetime, timedelta
 import sqlite3
+from utils.users import get_user_resolver
+from utils.spam import get_spam_detector
 
 class Level(commands.Cog):
     def __init__(self, bot):
@@ -34,6 +36,7 @@ class Level(commands.Cog):
         """)
         self.db.commit()
         self.cooldowns = {}  # 防止刷經驗
+        self.spam = get_spam_detector()
 
     def get_user_data(self, user_id):
         """獲取使用者資料"""
@@ -116,6 +119,10 @@ class Level(commands.Cog):
         if message.channel.id in config["blacklist_channels"]:
             return
         
+        # 洗版或重複訊息的使用者在標記期間不獲得經驗值
+        if self.spam.observe(message) or self.spam.is_flagged(message.guild.id, message.author.id):
+            return
+
         # 檢查冷卻時間
         user_id = message.author.id
         now = datetime.now()
@@ -231,15 +238,14 @@ class Level(commands.Cog):
         if page < 1:
             page = 1
         
-        # 從資料庫獲取所有使用者資料
-        self.cursor.execute("SELECT user_id, xp, level, total_messages FROM level_data ORDER BY xp DESC")
-        sorted_users = self.cursor.fetchall()
-        
-        # 分頁
+        # 只讀取這一頁的資料
         per_page = 10
         start = (page - 1) * per_page
-        end = start + per_page
-        page_users = sorted_users[start:end]
+        self.cursor.execute("SELECT COUNT(*) FROM level_data")
+        total_users = self.cursor.fetchone()[0]
+        self.cursor.execute("SELECT user_id, xp, level, total_messages FROM level_data ORDER BY xp DESC LIMIT ? OFFSET ?",
+                            (per_page, start))
+        page_users = self.cursor.fetchall()
         
         if not page_users:
             await ctx.send("❌ 這一頁沒有資料")
@@ -250,20 +256,17 @@ class Level(commands.Cog):
             color=discord.Color.gold()
         )
         
+        names = await get_user_resolver(self.bot).resolve_many([row[0] for row in page_users])
         description = ""
         for i, (user_id, xp, level, total_messages) in enumerate(page_users, start + 1):
-            try:
-                user = self.bot.get_user(user_id)
-                if user:
-                    # 排名圖示
-                    rank_icon = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "🔹"
-                    description += f"{rank_icon} **#{i}** {user.display_name}\n"
-                    description += f"   等級 {level} | {xp:,} XP\n\n"
-            except:
-                continue
+            # 排名圖示
+            rank_icon = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else "🔹"
+            name = names.get(user_id, f"未知使用者 ({user_id})")
+            description += f"{rank_icon} **#{i}** {name}\n"
+            description += f"   等級 {level} | {xp:,} XP\n\n"
         
         embed.description = description
-        embed.set_footer(text=f"第 {page} 頁 | 總共 {len(sorted_users)} 位使用者")
+        embed.set_footer(text=f"第 {page} 頁 | 總共 {total_users} 位使用者")
         
         await ctx.send(embed=embed)
 
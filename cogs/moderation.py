@@ -1,10 +1,334 @@
 import discord
 from discord.ext import commands
 from discord.ui import Button, View
+import io
+import re
+import time
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
+from utils.ratelimit import RateLimiter
+from utils.db_writer import get_db_writer
+from utils.export import format_csv, GzipPartWriter
+from utils.outbound import get_outbound, PRIORITY_MODERATION
+from utils.automod import AutomodEngine
+from utils.spam import get_spam_detector, FLOOD_MESSAGES, FLOOD_WINDOW, DUPLICATE_LIMIT, DUPLICATE_WINDOW
+
+CLEAR_MAX = 10000               # 單次最多刪除的訊息數
+CLEAR_SCAN_LIMIT = 50000        # 使用篩選條件時最多掃描的訊息數
+CLEAR_PROGRESS_INTERVAL = 3     # 進度訊息更新間隔（秒）
+# 批次刪除只接受 14 天內的訊息，保留一點餘裕避免邊界上的訊息被拒絕
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+SINGLE_DELETE_RATE = (1, 1.2)   # 舊訊息逐則刪除：每 1.2 秒 1 則
+MASSROLE_RATE = (8, 10)         # 大量身份組變更：每個伺服器每 10 秒最多 8 位成員
+MASSROLE_CHECKPOINT = 25        # 每處理多少位成員寫入一次進度
+MODLOG_PAGE_SIZE = 10           # !modlog 每頁顯示的紀錄數
+MODLOG_EXPORT_CHUNK = 1000      # 匯出時每次查詢的筆數
+MODLOG_FIELDS = ["id", "created_at", "action", "moderator_id", "target_id", "reason", "details"]
+ACTION_NAMES = {
+    "ban": "🔨 封禁", "kick": "👢 踢出", "clear": "🧹 清除訊息", "assign_role": "🏷️ 分配身份組",
+    "massrole_add": "👥 大量給予身份組", "massrole_remove": "👥 大量移除身份組",
+    "automod_delete": "🛡️ 自動刪除", "automod_timeout": "🔇 自動禁言"
+}
+SPAM_REASONS = {
+    "flood": f"{FLOOD_WINDOW} 秒內發送超過 {FLOOD_MESSAGES - 1} 則訊息",
+    "duplicate": f"{DUPLICATE_WINDOW} 秒內重複發送相同內容 {DUPLICATE_LIMIT} 次"
+}
+
+class HistoryBound(commands.Converter):
+    """訊息 ID、訊息連結或日期（YYYY-MM-DD / YYYY-MM-DD HH:MM，UTC）"""
+
+    async def convert(self, ctx, argument):
+        try:
+            return discord.Object(id=int(argument.rstrip("/").rsplit("/", 1)[-1]))
+        except ValueError:
+            pass
+        for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(argument, fmt).replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+        raise commands.BadArgument(f"無法解析時間或訊息 ID：{argument}")
+
+class ClearFlags(commands.FlagConverter, delimiter=":", prefix=""):
+    user: Optional[Union[discord.Member, discord.User]] = None
+    contains: Optional[str] = None
+    bots: bool = False
+    before: Optional[HistoryBound] = None
+    after: Optional[HistoryBound] = None
+
+def parse_member_filter(text, guild, db):
+    """把篩選條件轉成判斷函式：all、humans、bots、level>=N、hasrole:@身份組"""
+    text = text.strip().lower()
+    if text in ("all", "全部"):
+        return lambda member: True
+    if text in ("humans", "成員"):
+        return lambda member: not member.bot
+    if text == "bots":
+        return lambda member: member.bot
+    match = re.fullmatch(r"level\s*(>=|>)\s*(\d+)", text)
+    if match:
+        level = int(match.group(2)) + (1 if match.group(1) == ">" else 0)
+        # 一次查出所有符合等級的使用者，之後逐一比對只需查 set
+        user_ids = {row[0] for row in db.execute("SELECT user_id FROM level_data WHERE level >= ?", (level,))}
+        return lambda member: member.id in user_ids
+    match = re.fullmatch(r"hasrole:\s*(?:<@&)?(\d+)>?", text)
+    if match:
+        role = guild.get_role(int(match.group(1)))
+        if role:
+            return lambda member: role in member.roles
+    return None
 
 class ModerationCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.active_clears = set()
+        self.db = sqlite3.connect("bot_data.db", check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS massrole_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER,
+                channel_id INTEGER,
+                role_id INTEGER,
+                action TEXT,
+                member_filter TEXT,
+                status TEXT DEFAULT 'running',
+                last_member_id INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                processed INTEGER DEFAULT 0,
+                changed INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                created_by INTEGER,
+                created_at TEXT,
+                updated_at TEXT
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_massrole_jobs_status ON massrole_jobs (status)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS automod_terms (
+                guild_id INTEGER,
+                term TEXT,
+                PRIMARY KEY (guild_id, term)
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS automod_config (
+                guild_id INTEGER PRIMARY KEY,
+                enabled INTEGER DEFAULT 0,
+                block_links INTEGER DEFAULT 0,
+                block_invites INTEGER DEFAULT 1,
+                caps_limit INTEGER DEFAULT 3,
+                mention_limit INTEGER DEFAULT 10,
+                spam_timeout INTEGER DEFAULT 5
+            )
+        """)
+        if "spam_timeout" not in {row[1] for row in self.db.execute("PRAGMA table_info(automod_config)")}:
+            self.db.execute("ALTER TABLE automod_config ADD COLUMN spam_timeout INTEGER DEFAULT 5")
+        # 審核紀錄只能新增，觸發器拒絕任何修改或刪除
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS mod_audit_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                moderator_id INTEGER,
+                target_id INTEGER,
+                reason TEXT,
+                details TEXT,
+                created_at TEXT NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_mod_audit_guild_target ON mod_audit_log (guild_id, target_id, id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_mod_audit_guild_time ON mod_audit_log (guild_id, created_at)")
+        for event in ("UPDATE", "DELETE"):
+            self.db.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS mod_audit_log_no_{event.lower()} BEFORE {event} ON mod_audit_log
+                BEGIN SELECT RAISE(ABORT, 'mod_audit_log is append-only'); END
+            """)
+        self.db.commit()
+        self.writer = get_db_writer()
+        self.spam = get_spam_detector()
+        self.automod = AutomodEngine()
+        self.load_automod()
+        self.massrole_tasks = {}
+        self.massrole_limiters = {}
+
+    async def cog_load(self):
+        self.bot.add_dynamic_items(RoleButton, RoleSelect)
+        self.resume_task = asyncio.create_task(self.resume_massrole_jobs())
+
+    async def cog_unload(self):
+        self.bot.remove_dynamic_items(RoleButton, RoleSelect)
+        self.resume_task.cancel()
+        tasks = list(self.massrole_tasks.values())
+        for task in tasks:
+            task.cancel()
+        # 等待工作寫入檢查點後再關閉資料庫
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.db.close()
+
+    def log_action(self, guild_id, action, moderator_id=None, target_id=None, reason=None, details=None):
+        """寫入審核紀錄；只排入批次寫入佇列，不會等待資料庫"""
+        self.writer.submit("""
+            INSERT INTO mod_audit_log (guild_id, action, moderator_id, target_id, reason, details, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (guild_id, action, moderator_id, target_id, reason, details, datetime.now().isoformat(timespec="seconds")))
+
+    def load_automod(self):
+        """啟動時一次載入所有伺服器的自動審核設定與禁用詞"""
+        for guild_id, enabled, block_links, block_invites, caps_limit, mention_limit, spam_timeout in self.db.execute(
+                "SELECT guild_id, enabled, block_links, block_invites, caps_limit, mention_limit, spam_timeout FROM automod_config"):
+            self.automod.set_config(guild_id, {
+                "enabled": bool(enabled),
+                "block_links": bool(block_links),
+                "block_invites": bool(block_invites),
+                "caps_limit": caps_limit,
+                "mention_limit": mention_limit,
+                "spam_timeout": spam_timeout
+            })
+        terms = {}
+        for guild_id, term in self.db.execute("SELECT guild_id, term FROM automod_terms"):
+            terms.setdefault(guild_id, []).append(term)
+        for guild_id, guild_terms in terms.items():
+            self.automod.set_terms(guild_id, guild_terms)
+
+    def save_automod_config(self, guild_id, config):
+        self.db.execute("""
+            INSERT OR REPLACE INTO automod_config (guild_id, enabled, block_links, block_invites, caps_limit, mention_limit, spam_timeout)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (guild_id, 1 if config["enabled"] else 0, 1 if config["block_links"] else 0,
+              1 if config["block_invites"] else 0, config["caps_limit"], config["mention_limit"], config["spam_timeout"]))
+        self.db.commit()
+        self.automod.set_config(guild_id, config)
+
+    def reload_automod_terms(self, guild_id):
+        terms = [row[0] for row in self.db.execute("SELECT term FROM automod_terms WHERE guild_id = ?", (guild_id,))]
+        self.automod.set_terms(guild_id, terms)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """自動審核：違規訊息直接刪除並提示，洗版或重複訊息另外禁言"""
+        if message.author.bot or not message.guild:
+            return
+        # 洗版偵測與等級系統共用，無論是否啟用自動審核都要記錄
+        spam_verdict = self.spam.observe(message)
+        mention_count = len(message.raw_mentions) + len(message.raw_role_mentions)
+        reason = self.automod.check(message.guild.id, message.author.id, message.content, mention_count)
+        config = self.automod.get_config(message.guild.id)
+        if reason is None and spam_verdict and config["enabled"]:
+            reason = SPAM_REASONS[spam_verdict]
+        if reason is None:
+            return
+        # 有管理訊息權限的成員不受限制（只在違規時才檢查權限）
+        if message.channel.permissions_for(message.author).manage_messages:
+            return
+        try:
+            await message.delete()
+            get_outbound().send(message.channel, PRIORITY_MODERATION,
+                                content=f"⚠️ {message.author.mention} 的訊息已被刪除：{reason}", delete_after=5)
+            self.log_action(message.guild.id, "automod_delete", self.bot.user.id, message.author.id, reason,
+                            f"#{message.channel.name}")
+        except discord.HTTPException as e:
+            print(f"⚠️ 自動審核無法刪除訊息：{e}")
+        if spam_verdict and config["spam_timeout"] and isinstance(message.author, discord.Member):
+            try:
+                await message.author.timeout(timedelta(minutes=config["spam_timeout"]), reason=f"自動審核：{reason}")
+                self.log_action(message.guild.id, "automod_timeout", self.bot.user.id, message.author.id, reason,
+                                f"{config['spam_timeout']} 分鐘")
+            except discord.HTTPException as e:
+                print(f"⚠️ 自動審核無法禁言成員：{e}")
+
+    async def resume_massrole_jobs(self):
+        """機器人重啟後從上次的進度繼續執行未完成的工作"""
+        await self.bot.wait_until_ready()
+        for (job_id,) in self.db.execute("SELECT job_id FROM massrole_jobs WHERE status = 'running'").fetchall():
+            print(f"🔄 繼續執行大量身份組工作 #{job_id}")
+            self.start_massrole_job(job_id)
+
+    def get_massrole_job(self, job_id):
+        row = self.db.execute("""
+            SELECT job_id, guild_id, channel_id, role_id, action, member_filter, status, last_member_id,
+                   total, processed, changed, failed, created_by, created_at, updated_at
+            FROM massrole_jobs WHERE job_id = ?
+        """, (job_id,)).fetchone()
+        if not row:
+            return None
+        keys = ("job_id", "guild_id", "channel_id", "role_id", "action", "member_filter", "status", "last_member_id",
+                "total", "processed", "changed", "failed", "created_by", "created_at", "updated_at")
+        return dict(zip(keys, row))
+
+    def save_massrole_progress(self, job, status=None):
+        if status:
+            job["status"] = status
+        job["updated_at"] = datetime.now().isoformat()
+        self.db.execute("""
+            UPDATE massrole_jobs SET status = ?, last_member_id = ?, total = ?, processed = ?, changed = ?, failed = ?, updated_at = ?
+            WHERE job_id = ?
+        """, (job["status"], job["last_member_id"], job["total"], job["processed"], job["changed"], job["failed"],
+              job["updated_at"], job["job_id"]))
+        self.db.commit()
+
+    def start_massrole_job(self, job_id):
+        task = asyncio.create_task(self.run_massrole_job(job_id))
+        self.massrole_tasks[job_id] = task
+        task.add_done_callback(lambda _: self.massrole_tasks.pop(job_id, None))
+
+    async def run_massrole_job(self, job_id):
+        """依成員 ID 順序處理，定期記錄最後處理的成員 ID 作為檢查點"""
+        job = self.get_massrole_job(job_id)
+        if job is None:
+            print(f"⚠️ 找不到大量身份組工作 #{job_id}")
+            return
+        guild = self.bot.get_guild(job["guild_id"])
+        role = guild.get_role(job["role_id"]) if guild else None
+        member_filter = parse_member_filter(job["member_filter"], guild, self.db) if guild else None
+        if not role or not member_filter:
+            self.save_massrole_progress(job, "failed")
+            return
+        
+        adding = job["action"] == "add"
+        limiter = self.massrole_limiters.setdefault(guild.id, RateLimiter(*MASSROLE_RATE))
+        members = sorted((m for m in guild.members if m.id > job["last_member_id"] and member_filter(m)),
+                         key=lambda m: m.id)
+        job["total"] = job["processed"] + len(members)
+        reason = f"大量身份組工作 #{job_id}"
+        
+        try:
+            for member in members:
+                if (role in member.roles) != adding:
+                    await limiter.acquire()
+                    try:
+                        if adding:
+                            await member.add_roles(role, reason=reason)
+                        else:
+                            await member.remove_roles(role, reason=reason)
+                        job["changed"] += 1
+                    except discord.NotFound:
+                        pass  # 成員已離開
+                    except discord.HTTPException:
+                        job["failed"] += 1
+                job["processed"] += 1
+                job["last_member_id"] = member.id
+                if job["processed"] % MASSROLE_CHECKPOINT == 0:
+                    self.save_massrole_progress(job)
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            # 卸載或重啟時保留 running 狀態，下次啟動會從檢查點繼續
+            self.save_massrole_progress(job)
+            raise
+        except Exception as e:
+            # 非預期的錯誤：保存進度並標記失敗，避免工作永遠停在 running
+            print(f"⚠️ 大量身份組工作 #{job_id} 發生錯誤：{e}")
+            self.save_massrole_progress(job, "failed")
+            return
+        
+        self.save_massrole_progress(job, "done")
+        channel = guild.get_channel(job["channel_id"])
+        if channel:
+            verb = "給予" if adding else "移除"
+            get_outbound().send(channel, PRIORITY_MODERATION,
+                                content=f"✅ 大量身份組工作 #{job_id} 完成：已為 {job['changed']} 位成員{verb} {role.name}"
+                                        + (f"（{job['failed']} 位失敗）" if job["failed"] else ""))
 
     # 檢查是否為管理員的裝飾器
     def is_admin():
@@ -51,6 +375,7 @@ class ModerationCog(commands.Cog):
         try:
             await member.add_roles(role)
             await ctx.send(f"✅ 已為 {member.name} 分配 {role_name} 身份組！")
+            self.log_action(ctx.guild.id, "assign_role", ctx.author.id, member.id, details=role.name)
         except discord.Forbidden:
             await ctx.send("❌ 機器人沒有足夠的權限分配此身份組！")
 
@@ -62,9 +387,26 @@ class ModerationCog(commands.Cog):
         if not role:
             await ctx.send(f"❌ 身份組 {role_name} 不存在！")
             return
-        view = RoleAssignView(role)
+        view = View(timeout=None)
+        view.add_item(RoleButton(role.id))
         await ctx.send(f"點擊以下按鈕獲取 {role_name} 身份組：", view=view)
 
+    @commands.command(name="roleselect")
+    @commands.has_permissions(administrator=True)  # 需要管理員權限
+    async def role_select(self, ctx, roles: commands.Greedy[discord.Role]):
+        """創建可多選身份組的選單（僅限管理員）"""
+        if not roles:
+            await ctx.send("❌ 請至少指定一個身份組！")
+            return
+        if len(roles) > 25:
+            await ctx.send("❌ 選單最多只能有 25 個身份組！")
+            return
+        
+        options = [discord.SelectOption(label=role.name, value=str(role.id)) for role in dict.fromkeys(roles)]
+        view = View(timeout=None)
+        view.add_item(RoleSelect(ctx.guild.id, options))
+        await ctx.send("選擇你想要的身份組（取消選取即可移除）：", view=view)
+
     @commands.command(name="ban")
     @commands.has_permissions(administrator=True)  # 需要管理員權限
     async def ban(self, ctx, member: discord.Member, *, reason=None):
@@ -75,6 +417,7 @@ class ModerationCog(commands.Cog):
         try:
             await member.ban(reason=reason)
             await ctx.send(f"✅ 已封禁 {member.name}，原因: {reason}")
+            self.log_action(ctx.guild.id, "ban", ctx.author.id, member.id, reason)
         except discord.Forbidden:
             await ctx.send("❌ 機器人沒有足夠的權限封禁此成員！")
 
@@ -88,30 +431,424 @@ class ModerationCog(commands.Cog):
         try:
             await member.kick(reason=reason)
             await ctx.send(f"✅ 已踢出 {member.name}，原因: {reason}")
+            self.log_action(ctx.guild.id, "kick", ctx.author.id, member.id, reason)
         except discord.Forbidden:
             await ctx.send("❌ 機器人沒有足夠的權限踢出此成員！")
 
     @commands.command(name="clear")
     @commands.has_permissions(administrator=True)  # 需要管理員權限
-    async def clear(self, ctx, amount: int):
-        """刪除指定數量的訊息（僅限管理員）"""
-        if amount > 100:
-            await ctx.send("❌ 清除數量不能超過 100 條！")
+    async def clear(self, ctx, amount: commands.Range[int, 1, CLEAR_MAX], *, flags: ClearFlags):
+        """刪除指定數量的訊息，可依 user: contains: bots: before: after: 篩選（僅限管理員）"""
+        if ctx.channel.id in self.active_clears:
+            await ctx.send("❌ 此頻道已有清除作業正在進行！")
             return
+        
+        self.active_clears.add(ctx.channel.id)
         try:
-            await ctx.channel.purge(limit=amount + 1)  # +1 包含命令本身
-            await ctx.send(f"✅ 已清除 {amount} 條訊息。")
+            stats = await self.run_clear(ctx, amount, flags)
+            filters = " ".join(f"{name}:{getattr(value, 'id', value)}" for name, value in flags if value)
+            self.log_action(ctx.guild.id, "clear", ctx.author.id, flags.user.id if flags.user else None,
+                            details=f"#{ctx.channel.name} 刪除 {stats['bulk'] + stats['single']} 則" + (f"（{filters}）" if filters else ""))
         except discord.Forbidden:
             await ctx.send("❌ 機器人沒有足夠的權限刪除訊息！")
+        finally:
+            self.active_clears.discard(ctx.channel.id)
+
+    async def run_clear(self, ctx, amount, flags):
+        """串流讀取歷史訊息：14 天內的每 100 則批次刪除，較舊的交給限速的逐則刪除佇列"""
+        channel = ctx.channel
+        try:
+            await ctx.message.delete()
+        except discord.HTTPException:
+            pass
+        
+        progress = await channel.send(f"🧹 正在清除訊息… 0 / {amount}")
+        has_filter = flags.user or flags.contains or flags.bots
+        contains = flags.contains.lower() if flags.contains else None
+        
+        def matches(message):
+            if message.id == progress.id:
+                return False
+            if flags.user and message.author.id != flags.user.id:
+                return False
+            if flags.bots and not message.author.bot:
+                return False
+            if contains and contains not in message.content.lower():
+                return False
+            return True
+        
+        stats = {"bulk": 0, "single": 0, "failed": 0, "scanned": 0}
+        old_queue = asyncio.Queue()
+        limiter = RateLimiter(*SINGLE_DELETE_RATE)
+        
+        async def delete_old_messages():
+            while (message := await old_queue.get()) is not None:
+                await limiter.acquire()
+                try:
+                    await message.delete()
+                    stats["single"] += 1
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException:
+                    stats["failed"] += 1
+        
+        old_lane = asyncio.create_task(delete_old_messages())
+        last_update = time.monotonic()
+        
+        async def update_progress(final=False):
+            deleted = stats["bulk"] + stats["single"]
+            text = f"🧹 正在清除訊息… {deleted} / {amount}"
+            if old_queue.qsize():
+                text += f"（{old_queue.qsize()} 則超過 14 天的訊息逐則刪除中）"
+            if final:
+                text = f"✅ 已清除 {deleted} 條訊息。"
+                if stats["failed"]:
+                    text += f"（{stats['failed']} 條刪除失敗）"
+            # 進度更新交給發送佇列，尚未送出的舊進度會被新內容取代
+            update = get_outbound().edit(progress, PRIORITY_MODERATION, content=text, delete_after=10 if final else None)
+            if final:
+                try:
+                    await update
+                except discord.HTTPException:
+                    pass
+        
+        matched = 0
+        chunk = []
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        scan_limit = CLEAR_SCAN_LIMIT if has_filter else amount + 1
+        try:
+            async for message in channel.history(limit=scan_limit, before=flags.before, after=flags.after,
+                                                  oldest_first=False):
+                stats["scanned"] += 1
+                if not matches(message):
+                    continue
+                matched += 1
+                if message.created_at < cutoff:
+                    old_queue.put_nowait(message)
+                else:
+                    chunk.append(message)
+                    if len(chunk) == 100:
+                        await channel.delete_messages(chunk)
+                        stats["bulk"] += len(chunk)
+                        chunk = []
+                if time.monotonic() - last_update >= CLEAR_PROGRESS_INTERVAL:
+                    last_update = time.monotonic()
+                    await update_progress()
+                if matched >= amount:
+                    break
+            if chunk:
+                await channel.delete_messages(chunk)
+                stats["bulk"] += len(chunk)
+            
+            # 等待舊訊息佇列清空，期間持續更新進度
+            old_queue.put_nowait(None)
+            while not old_lane.done():
+                await asyncio.wait({old_lane}, timeout=CLEAR_PROGRESS_INTERVAL)
+                if not old_lane.done():
+                    await update_progress()
+        finally:
+            if not old_lane.done():
+                old_lane.cancel()
+        
+        await update_progress(final=True)
+        return stats
+
+    @commands.group(name="massrole", invoke_without_command=True)
+    @commands.has_permissions(administrator=True)  # 需要管理員權限
+    async def massrole(self, ctx):
+        """大量給予/移除身份組（僅限管理員）"""
+        embed = discord.Embed(title="👥 大量身份組", color=discord.Color.blue())
+        embed.add_field(name="可用指令", value="""
+        `!massrole add <身份組> <篩選>` - 為符合條件的成員給予身份組
+        `!massrole remove <身份組> <篩選>` - 移除符合條件成員的身份組
+        `!massrole status [工作 ID]` - 查看工作進度
+        `!massrole cancel <工作 ID>` - 取消工作
+        篩選：`all`、`humans`、`bots`、`level>=10`、`hasrole:@身份組`
+        """, inline=False)
+        await ctx.send(embed=embed)
+
+    @massrole.command(name="add")
+    @commands.has_permissions(administrator=True)
+    async def massrole_add(self, ctx, role: discord.Role, *, member_filter: str):
+        await self.create_massrole_job(ctx, "add", role, member_filter)
+
+    @massrole.command(name="remove")
+    @commands.has_permissions(administrator=True)
+    async def massrole_remove(self, ctx, role: discord.Role, *, member_filter: str):
+        await self.create_massrole_job(ctx, "remove", role, member_filter)
+
+    async def create_massrole_job(self, ctx, action, role, member_filter):
+        if role >= ctx.guild.me.top_role or role.managed:
+            await ctx.send("❌ 機器人無法管理此身份組（身份組順序高於機器人或為整合身份組）！")
+            return
+        if parse_member_filter(member_filter, ctx.guild, self.db) is None:
+            await ctx.send("❌ 無效的篩選條件！可用：`all`、`humans`、`bots`、`level>=10`、`hasrole:@身份組`")
+            return
+        
+        now = datetime.now().isoformat()
+        cursor = self.db.execute("""
+            INSERT INTO massrole_jobs (guild_id, channel_id, role_id, action, member_filter, created_by, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (ctx.guild.id, ctx.channel.id, role.id, action, member_filter, ctx.author.id, now, now))
+        self.db.commit()
+        job_id = cursor.lastrowid
+        self.start_massrole_job(job_id)
+        self.log_action(ctx.guild.id, f"massrole_{action}", ctx.author.id, details=f"#{job_id} {role.name} `{member_filter}`")
+        verb = "給予" if action == "add" else "移除"
+        await ctx.send(f"✅ 已建立大量身份組工作 #{job_id}：為符合 `{member_filter}` 的成員{verb} {role.name}，"
+                       f"使用 `!massrole status {job_id}` 查看進度")
+
+    @massrole.command(name="status")
+    @commands.has_permissions(administrator=True)
+    async def massrole_status(self, ctx, job_id: int = None):
+        if job_id is None:
+            rows = self.db.execute("""
+                SELECT job_id FROM massrole_jobs WHERE guild_id = ? ORDER BY job_id DESC LIMIT 5
+            """, (ctx.guild.id,)).fetchall()
+            if not rows:
+                await ctx.send("❌ 目前沒有大量身份組工作。")
+                return
+            jobs = [self.get_massrole_job(row[0]) for row in rows]
+        else:
+            job = self.get_massrole_job(job_id)
+            if not job or job["guild_id"] != ctx.guild.id:
+                await ctx.send("❌ 找不到該工作！")
+                return
+            jobs = [job]
+        
+        status_text = {"running": "🔄 執行中", "done": "✅ 完成", "cancelled": "⏹️ 已取消", "failed": "❌ 失敗"}
+        embed = discord.Embed(title="👥 大量身份組工作", color=discord.Color.blue())
+        for job in jobs:
+            role = ctx.guild.get_role(job["role_id"])
+            progress = f"{job['processed']} / {job['total']}" if job["total"] else f"{job['processed']}"
+            embed.add_field(
+                name=f"#{job['job_id']} {'給予' if job['action'] == 'add' else '移除'} {role.name if role else job['role_id']}",
+                value=f"{status_text.get(job['status'], job['status'])} | 篩選: `{job['member_filter']}`\n"
+                      f"進度: {progress} | 變更: {job['changed']} | 失敗: {job['failed']}",
+                inline=False
+            )
+        limiter = self.massrole_limiters.get(ctx.guild.id)
+        embed.set_footer(text=f"執行中的工作：{len(self.massrole_tasks)}" + (f" | 可用配額：{limiter.tokens:.1f}" if limiter else ""))
+        await ctx.send(embed=embed)
+
+    @massrole.command(name="cancel")
+    @commands.has_permissions(administrator=True)
+    async def massrole_cancel(self, ctx, job_id: int):
+        job = self.get_massrole_job(job_id)
+        if not job or job["guild_id"] != ctx.guild.id or job["status"] != "running":
+            await ctx.send("❌ 找不到執行中的該工作！")
+            return
+        
+        task = self.massrole_tasks.get(job_id)
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        job = self.get_massrole_job(job_id)
+        self.save_massrole_progress(job, "cancelled")
+        await ctx.send(f"⏹️ 已取消工作 #{job_id}（已處理 {job['processed']} 位成員）")
+
+    @commands.group(name="automod", invoke_without_command=True)
+    @commands.has_permissions(administrator=True)  # 需要管理員權限
+    async def automod_group(self, ctx):
+        """自動審核設定（僅限管理員）"""
+        config = self.automod.get_config(ctx.guild.id)
+        embed = discord.Embed(title="🛡️ 自動審核設定", color=discord.Color.blue())
+        embed.add_field(name="系統狀態", value="✅ 啟用" if config["enabled"] else "❌ 停用", inline=True)
+        embed.add_field(name="禁用詞", value=f"{len(self.automod.get_terms(ctx.guild.id))} 個", inline=True)
+        embed.add_field(name="封鎖邀請", value="✅" if config["block_invites"] else "❌", inline=True)
+        embed.add_field(name="封鎖連結", value="✅" if config["block_links"] else "❌", inline=True)
+        embed.add_field(name="全大寫上限", value=config["caps_limit"] or "停用", inline=True)
+        embed.add_field(name="提及上限", value=config["mention_limit"] or "停用", inline=True)
+        embed.add_field(name="洗版禁言", value=f"{config['spam_timeout']} 分鐘" if config["spam_timeout"] else "只刪除訊息", inline=True)
+        latency = self.automod.latency_percentiles()
+        if latency:
+            embed.add_field(name="檢查耗時", value=f"p50 {latency[0]:.3f} ms / p99 {latency[1]:.3f} ms / 最大 {latency[2]:.3f} ms", inline=False)
+        embed.add_field(name="可用指令", value="""
+        `!automod toggle` - 開關自動審核
+        `!automod add <詞>` / `!automod remove <詞>` - 新增/移除禁用詞
+        `!automod list` - 列出禁用詞
+        `!automod invites <on/off>` / `!automod links <on/off>` - 封鎖邀請/連結
+        `!automod caps <次數>` / `!automod mentions <人數>` - 設定上限（0 為停用）
+        `!automod spam <分鐘>` - 洗版或重複訊息的禁言時間（0 為只刪除訊息）
+        """, inline=False)
+        await ctx.send(embed=embed)
+
+    def update_automod_config(self, guild_id, **changes):
+        config = dict(self.automod.get_config(guild_id), **changes)
+        self.save_automod_config(guild_id, config)
+        return config
+
+    @automod_group.command(name="toggle")
+    @commands.has_permissions(administrator=True)
+    async def automod_toggle(self, ctx):
+        config = self.update_automod_config(ctx.guild.id, enabled=not self.automod.get_config(ctx.guild.id)["enabled"])
+        await ctx.send(f"自動審核已{'✅ 啟用' if config['enabled'] else '❌ 停用'}")
+
+    @automod_group.command(name="add")
+    @commands.has_permissions(administrator=True)
+    async def automod_add(self, ctx, *, term: str):
+        term = term.strip().lower()
+        self.db.execute("INSERT OR IGNORE INTO automod_terms (guild_id, term) VALUES (?, ?)", (ctx.guild.id, term))
+        self.db.commit()
+        self.reload_automod_terms(ctx.guild.id)
+        await ctx.send(f"✅ 已新增禁用詞（共 {len(self.automod.get_terms(ctx.guild.id))} 個）")
+
+    @automod_group.command(name="remove")
+    @commands.has_permissions(administrator=True)
+    async def automod_remove(self, ctx, *, term: str):
+        cursor = self.db.execute("DELETE FROM automod_terms WHERE guild_id = ? AND term = ?", (ctx.guild.id, term.strip().lower()))
+        self.db.commit()
+        if cursor.rowcount == 0:
+            await ctx.send("❌ 找不到該禁用詞！")
+            return
+        self.reload_automod_terms(ctx.guild.id)
+        await ctx.send(f"✅ 已移除禁用詞（共 {len(self.automod.get_terms(ctx.guild.id))} 個）")
+
+    @automod_group.command(name="list")
+    @commands.has_permissions(administrator=True)
+    async def automod_list(self, ctx):
+        terms = self.automod.get_terms(ctx.guild.id)
+        if not terms:
+            await ctx.send("❌ 目前沒有禁用詞。")
+            return
+        text = ", ".join(f"||{term}||" for term in terms)
+        await ctx.send(f"📋 禁用詞（{len(terms)} 個）：\n{text[:1900]}")
+
+    @automod_group.command(name="invites")
+    @commands.has_permissions(administrator=True)
+    async def automod_invites(self, ctx, status: str):
+        enabled = status.lower() in ["on", "開啟", "true", "1"]
+        self.update_automod_config(ctx.guild.id, block_invites=enabled)
+        await ctx.send(f"✅ 已{'開啟' if enabled else '關閉'}邀請連結封鎖")
+
+    @automod_group.command(name="links")
+    @commands.has_permissions(administrator=True)
+    async def automod_links(self, ctx, status: str):
+        enabled = status.lower() in ["on", "開啟", "true", "1"]
+        self.update_automod_config(ctx.guild.id, block_links=enabled)
+        await ctx.send(f"✅ 已{'開啟' if enabled else '關閉'}連結封鎖")
+
+    @automod_group.command(name="caps")
+    @commands.has_permissions(administrator=True)
+    async def automod_caps(self, ctx, limit: commands.Range[int, 0, 50]):
+        self.update_automod_config(ctx.guild.id, caps_limit=limit)
+        await ctx.send(f"✅ 全大寫訊息上限已設定為 {limit or '停用'}")
+
+    @automod_group.command(name="mentions")
+    @commands.has_permissions(administrator=True)
+    async def automod_mentions(self, ctx, limit: commands.Range[int, 0, 100]):
+        self.update_automod_config(ctx.guild.id, mention_limit=limit)
+        await ctx.send(f"✅ 提及人數上限已設定為 {limit or '停用'}")
+
+    @automod_group.command(name="spam")
+    @commands.has_permissions(administrator=True)
+    async def automod_spam(self, ctx, minutes: commands.Range[int, 0, 1440]):
+        self.update_automod_config(ctx.guild.id, spam_timeout=minutes)
+        await ctx.send(f"✅ 洗版禁言時間已設定為 {f'{minutes} 分鐘' if minutes else '不禁言（只刪除訊息）'}")
+
+    def fetch_modlog_page(self, guild_id, target_id, before_id=None):
+        """以 keyset 分頁查詢：只取 id 小於上一頁最後一筆的紀錄，不論翻到第幾頁都只掃描一頁"""
+        return self.db.execute("""
+            SELECT id, created_at, action, moderator_id, reason, details FROM mod_audit_log
+            WHERE guild_id = ? AND target_id = ? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        """, (guild_id, target_id, before_id or 2 ** 63 - 1, MODLOG_PAGE_SIZE + 1)).fetchall()
+
+    def iter_modlog_rows(self, guild_id, target_id=None):
+        """依時間順序分批讀出紀錄，每批以上一批的最後一筆作為起點"""
+        last = ("", 0)
+        while True:
+            if target_id is None:
+                rows = self.db.execute(f"""
+                    SELECT {", ".join(MODLOG_FIELDS)} FROM mod_audit_log
+                    WHERE guild_id = ? AND (created_at, id) > (?, ?)
+                    ORDER BY created_at, id LIMIT ?
+                """, (guild_id, last[0], last[1], MODLOG_EXPORT_CHUNK)).fetchall()
+            else:
+                rows = self.db.execute(f"""
+                    SELECT {", ".join(MODLOG_FIELDS)} FROM mod_audit_log
+                    WHERE guild_id = ? AND target_id = ? AND id > ?
+                    ORDER BY id LIMIT ?
+                """, (guild_id, target_id, last[1], MODLOG_EXPORT_CHUNK)).fetchall()
+            if not rows:
+                return
+            yield rows
+            last = (rows[-1][1], rows[-1][0])
+
+    def build_modlog_embed(self, user, rows, page):
+        embed = discord.Embed(title=f"📜 {user.name} 的審核紀錄", color=discord.Color.orange())
+        for log_id, created_at, action, moderator_id, reason, details in rows[:MODLOG_PAGE_SIZE]:
+            value = f"執行者：<@{moderator_id}>" if moderator_id else "執行者：未知"
+            if reason:
+                value += f"\n原因：{reason}"
+            if details:
+                value += f"\n{details}"
+            embed.add_field(name=f"#{log_id} {ACTION_NAMES.get(action, action)} | {created_at.replace('T', ' ')}",
+                            value=value[:1024], inline=False)
+        embed.set_footer(text=f"第 {page} 頁")
+        return embed
+
+    @commands.group(name="modlog", invoke_without_command=True)
+    @commands.has_permissions(administrator=True)  # 需要管理員權限
+    async def modlog(self, ctx, user: discord.User):
+        """查看成員的審核紀錄（僅限管理員）"""
+        await self.writer.flush()  # 確保看得到剛排入佇列的紀錄
+        rows = self.fetch_modlog_page(ctx.guild.id, user.id)
+        if not rows:
+            await ctx.send(f"📜 {user.name} 沒有任何審核紀錄。")
+            return
+        view = ModLogView(self, ctx.author.id, ctx.guild.id, user, rows)
+        view.message = await ctx.send(embed=self.build_modlog_embed(user, rows, 1), view=view)
+
+    @modlog.command(name="export")
+    @commands.has_permissions(administrator=True)
+    async def modlog_export(self, ctx, user: discord.User = None):
+        """匯出審核紀錄（CSV，gzip 壓縮），未指定成員時匯出整個伺服器"""
+        await self.writer.flush()
+        basename = f"modlog_{ctx.guild.id}" + (f"_{user.id}" if user else "")
+        writer = GzipPartWriter(basename, "csv", ctx.guild.filesize_limit, format_csv([MODLOG_FIELDS]))
+        rows = 0
+        # 邊讀邊壓縮，寫滿一段就送出，記憶體中最多只保留一段
+        for chunk in self.iter_modlog_rows(ctx.guild.id, user.id if user else None):
+            rows += len(chunk)
+            part = writer.write(format_csv(chunk))
+            if part:
+                await ctx.send(file=discord.File(io.BytesIO(part[1]), filename=part[0]))
+            await asyncio.sleep(0)
+        part = writer.close()
+        if part:
+            await ctx.send(file=discord.File(io.BytesIO(part[1]), filename=part[0]))
+        await ctx.send(f"✅ 已匯出 {rows} 筆審核紀錄")
 
     # 處理權限不足的錯誤
     @add_role.error
     @list_roles.error
     @assign_role.error
     @role_button.error
+    @role_select.error
     @ban.error
     @kick.error
     @clear.error
+    @massrole.error
+    @massrole_add.error
+    @massrole_remove.error
+    @massrole_status.error
+    @massrole_cancel.error
+    @automod_group.error
+    @automod_toggle.error
+    @automod_add.error
+    @automod_remove.error
+    @automod_list.error
+    @automod_invites.error
+    @automod_links.error
+    @automod_caps.error
+    @automod_mentions.error
+    @automod_spam.error
+    @modlog.error
+    @modlog_export.error
     async def permission_error(self, ctx, error):
         if isinstance(error, commands.MissingPermissions):
             await ctx.send("❌ 你沒有使用此命令的權限！此命令僅限管理員使用。")
@@ -122,27 +859,125 @@ class ModerationCog(commands.Cog):
         else:
             await ctx.send("❌ 發生未知錯誤！")
 
-class RoleAssignView(View):
-    def __init__(self, role):
-        super().__init__(timeout=None)
-        self.role = role
+class ModLogView(View):
+    """審核紀錄的翻頁按鈕；記住每一頁的起點，往回翻時不需重新計算 OFFSET"""
+
+    def __init__(self, cog, author_id, guild_id, user, rows):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.author_id = author_id
+        self.guild_id = guild_id
+        self.user = user
+        self.rows = rows
+        self.cursors = [None]  # 每一頁查詢時使用的 before_id
+        self.message = None
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.newer.disabled = len(self.cursors) == 1
+        self.older.disabled = len(self.rows) <= MODLOG_PAGE_SIZE
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("❌ 只有執行指令的人可以翻頁！", ephemeral=True)
+            return False
+        return True
+
+    async def show(self, interaction):
+        self.rows = self.cog.fetch_modlog_page(self.guild_id, self.user.id, self.cursors[-1])
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.cog.build_modlog_embed(self.user, self.rows, len(self.cursors)), view=self)
+
+    @discord.ui.button(label="◀ 較新", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await self.show(interaction)
+
+    @discord.ui.button(label="較舊 ▶", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.rows[MODLOG_PAGE_SIZE - 1][0])
+        await self.show(interaction)
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+class RoleButton(discord.ui.DynamicItem[discord.ui.Button], template=r'rolebtn:(?P<role_id>\d+)'):
+    """身份組按鈕：custom_id 內含身份組 ID，重啟後不需還原任何狀態"""
 
-    @discord.ui.button(label="獲取角色", style=discord.ButtonStyle.primary)
-    async def assign_role(self, interaction: discord.Interaction, button: discord.ui.Button):
+    def __init__(self, role_id, label="獲取角色"):
+        super().__init__(
+            discord.ui.Button(
+                label=label,
+                style=discord.ButtonStyle.primary,
+                custom_id=f"rolebtn:{role_id}"
+            )
+        )
+        self.role_id = role_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match['role_id']), item.label)
+
+    async def callback(self, interaction: discord.Interaction):
+        # 每次點擊時才從伺服器快取取得身份組
+        role = interaction.guild.get_role(self.role_id) if interaction.guild else None
+        if not role:
+            await interaction.response.send_message("❌ 此身份組已不存在！", ephemeral=True)
+            return
+        
         try:
-            if self.role in interaction.user.roles:
+            if role in interaction.user.roles:
                 await interaction.response.send_message("❌ 你已有此身份組！", ephemeral=True)
                 return
             
-            await interaction.user.add_roles(self.role)
-            await interaction.response.send_message(f"✅ 已為你分配 {self.role.name} 身份組！", ephemeral=True)
+            await interaction.user.add_roles(role)
+            await interaction.response.send_message(f"✅ 已為你分配 {role.name} 身份組！", ephemeral=True)
         except discord.Forbidden:
             await interaction.response.send_message("❌ 機器人沒有足夠的權限分配此身份組！", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message("❌ 發生錯誤，請聯繫管理員！", ephemeral=True)
 
-    async def on_error(self, interaction: discord.Interaction, error: Exception, item: discord.ui.Item):
-        await interaction.response.send_message("❌ 發生錯誤，請聯繫管理員！", ephemeral=True)
+class RoleSelect(discord.ui.DynamicItem[discord.ui.Select], template=r'rolesel:(?P<guild_id>\d+)'):
+    """多選身份組選單：可選的身份組就是選單本身的選項，選取結果會同步成成員的身份組"""
+
+    def __init__(self, guild_id, options):
+        super().__init__(
+            discord.ui.Select(
+                placeholder="選擇你想要的身份組",
+                min_values=0,
+                max_values=len(options),
+                options=options,
+                custom_id=f"rolesel:{guild_id}"
+            )
+        )
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Select, match):
+        return cls(int(match['guild_id']), item.options)
+
+    async def callback(self, interaction: discord.Interaction):
+        guild = interaction.guild
+        offered = {int(option.value) for option in self.item.options}
+        selected = {int(value) for value in self.item.values}
+        current = {role.id for role in interaction.user.roles}
+        to_add = [role for role in map(guild.get_role, selected - current) if role]
+        to_remove = [role for role in map(guild.get_role, (offered - selected) & current) if role]
+        
+        try:
+            if to_add:
+                await interaction.user.add_roles(*to_add)
+            if to_remove:
+                await interaction.user.remove_roles(*to_remove)
+        except discord.Forbidden:
+            await interaction.response.send_message("❌ 機器人沒有足夠的權限分配此身份組！", ephemeral=True)
+            return
+        
+        changes = [f"✅ {role.name}" for role in to_add] + [f"➖ {role.name}" for role in to_remove]
+        await interaction.response.send_message("\n".join(changes) or "身份組沒有變更。", ephemeral=True)
 
 @commands.Cog.listener()
 async def on_ready(self):
@@ -5,8 +5,11 @@ import os
 import sqlite3
 import aiohttp
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
+from utils.http import get_session
+from utils.oauth import get_token_manager
+from utils.notifications import get_notification_hub
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -18,10 +21,17 @@ class Twitch(commands.Cog):
         self.db_file = "bot_data.db"
         self.guild_id = 1130523145313456268  # 你的伺服器 ID
         self.config = self.load_config()
-        self.twitch_token = None
-        self.token_expires_at = None
+        self.oauth = get_token_manager(
+            "Twitch",
+            "https://id.twitch.tv/oauth2/token",
+            lambda: (self.config.get("client_id"), self.config.get("client_secret")),
+            refresh_margin=600
+        )
         self.headers = {}
         self.stream_data = {}
+        self.notifications = get_notification_hub(bot)
+        self.notifications.register("stream_online", self.render_stream_online)
+        self.notifications.start()
         
         # 確保所有追蹤的實況主在資料庫中有記錄
         self.ensure_streamers_in_db()
@@ -219,54 +229,18 @@ class Twitch(commands.Cog):
 
     def is_token_valid(self):
         """檢查 Token 是否有效"""
-        if not self.twitch_token or not self.token_expires_at:
-            return False
-        return datetime.now() < self.token_expires_at
+        return self.oauth.valid
 
     async def get_twitch_token(self):
-        """獲取 Twitch API Token"""
-        if not self.config.get("client_id") or not self.config.get("client_secret"):
-            logger.error("Client ID 或 Client Secret 未設定")
+        """獲取 Twitch API Token（由共用的 Token 管理器處理刷新與重試）"""
+        token = await self.oauth.get()
+        if not token:
             return False
-        
-        if self.is_token_valid():
-            return True
-        
-        url = "https://id.twitch.tv/oauth2/token"
-        data = {
-            "client_id": self.config["client_id"],
-            "client_secret": self.config["client_secret"],
-            "grant_type": "client_credentials"
+        self.headers = {
+            "Client-ID": self.config["client_id"],
+            "Authorization": f"Bearer {token}"
         }
-        
-        try:
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(url, data=data) as response:
-                    response_text = await response.text()
-                    logger.info(f"Token 請求狀態碼: {response.status}")
-                    logger.info(f"Token 請求回應: {response_text}")
-                    
-                    if response.status == 200:
-                        response_data = await response.json()
-                        self.twitch_token = response_data.get("access_token")
-                        expires_in = response_data.get("expires_in", 3600)
-                        self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 600)
-                        self.headers = {
-                            "Client-ID": self.config["client_id"],
-                            "Authorization": f"Bearer {self.twitch_token}"
-                        }
-                        logger.info("✅ 成功獲取 Twitch Token")
-                        return True
-                    else:
-                        logger.error(f"❌ 無法獲取 Twitch Token: {response.status} - {response_text}")
-                        return False
-        except asyncio.TimeoutError:
-            logger.error("❌ 獲取 Twitch Token 超時")
-            return False
-        except Exception as e:
-            logger.error(f"❌ 獲取 Twitch Token 時發生錯誤: {e}")
-            return False
+        return True
 
     async def make_twitch_request(self, url, retries=3):
         """統一的 Twitch API 請求方法，包含重試機制"""
@@ -275,23 +249,22 @@ class Twitch(commands.Cog):
                 logger.error("無法獲取有效的 Twitch Token")
                 return None
             
+            headers = self.headers
             try:
                 timeout = aiohttp.ClientTimeout(total=10)
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.get(url, headers=self.headers) as response:
-                        response_text = await response.text()
-                        if response.status == 200:
-                            return await response.json()
-                        elif response.status == 401:
-                            logger.warning("Token 無效，嘗試重新獲取")
-                            self.twitch_token = None
-                            self.token_expires_at = None
-                            if attempt < retries - 1:
-                                await asyncio.sleep(1)
-                                continue
-                        else:
-                            logger.error(f"API 請求失敗: {response.status} - {response_text}")
-                            return None
+                async with get_session().get(url, headers=headers, timeout=timeout) as response:
+                    response_text = await response.text()
+                    if response.status == 200:
+                        return await response.json()
+                    elif response.status == 401:
+                        logger.warning("Token 無效，嘗試重新獲取")
+                        self.oauth.invalidate(headers["Authorization"].removeprefix("Bearer "))
+                        if attempt < retries - 1:
+                            await asyncio.sleep(1)
+                            continue
+                    else:
+                        logger.error(f"API 請求失敗: {response.status} - {response_text}")
+                        return None
             except asyncio.TimeoutError:
                 logger.error(f"API 請求超時 (第 {attempt + 1} 次嘗試)")
                 if attempt < retries - 1:
@@ -418,6 +391,36 @@ class Twitch(commands.Cog):
             logger.error(f"格式化訊息時發生錯誤: 缺少鍵 {e}")
             message = f"🔴 **{username}** 正在直播！（資料不完整）"
         
+        mentions = []
+        if self.config.get("mention_everyone", False):
+            mentions.append("@everyone")
+        elif self.config.get("mention_role"):
+            role = channel.guild.get_role(self.config["mention_role"])
+            if role:
+                mentions.append(role.mention)
+        
+        if settings.get("discord_role"):
+            role = channel.guild.get_role(settings["discord_role"])
+            if role:
+                mentions.append(role.mention)
+        
+        mention_text = " ".join(mentions) if mentions else ""
+        
+        # 交給通知分發處理：以直播 ID 去重，失敗的投遞會從 outbox 重試
+        event_data = {"username": username, "stream": stream_info, "user": user_info}
+        try:
+            delivered = await self.notifications.publish(
+                "stream_online", stream_info.get("id") or f"{username}:{stream_info.get('started_at')}",
+                event_data, {channel.id: mention_text}
+            )
+            if delivered:
+                logger.info(f"✅ 已發送 {username} 的直播通知")
+        except Exception as e:
+            logger.error(f"發送直播通知時發生錯誤: {e}")
+
+    def render_stream_online(self, data):
+        """產生直播通知的 embed，每個直播事件只產生一次"""
+        username, stream_info, user_info = data["username"], data["stream"], data["user"]
         embed = discord.Embed(
             title=f"🔴 {stream_info.get('user_name', username)} 正在直播！",
             description=stream_info.get("title", "無標題"),
@@ -448,29 +451,7 @@ class Twitch(commands.Cog):
             embed.add_field(name="🕐 開始時間", value="剛剛", inline=True)
         
         embed.set_footer(text="Twitch 直播通知")
-        
-        mentions = []
-        if self.config.get("mention_everyone", False):
-            mentions.append("@everyone")
-        elif self.config.get("mention_role"):
-            role = channel.guild.get_role(self.config["mention_role"])
-            if role:
-                mentions.append(role.mention)
-        
-        if settings.get("discord_role"):
-            role = channel.guild.get_role(settings["discord_role"])
-            if role:
-                mentions.append(role.mention)
-        
-        mention_text = " ".join(mentions) if mentions else ""
-        
-        try:
-            await channel.send(content=mention_text, embed=embed)
-            logger.info(f"✅ 已發送 {username} 的直播通知")
-        except discord.Forbidden:
-            logger.error(f"無權發送訊息或提及 @everyone，請檢查 bot 權限")
-        except Exception as e:
-            logger.error(f"發送直播通知時發生錯誤: {e}")
+        return None, embed
 
     @check_streams.before_loop
     async def before_check_streams(self):
@@ -559,6 +540,8 @@ class Twitch(commands.Cog):
         self.config["client_id"] = client_id
         self.config["client_secret"] = client_secret
         self.save_config()
+        # 舊金鑰取得的 Token 不再適用，強制以新金鑰重新取得
+        self.oauth.invalidate()
         
         if await self.get_twitch_token():
             await ctx.send("✅ API 金鑰設定成功！", delete_after=10)
@@ -740,7 +723,7 @@ class Twitch(commands.Cog):
         api_status = "✅ 正常" if self.is_token_valid() else "❌ 無效"
         embed.add_field(name="API Token 狀態", value=api_status, inline=True)
         
-        expires_text = f"<t:{int(self.token_expires_at.timestamp())}:R>" if self.token_expires_at else "未設定"
+        expires_text = f"<t:{int(self.oauth.expires_at)}:R>" if self.oauth.expires_at else "未設定"
         embed.add_field(name="Token 過期時間", value=expires_text, inline=True)
         
         embed.add_field(name="Client ID", value="✅ 已設定" if self.config.get("client_id") else "❌ 未設定", inline=True)
@@ -755,6 +738,7 @@ class Twitch(commands.Cog):
         """卸載 Cog 時停止任務"""
         if self.check_streams.is_running():
             self.check_streams.stop()
+        self.oauth.close()
 
 async def setup(bot):
     await bot.add_cog(Twitch(bot))
@@ -1,18 +1,80 @@
 import discord
 from discord.ext import commands
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import numpy as np
 import io
 import asyncio
+import ast
+import heapq
+import re
+import time
 from datetime import datetime
+from typing import Optional
 import sqlite3
+import numpy as np
+from utils.render import render, RenderCache
+from utils.charts import render_poll_chart, render_ranked_chart
+from utils.tally import encode_ranking, UNRANKED
+from utils.export import GzipPartWriter, format_csv, format_jsonl
+from utils.outbound import get_outbound
+
+POLL_MODES = {"plurality": "單選", "ranked": "排序（即時決選）"}
+
+# 已繪製的結果圖：(投票 ID, 各選項票數, 是否結束) -> PNG
+chart_cache = RenderCache(max_entries=256)
+
+# 每個投票訊息最多每隔幾秒重新編輯一次
+POLL_REFRESH_INTERVAL = 3.0
+
+class PollRefresher:
+    """合併投票訊息的更新：投票當下只回覆使用者，訊息由計時器以最新票數統一刷新"""
+
+    def __init__(self, interval=POLL_REFRESH_INTERVAL):
+        self.interval = interval
+        self._messages = {}  # 投票 ID -> 待刷新的訊息
+        self._tasks = {}  # 投票 ID -> 排程中的刷新任務
+        self._last_refresh = {}  # 投票 ID -> 上次刷新時間
+
+    def schedule(self, poll_id, message):
+        """要求刷新投票訊息，同一時間每個投票只會有一個排程"""
+        self._messages[poll_id] = message
+        if poll_id not in self._tasks:
+            self._tasks[poll_id] = asyncio.create_task(self._refresh_later(poll_id))
+
+    def forget(self, poll_id):
+        """投票結束或刪除時取消待處理的刷新"""
+        self._messages.pop(poll_id, None)
+        self._last_refresh.pop(poll_id, None)
+        task = self._tasks.pop(poll_id, None)
+        if task:
+            task.cancel()
+
+    async def _refresh_later(self, poll_id):
+        loop = asyncio.get_running_loop()
+        delay = self._last_refresh.get(poll_id, 0) + self.interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        # 先移除排程，刷新期間進來的投票會排下一次刷新
+        self._tasks.pop(poll_id, None)
+        message = self._messages.pop(poll_id, None)
+        poll = get_poll(poll_id)
+        if message is None or poll is None or not poll['active']:
+            self._last_refresh.pop(poll_id, None)
+            return
+        
+        now = loop.time()
+        # 超過間隔的紀錄已不影響延遲計算，順便移除，避免沒有截止時間的投票讓字典一直成長
+        self._last_refresh = {pid: t for pid, t in self._last_refresh.items() if now - t < self.interval}
+        self._last_refresh[poll_id] = now
+        try:
+            await get_outbound().edit(message, embed=create_poll_embed(poll))
+        except discord.HTTPException as e:
+            print(f"更新投票訊息時出錯: {e}")
 
-# 設置中文字體
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'Arial Unicode MS', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
+poll_refresher = PollRefresher()
 
 class PollView(discord.ui.View):
+    """投票訊息的按鈕；所有按鈕都是動態項目，重啟後由 custom_id 直接解析，無需重新註冊"""
+
     def __init__(self, poll_id):
         super().__init__(timeout=None)
         self.poll_id = poll_id
@@ -22,12 +84,129 @@ class PollView(discord.ui.View):
         if poll:
             emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
             
-            for i, option in enumerate(poll['options']):
-                button = VoteButton(poll_id, i, option['text'], emojis[i])
-                self.add_item(button)
+            if poll['mode'] == 'ranked':
+                self.add_item(PollRankButton(poll_id))
+            else:
+                for i, option in enumerate(poll['options']):
+                    button = VoteButton(poll_id, i, option['text'], emojis[i])
+                    self.add_item(button)
+        
+        self.add_item(PollChartButton(poll_id))
+        self.add_item(PollCloseButton(poll_id))
+
+class VoteButton(discord.ui.DynamicItem[discord.ui.Button], template=r'vote_(?P<poll_id>\w+)_(?P<index>\d+)'):
+    def __init__(self, poll_id, option_index, option_text=None, emoji=None):
+        super().__init__(
+            discord.ui.Button(
+                label=option_text,
+                style=discord.ButtonStyle.primary,
+                emoji=emoji,
+                custom_id=f"vote_{poll_id}_{option_index}"
+            )
+        )
+        self.poll_id = poll_id
+        self.option_index = option_index
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        # 按下時才從 custom_id 還原，投票內容於 callback 中按需查詢
+        return cls(match['poll_id'], int(match['index']), item.label, item.emoji)
+    
+    async def callback(self, interaction: discord.Interaction):
+        # 記錄投票（單一交易：新增一筆投票紀錄並更新計數器）
+        weight = get_voter_weight(self.poll_id, interaction.user)
+        result = record_vote(self.poll_id, interaction.user.id, self.option_index, weight)
+        if result == VOTE_CLOSED:
+            poll = get_poll(self.poll_id)
+            message = "❌ 投票已結束！" if poll else "❌ 投票已不存在！"
+            await interaction.response.send_message(message, ephemeral=True)
+            return
+        
+        if result == VOTE_DUPLICATE:
+            await interaction.response.send_message("❌ 您已經投過票了！", ephemeral=True)
+            return
+        
+        # 立即回覆，投票訊息交由計時器合併刷新
+        await interaction.response.send_message(f"✅ 投票成功！您選擇了: {self.item.label}", ephemeral=True)
+        poll_refresher.schedule(self.poll_id, interaction.message)
+
+class PollRankButton(discord.ui.DynamicItem[discord.ui.Button], template=r'pollrank_(?P<poll_id>\w+)'):
+    def __init__(self, poll_id):
+        super().__init__(
+            discord.ui.Button(
+                label='排序投票',
+                style=discord.ButtonStyle.primary,
+                emoji='📝',
+                custom_id=f"pollrank_{poll_id}"
+            )
+        )
+        self.poll_id = poll_id
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['poll_id'])
     
-    @discord.ui.button(label='查看結果圖表', style=discord.ButtonStyle.success, emoji='📈')
-    async def show_results(self, interaction: discord.Interaction, button: discord.ui.Button):
+    async def callback(self, interaction: discord.Interaction):
+        poll = get_poll(self.poll_id)
+        if not poll:
+            await interaction.response.send_message("❌ 投票已不存在！", ephemeral=True)
+            return
+        if not poll['active']:
+            await interaction.response.send_message("❌ 投票已結束！", ephemeral=True)
+            return
+        await interaction.response.send_modal(RankedBallotModal(poll))
+
+class RankedBallotModal(discord.ui.Modal):
+    def __init__(self, poll):
+        super().__init__(title="排序投票", timeout=600)
+        self.poll = poll
+        self.ranking = discord.ui.TextInput(
+            label="依喜好順序輸入選項編號",
+            placeholder=f"例如：2,1,3（可只排前幾名，共 {len(poll['options'])} 個選項）",
+            max_length=40
+        )
+        self.add_item(self.ranking)
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        option_count = len(self.poll['options'])
+        try:
+            ranking = [int(part) - 1 for part in re.split(r"[\s,，、>]+", self.ranking.value.strip()) if part]
+        except ValueError:
+            ranking = []
+        if not ranking or len(set(ranking)) != len(ranking) or any(i < 0 or i >= option_count for i in ranking):
+            await interaction.response.send_message(f"❌ 請輸入 1-{option_count} 之間且不重複的選項編號！", ephemeral=True)
+            return
+        
+        weight = get_voter_weight(self.poll['id'], interaction.user)
+        result = record_ballot(self.poll['id'], interaction.user.id, ranking, option_count, weight)
+        if result == VOTE_CLOSED:
+            await interaction.response.send_message("❌ 投票已結束！", ephemeral=True)
+            return
+        if result == VOTE_DUPLICATE:
+            await interaction.response.send_message("❌ 您已經投過票了！", ephemeral=True)
+            return
+        
+        choices = " > ".join(self.poll['options'][i]['text'] for i in ranking)
+        await interaction.response.send_message(f"✅ 投票成功！您的排序: {choices}", ephemeral=True)
+        poll_refresher.schedule(self.poll['id'], interaction.message)
+
+class PollChartButton(discord.ui.DynamicItem[discord.ui.Button], template=r'pollchart_(?P<poll_id>\w+)'):
+    def __init__(self, poll_id):
+        super().__init__(
+            discord.ui.Button(
+                label='查看結果圖表',
+                style=discord.ButtonStyle.success,
+                emoji='📈',
+                custom_id=f"pollchart_{poll_id}"
+            )
+        )
+        self.poll_id = poll_id
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['poll_id'])
+    
+    async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer()
         
         poll = get_poll(self.poll_id)
@@ -42,9 +221,24 @@ class PollView(discord.ui.View):
         except Exception as e:
             print(f"創建圖表時出錯: {e}")
             await interaction.followup.send("❌ 創建圖表時出錯！", ephemeral=True)
+
+class PollCloseButton(discord.ui.DynamicItem[discord.ui.Button], template=r'pollclose_(?P<poll_id>\w+)'):
+    def __init__(self, poll_id):
+        super().__init__(
+            discord.ui.Button(
+                label='結束投票',
+                style=discord.ButtonStyle.danger,
+                emoji='🔒',
+                custom_id=f"pollclose_{poll_id}"
+            )
+        )
+        self.poll_id = poll_id
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['poll_id'])
     
-    @discord.ui.button(label='結束投票', style=discord.ButtonStyle.danger, emoji='🔒')
-    async def close_poll(self, interaction: discord.Interaction, button: discord.ui.Button):
+    async def callback(self, interaction: discord.Interaction):
         poll = get_poll(self.poll_id)
         if not poll:
             await interaction.response.send_message("❌ 找不到該投票！", ephemeral=True)
@@ -55,11 +249,10 @@ class PollView(discord.ui.View):
             return
         
         poll['active'] = False
-        save_poll(poll)
+        set_poll_active(self.poll_id, False)
+        poll_refresher.forget(self.poll_id)
         
-        embed = create_poll_embed(poll)
-        embed.title = "🔒 投票已結束"
-        embed.color = discord.Color.red()
+        embed = create_closed_poll_embed(poll)
         
         try:
             chart_buffer = await create_vote_chart(poll)
@@ -69,47 +262,6 @@ class PollView(discord.ui.View):
             print(f"創建最終圖表時出錯: {e}")
             await interaction.response.edit_message(embed=embed, view=None)
 
-class VoteButton(discord.ui.Button):
-    def __init__(self, poll_id, option_index, option_text, emoji):
-        super().__init__(
-            label=option_text,
-            style=discord.ButtonStyle.primary,
-            emoji=emoji,
-            custom_id=f"vote_{poll_id}_{option_index}"
-        )
-        self.poll_id = poll_id
-        self.option_index = option_index
-    
-    async def callback(self, interaction: discord.Interaction):
-        poll = get_poll(self.poll_id)
-        if not poll:
-            await interaction.response.send_message("❌ 投票已不存在！", ephemeral=True)
-            return
-        
-        if not poll['active']:
-            await interaction.response.send_message("❌ 投票已結束！", ephemeral=True)
-            return
-        
-        user_id = interaction.user.id
-        if user_id in poll['voters']:
-            await interaction.response.send_message("❌ 您已經投過票了！", ephemeral=True)
-            return
-        
-        # 記錄投票
-        poll['options'][self.option_index]['votes'] += 1
-        poll['voters'].add(user_id)
-        save_poll(poll)
-        
-        # 更新嵌入消息
-        embed = create_poll_embed(poll)
-        await interaction.response.edit_message(embed=embed, view=self.view)
-        
-        # 發送確認消息
-        await interaction.followup.send(
-            f"✅ 投票成功！您選擇了: {poll['options'][self.option_index]['text']}", 
-            ephemeral=True
-        )
-
 def create_poll_embed(poll):
     embed = discord.Embed(
         title=f"📊 {poll['question']}", 
@@ -120,107 +272,447 @@ def create_poll_embed(poll):
     emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
     
     for i, option in enumerate(poll['options']):
+        if poll['mode'] == 'ranked':
+            value = f"第一志願: {option['votes']}"
+        else:
+            value = f"投票數: {option['votes']}"
+        if poll['weighted']:
+            value += f" | 加權: {option['score']:g}"
         embed.add_field(
             name=f"{emojis[i]} {option['text']}", 
-            value=f"投票數: {option['votes']}", 
+            value=value, 
             inline=True
         )
     
+    if poll['mode'] == 'ranked':
+        embed.description = "依喜好排序所有選項，以即時決選制計票"
+    
+    if poll['active'] and poll.get('closes_at'):
+        embed.add_field(name="⏰ 結束時間", value=f"<t:{int(poll['closes_at'])}:R>", inline=False)
+    
     embed.set_footer(text=f"投票 ID: {poll['id']} | 創建者: {poll['creator']}")
     return embed
 
-async def create_vote_chart(poll):
-    # 創建圖表
-    fig, ax = plt.subplots(figsize=(12, 8))
-    fig.patch.set_facecolor('#2C2F33')
-    ax.set_facecolor('#2C2F33')
+def create_closed_poll_embed(poll):
+    embed = create_poll_embed(poll)
+    embed.title = "🔒 投票已結束"
+    embed.color = discord.Color.red()
+    return embed
+
+async def finalize_poll(bot, poll_id):
+    """自動結束投票：更新狀態並以最終圖表編輯原始訊息"""
+    poll = get_poll(poll_id)
+    if not poll or not poll['active']:
+        return  # 已被手動結束或刪除
     
-    # 獲取數據
-    options = [opt['text'] for opt in poll['options']]
-    votes = [opt['votes'] for opt in poll['options']]
-    total_votes = sum(votes)
+    poll['active'] = False
+    set_poll_active(poll_id, False)
+    poll_refresher.forget(poll_id)
     
-    if total_votes == 0:
-        # 如果沒有投票，顯示空圖表
-        ax.text(0.5, 0.5, '尚無投票', ha='center', va='center', 
-                transform=ax.transAxes, color='white', fontsize=20)
-        ax.set_xlim(0, 1)
-        ax.set_ylim(0, 1)
-        ax.set_xticks([])
-        ax.set_yticks([])
-    else:
-        # 創建橫向長條圖
-        colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', 
-                  '#DDA0DD', '#98D8C8', '#F7DC6F', '#AED6F1', '#F8C471']
-        
-        bars = ax.barh(range(len(options)), votes, color=colors[:len(options)])
-        
-        # 設置標籤
-        ax.set_yticks(range(len(options)))
-        ax.set_yticklabels(options, color='white')
-        ax.set_xlabel('投票數', color='white')
-        
-        # 在長條上顯示數值和百分比
-        for i, (bar, vote) in enumerate(zip(bars, votes)):
-            width = bar.get_width()
-            percentage = (vote / total_votes) * 100 if total_votes > 0 else 0
-            ax.text(width + max(votes) * 0.01, bar.get_y() + bar.get_height()/2,
-                   f'{vote} ({percentage:.1f}%)', 
-                   va='center', color='white', fontweight='bold')
-        
-        # 設置刻度顏色
-        ax.tick_params(colors='white')
-        ax.spines['bottom'].set_color('white')
-        ax.spines['left'].set_color('white')
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
+    channel = bot.get_channel(poll['channel_id']) if poll['channel_id'] else None
+    if not channel or not poll['message_id']:
+        print(f"⚠️ 找不到投票 {poll_id} 的原始訊息，僅更新狀態")
+        return
     
-    # 設置標題
-    plt.title(poll['question'], color='white', fontsize=16, pad=20)
-    plt.figtext(0.5, 0.02, f'總投票數: {total_votes}', ha='center', color='#99AAB5')
+    message = channel.get_partial_message(poll['message_id'])
+    edit = {'embed': create_closed_poll_embed(poll), 'view': None}
+    try:
+        chart_buffer = await create_vote_chart(poll)
+        edit['attachments'] = [discord.File(chart_buffer, filename='final_result.png')]
+    except Exception as e:
+        print(f"創建最終圖表時出錯: {e}")
+    try:
+        # 經由發送排程編輯，尚未送出的即時刷新會與這次編輯合併，不會覆蓋最終結果
+        await get_outbound().edit(message, **edit)
+    except discord.HTTPException as e:
+        print(f"更新已結束投票 {poll_id} 的訊息時出錯: {e}")
+
+class PollCloseScheduler:
+    """以最小堆積排程自動結束投票，只用一個背景任務睡到最近的截止時間"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._heap = []  # (截止時間, 投票 ID)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """從資料庫重建堆積並啟動背景任務"""
+        cursor = connection.cursor()
+        cursor.execute("SELECT closes_at, poll_id FROM polls WHERE active = 1 AND closes_at IS NOT NULL")
+        self._heap = cursor.fetchall()
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def add(self, poll_id, closes_at):
+        heapq.heappush(self._heap, (closes_at, poll_id))
+        if self._heap[0][1] == poll_id:
+            self._wakeup.set()  # 新的截止時間最早，叫醒排程重新計算
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            
+            closes_at, poll_id = self._heap[0]
+            delay = closes_at - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            heapq.heappop(self._heap)
+            try:
+                await finalize_poll(self.bot, poll_id)
+            except Exception as e:
+                print(f"自動結束投票 {poll_id} 時出錯: {e}")
+
+async def create_vote_chart(poll):
+    """取得投票結果圖（在繪圖行程池中產生，票數未變時直接使用快取）"""
+    closed = not poll['active']
+    options = [opt['text'] for opt in poll['options']]
+    if poll['mode'] == 'ranked':
+        # 排序投票每一張新選票都會改變 total_votes，以此當作快取鍵
+        key = (poll['id'], ('ranked', poll['total_votes'], poll['weighted']), closed)
+        png = chart_cache.get(key)
+        if png is None:
+            ballots, weights = load_ballots(poll['id'])
+            png = await render(render_ranked_chart, poll['question'], options, ballots, weights, closed)
+            chart_cache.put(key, png)
+        return io.BytesIO(png)
     
-    # 調整佈局
-    plt.tight_layout()
+    votes = tuple(opt['score'] if poll['weighted'] else opt['votes'] for opt in poll['options'])
+    key = (poll['id'], votes, closed)
+    png = chart_cache.get(key)
+    if png is None:
+        png = await render(render_poll_chart, poll['question'], options, list(votes), closed)
+        chart_cache.put(key, png)
+    return io.BytesIO(png)
+
+# 舊資料表需補上的欄位：(欄位, 定義, 新增後的回填 SQL)
+ADDED_COLUMNS = {
+    "polls": [
+        ("closes_at", "REAL", None),
+        ("channel_id", "INTEGER", None),
+        ("message_id", "INTEGER", None),
+        ("mode", "TEXT DEFAULT 'plurality'", None),
+        ("guild_id", "INTEGER", None),
+        # poll_id 為建立時的時間戳，可用來回填舊投票的建立時間
+        ("created_at", "REAL", "UPDATE polls SET created_at = CAST(poll_id AS REAL) WHERE poll_id GLOB '[0-9]*'")
+    ],
+    "poll_options": [
+        ("score", "REAL DEFAULT 0", "UPDATE poll_options SET score = votes")
+    ],
+    "poll_votes": [
+        ("weight", "REAL DEFAULT 1", None)
+    ]
+}
+
+POLLS_PER_PAGE = 10
+EXPORT_CHUNK_ROWS = 2000
+EXPORT_FALLBACK_LIMIT = 10 * 1024 * 1024
+EXPORT_FIELDS = {
+    "plurality": ("user_id", "option_index", "option", "weight", "voted_at"),
+    "ranked": ("user_id", "ranking", "choices", "weight", "voted_at")
+}
+
+VOTE_OK = "ok"
+VOTE_DUPLICATE = "duplicate"
+VOTE_CLOSED = "closed"
+
+def init_poll_tables():
+    """建立正規化的投票資料表，並遷移舊版整包字串格式的資料"""
+    cursor = connection.cursor()
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(polls)")]
+    legacy = bool(columns) and "total_votes" not in columns
+    if legacy:
+        cursor.execute("ALTER TABLE polls RENAME TO polls_legacy")
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS polls (
+            poll_id TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            creator TEXT,
+            creator_id INTEGER,
+            active INTEGER DEFAULT 1,
+            total_votes INTEGER DEFAULT 0,
+            closes_at REAL,
+            channel_id INTEGER,
+            message_id INTEGER,
+            mode TEXT DEFAULT 'plurality',
+            guild_id INTEGER,
+            created_at REAL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_options (
+            poll_id TEXT,
+            option_index INTEGER,
+            text TEXT,
+            votes INTEGER DEFAULT 0,
+            score REAL DEFAULT 0,
+            PRIMARY KEY (poll_id, option_index)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_votes (
+            poll_id TEXT,
+            user_id INTEGER,
+            option_index INTEGER,
+            voted_at TEXT,
+            weight REAL DEFAULT 1,
+            PRIMARY KEY (poll_id, user_id)
+        )
+    """)
+    # 排序投票的選票：ranks 為固定長度的志願陣列（uint8）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_ballots (
+            poll_id TEXT,
+            user_id INTEGER,
+            ranks BLOB,
+            weight REAL DEFAULT 1,
+            cast_at TEXT,
+            PRIMARY KEY (poll_id, user_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_role_weights (
+            poll_id TEXT,
+            role_id INTEGER,
+            weight REAL,
+            PRIMARY KEY (poll_id, role_id)
+        )
+    """)
+    # 舊資料表補上後來新增的欄位
+    for table, added in ADDED_COLUMNS.items():
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        for column, definition, backfill in added:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                if backfill:
+                    cursor.execute(backfill)
+    # 列出活躍投票時依伺服器（及創建者）篩選並依建立時間分頁
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_polls_guild_active ON polls (guild_id, active, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_polls_guild_creator ON polls (guild_id, creator_id, active, created_at)")
     
-    # 保存到 BytesIO
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', facecolor='#2C2F33', dpi=150)
-    buffer.seek(0)
-    plt.close()
+    if legacy and "data" in columns:
+        for (data,) in cursor.execute("SELECT data FROM polls_legacy").fetchall():
+            try:
+                poll = ast.literal_eval(data)
+            except (ValueError, SyntaxError) as e:
+                print(f"⚠️ 無法遷移投票資料：{e}")
+                continue
+            try:
+                create_poll_record(poll, cursor)
+            except sqlite3.IntegrityError:
+                continue
+            cursor.execute("UPDATE polls SET total_votes = ? WHERE poll_id = ?",
+                           (sum(opt['votes'] for opt in poll['options']), poll['id']))
+            cursor.executemany("UPDATE poll_options SET votes = ?, score = ? WHERE poll_id = ? AND option_index = ?",
+                               [(opt['votes'], opt['votes'], poll['id'], i) for i, opt in enumerate(poll['options'])])
+            # 舊資料沒有記錄每位投票者的選項，只保留投票者以防重複投票
+            cursor.executemany("INSERT OR IGNORE INTO poll_votes (poll_id, user_id, option_index, voted_at) VALUES (?, ?, NULL, NULL)",
+                               [(poll['id'], user_id) for user_id in poll.get('voters', ())])
+        print("✅ 已將舊版投票資料遷移至新資料表（原資料保留於 polls_legacy）")
     
-    return buffer
+    connection.commit()
 
 def get_poll(poll_id):
     """從資料庫獲取投票資料"""
     cursor = connection.cursor()
-    cursor.execute("SELECT data FROM polls WHERE poll_id = ?", (poll_id,))
+    cursor.execute("""
+        SELECT poll_id, question, creator, creator_id, active, total_votes, closes_at, channel_id, message_id, mode,
+               EXISTS (SELECT 1 FROM poll_role_weights w WHERE w.poll_id = polls.poll_id)
+        FROM polls WHERE poll_id = ?
+    """, (poll_id,))
     result = cursor.fetchone()
-    connection.close()
-    if result:
-        return eval(result[0])  # 假設資料儲存為 JSON 字串，使用 eval 解析
-    return None
+    if not result:
+        return None
+    cursor.execute("SELECT text, votes, score FROM poll_options WHERE poll_id = ? ORDER BY option_index", (poll_id,))
+    return {
+        'id': result[0],
+        'question': result[1],
+        'options': [{'text': text, 'votes': votes, 'score': score} for text, votes, score in cursor.fetchall()],
+        'creator': result[2],
+        'creator_id': result[3],
+        'active': bool(result[4]),
+        'total_votes': result[5],
+        'closes_at': result[6],
+        'channel_id': result[7],
+        'message_id': result[8],
+        'mode': result[9] or 'plurality',
+        'weighted': bool(result[10])
+    }
+
+def create_poll_record(poll, cursor=None):
+    """新增投票及其選項"""
+    own_transaction = cursor is None
+    if own_transaction:
+        cursor = connection.cursor()
+    cursor.execute("""
+        INSERT INTO polls (poll_id, question, creator, creator_id, active, closes_at, mode, guild_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (poll['id'], poll['question'], poll['creator'], poll['creator_id'], 1 if poll['active'] else 0,
+          poll.get('closes_at'), poll.get('mode', 'plurality'), poll.get('guild_id'), poll.get('created_at', time.time())))
+    cursor.executemany("INSERT INTO poll_options (poll_id, option_index, text) VALUES (?, ?, ?)",
+                       [(poll['id'], i, opt['text']) for i, opt in enumerate(poll['options'])])
+    if own_transaction:
+        connection.commit()
+
+def open_poll(poll):
+    """新增投票並回傳初始的 embed；從資料庫重新讀取，確保 mode、weighted、score 等欄位齊全"""
+    create_poll_record(poll)
+    return create_poll_embed(get_poll(poll['id']))
 
-def save_poll(poll):
-    """將投票資料保存到資料庫"""
+def record_vote(poll_id, user_id, option_index, weight=1.0):
+    """記錄一票：在同一個交易中新增投票紀錄並更新計數器"""
+    try:
+        with connection:
+            cursor = connection.execute("""
+                INSERT INTO poll_votes (poll_id, user_id, option_index, voted_at, weight)
+                SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM polls WHERE poll_id = ? AND active = 1)
+            """, (poll_id, user_id, option_index, datetime.now().isoformat(), weight, poll_id))
+            if cursor.rowcount == 0:
+                return VOTE_CLOSED
+            connection.execute("UPDATE poll_options SET votes = votes + 1, score = score + ? WHERE poll_id = ? AND option_index = ?",
+                               (weight, poll_id, option_index))
+            connection.execute("UPDATE polls SET total_votes = total_votes + 1 WHERE poll_id = ?", (poll_id,))
+    except sqlite3.IntegrityError:
+        return VOTE_DUPLICATE  # (poll_id, user_id) 唯一限制
+    return VOTE_OK
+
+def record_ballot(poll_id, user_id, ranking, option_count, weight=1.0):
+    """記錄一張排序選票，並更新第一志願計數器"""
+    try:
+        with connection:
+            cursor = connection.execute("""
+                INSERT INTO poll_ballots (poll_id, user_id, ranks, weight, cast_at)
+                SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM polls WHERE poll_id = ? AND active = 1)
+            """, (poll_id, user_id, encode_ranking(ranking, option_count), weight, datetime.now().isoformat(), poll_id))
+            if cursor.rowcount == 0:
+                return VOTE_CLOSED
+            connection.execute("UPDATE poll_options SET votes = votes + 1, score = score + ? WHERE poll_id = ? AND option_index = ?",
+                               (weight, poll_id, ranking[0]))
+            connection.execute("UPDATE polls SET total_votes = total_votes + 1 WHERE poll_id = ?", (poll_id,))
+    except sqlite3.IntegrityError:
+        return VOTE_DUPLICATE
+    return VOTE_OK
+
+def load_ballots(poll_id):
+    """讀取排序選票，回傳 (所有選票串接的 bytes, 權重陣列)"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT ranks, weight FROM poll_ballots WHERE poll_id = ?", (poll_id,))
+    rows = cursor.fetchall()
+    ballots = b"".join(row[0] for row in rows)
+    weights = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return ballots, weights
+
+def get_role_weights(poll_id):
+    """取得投票的身份組權重設定"""
     cursor = connection.cursor()
-    cursor.execute("INSERT OR REPLACE INTO polls (poll_id, data) VALUES (?, ?)", 
-                  (poll['id'], str(poll)))
+    cursor.execute("SELECT role_id, weight FROM poll_role_weights WHERE poll_id = ?", (poll_id,))
+    return dict(cursor.fetchall())
+
+def get_voter_weight(poll_id, member):
+    """投票者的權重：擁有的加權身份組中最高者，預設為 1"""
+    weights = get_role_weights(poll_id)
+    if not weights:
+        return 1.0
+    return max((weights[role.id] for role in getattr(member, 'roles', []) if role.id in weights), default=1.0)
+
+def set_role_weight(poll_id, role_id, weight):
+    if weight == 1:
+        connection.execute("DELETE FROM poll_role_weights WHERE poll_id = ? AND role_id = ?", (poll_id, role_id))
+    else:
+        connection.execute("INSERT OR REPLACE INTO poll_role_weights (poll_id, role_id, weight) VALUES (?, ?, ?)",
+                           (poll_id, role_id, weight))
+    connection.commit()
+
+def set_poll_message(poll_id, channel_id, message_id):
+    """記錄投票訊息位置，供自動結束時編輯"""
+    connection.execute("UPDATE polls SET channel_id = ?, message_id = ? WHERE poll_id = ?", (channel_id, message_id, poll_id))
+    connection.commit()
+
+def set_poll_active(poll_id, active):
+    """更新投票狀態"""
+    connection.execute("UPDATE polls SET active = ? WHERE poll_id = ?", (1 if active else 0, poll_id))
     connection.commit()
-    connection.close()
+
+def iter_export_rows(poll, chunk_size=EXPORT_CHUNK_ROWS):
+    """逐批從資料庫游標讀出投票紀錄，不會一次載入所有投票者"""
+    cursor = connection.cursor()
+    if poll['mode'] == 'ranked':
+        texts = [opt['text'] for opt in poll['options']]
+        cursor.execute("SELECT user_id, ranks, weight, cast_at FROM poll_ballots WHERE poll_id = ? ORDER BY cast_at",
+                       (poll['id'],))
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = []
+            for user_id, ranks, weight, cast_at in rows:
+                ranking = [i for i in ranks if i != UNRANKED]
+                chunk.append((user_id, ",".join(str(i + 1) for i in ranking),
+                              " > ".join(texts[i] for i in ranking), weight, cast_at))
+            yield chunk
+    else:
+        cursor.execute("""
+            SELECT v.user_id, v.option_index + 1, o.text, v.weight, v.voted_at
+            FROM poll_votes v JOIN poll_options o ON o.poll_id = v.poll_id AND o.option_index = v.option_index
+            WHERE v.poll_id = ? ORDER BY v.voted_at
+        """, (poll['id'],))
+        while rows := cursor.fetchmany(chunk_size):
+            yield rows
+
+def list_active_polls(guild_id, creator_id=None, limit=POLLS_PER_PAGE, offset=0):
+    """分頁列出伺服器中的活躍投票，回傳 (該頁投票, 總數)"""
+    where = "guild_id = ? AND active = 1"
+    params = [guild_id]
+    if creator_id is not None:
+        where += " AND creator_id = ?"
+        params.append(creator_id)
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM polls WHERE {where}", params)
+    total = cursor.fetchone()[0]
+    cursor.execute(f"""
+        SELECT poll_id, question, creator, total_votes, closes_at FROM polls WHERE {where}
+        ORDER BY created_at DESC LIMIT ? OFFSET ?
+    """, params + [limit, offset])
+    return cursor.fetchall(), total
+
+def delete_poll_record(poll_id):
+    """刪除投票及其選項與投票紀錄"""
+    with connection:
+        connection.execute("DELETE FROM poll_votes WHERE poll_id = ?", (poll_id,))
+        connection.execute("DELETE FROM poll_ballots WHERE poll_id = ?", (poll_id,))
+        connection.execute("DELETE FROM poll_role_weights WHERE poll_id = ?", (poll_id,))
+        connection.execute("DELETE FROM poll_options WHERE poll_id = ?", (poll_id,))
+        connection.execute("DELETE FROM polls WHERE poll_id = ?", (poll_id,))
 
 class Vote(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         global connection
         connection = sqlite3.connect("bot_data.db", check_same_thread=False)
-        cursor = connection.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS polls (
-                poll_id TEXT PRIMARY KEY,
-                data TEXT
-            )
-        """)
-        connection.commit()
+        init_poll_tables()
+        self.close_scheduler = PollCloseScheduler(bot)
+    
+    async def cog_load(self):
+        # 只註冊一次動態按鈕處理器，重啟成本與投票數量無關
+        self.bot.add_dynamic_items(VoteButton, PollRankButton, PollChartButton, PollCloseButton)
+        self.close_scheduler.start()
+    
+    async def cog_unload(self):
+        self.bot.remove_dynamic_items(VoteButton, PollRankButton, PollChartButton, PollCloseButton)
+        self.close_scheduler.stop()
     
     @commands.Cog.listener()
     async def on_ready(self):
@@ -229,9 +721,16 @@ class Vote(commands.Cog):
     @discord.app_commands.command(name="createpoll", description="創建一個新的投票")
     @discord.app_commands.describe(
         question="投票問題",
-        options="投票選項 (用 | 分隔，最多10個)"
+        options="投票選項 (用 | 分隔，最多10個)",
+        duration="投票持續時間（分鐘，不填則需手動結束）",
+        mode="投票方式（預設單選）"
     )
-    async def create_poll(self, interaction: discord.Interaction, question: str, options: str):
+    @discord.app_commands.choices(mode=[
+        discord.app_commands.Choice(name=label, value=value) for value, label in POLL_MODES.items()
+    ])
+    async def create_poll(self, interaction: discord.Interaction, question: str, options: str,
+                          duration: Optional[discord.app_commands.Range[int, 1, 10080]] = None,
+                          mode: Optional[discord.app_commands.Choice[str]] = None):
         options_list = [opt.strip() for opt in options.split('|') if opt.strip()]
         
         if len(options_list) < 2:
@@ -242,23 +741,28 @@ class Vote(commands.Cog):
             await interaction.response.send_message("❌ 最多只能有10個選項！", ephemeral=True)
             return
         
-        poll_id = str(int(datetime.now().timestamp()))
+        # 以互動的 snowflake ID 作為投票 ID，同一秒內建立多個投票也不會衝突
+        poll_id = str(interaction.id)
         poll = {
             'id': poll_id,
             'question': question,
             'options': [{'text': opt, 'votes': 0} for opt in options_list],
-            'voters': set(),
             'creator': interaction.user.display_name,
             'creator_id': interaction.user.id,
-            'active': True
+            'active': True,
+            'guild_id': interaction.guild_id,
+            'closes_at': time.time() + duration * 60 if duration else None,
+            'mode': mode.value if mode else 'plurality'
         }
         
-        save_poll(poll)
-        
-        embed = create_poll_embed(poll)
+        embed = open_poll(poll)
         view = PollView(poll_id)
         
         await interaction.response.send_message(embed=embed, view=view)
+        message = await interaction.original_response()
+        set_poll_message(poll_id, message.channel.id, message.id)
+        if poll['closes_at']:
+            self.close_scheduler.add(poll_id, poll['closes_at'])
     
     @discord.app_commands.command(name="pollresult", description="查看投票結果圖表")
     @discord.app_commands.describe(poll_id="投票 ID")
@@ -278,31 +782,107 @@ class Vote(commands.Cog):
             print(f"創建圖表時出錯: {e}")
             await interaction.followup.send("❌ 創建圖表時出錯！", ephemeral=True)
     
-    @discord.app_commands.command(name="listpolls", description="列出所有活躍的投票")
-    async def list_polls(self, interaction: discord.Interaction):
-        cursor = connection.cursor()
-        cursor.execute("SELECT data FROM polls WHERE 1=1")
-        results = cursor.fetchall()
-        connection.close()
+    @discord.app_commands.command(name="listpolls", description="列出伺服器中活躍的投票")
+    @discord.app_commands.describe(page="頁數", creator="只列出此成員創建的投票")
+    async def list_polls(self, interaction: discord.Interaction,
+                         page: discord.app_commands.Range[int, 1, 1000] = 1,
+                         creator: Optional[discord.Member] = None):
+        if interaction.guild_id is None:
+            await interaction.response.send_message("❌ 此指令只能在伺服器中使用！", ephemeral=True)
+            return
         
-        active_polls = [eval(result[0]) for result in results if eval(result[0])['active']]
+        active_polls, total = list_active_polls(interaction.guild_id, creator.id if creator else None,
+                                                POLLS_PER_PAGE, (page - 1) * POLLS_PER_PAGE)
         
         if not active_polls:
-            await interaction.response.send_message("目前沒有活躍的投票。", ephemeral=True)
+            message = "目前沒有活躍的投票。" if total == 0 else f"❌ 第 {page} 頁沒有資料（共 {total} 個活躍投票）。"
+            await interaction.response.send_message(message, ephemeral=True)
             return
         
-        embed = discord.Embed(title="📋 活躍投票列表", color=discord.Color.green())
+        title = f"📋 {creator.display_name} 的活躍投票" if creator else "📋 活躍投票列表"
+        embed = discord.Embed(title=title, color=discord.Color.green())
         
-        for poll in active_polls:
-            total_votes = sum(opt['votes'] for opt in poll['options'])
-            embed.add_field(
-                name=f"ID: {poll['id']}", 
-                value=f"問題: {poll['question']}\n總投票數: {total_votes}\n創建者: {poll['creator']}", 
-                inline=False
-            )
+        for poll_id, question, creator_name, total_votes, closes_at in active_polls:
+            value = f"問題: {question}\n總投票數: {total_votes}\n創建者: {creator_name}"
+            if closes_at:
+                value += f"\n結束時間: <t:{int(closes_at)}:R>"
+            embed.add_field(name=f"ID: {poll_id}", value=value, inline=False)
         
+        pages = (total + POLLS_PER_PAGE - 1) // POLLS_PER_PAGE
+        embed.set_footer(text=f"第 {page}/{pages} 頁 · 共 {total} 個活躍投票")
         await interaction.response.send_message(embed=embed, ephemeral=True)
     
+    @discord.app_commands.command(name="pollweight", description="設定身份組的投票權重 (僅創建者，需在開始投票前設定)")
+    @discord.app_commands.describe(poll_id="投票 ID", role="身份組", weight="權重（1 為一般權重）")
+    async def poll_weight(self, interaction: discord.Interaction, poll_id: str, role: discord.Role,
+                          weight: discord.app_commands.Range[float, 0, 100]):
+        poll = get_poll(poll_id)
+        if not poll:
+            await interaction.response.send_message("❌ 找不到該投票！", ephemeral=True)
+            return
+        
+        if interaction.user.id != poll['creator_id']:
+            await interaction.response.send_message("❌ 只有投票創建者可以設定權重！", ephemeral=True)
+            return
+        
+        if poll['total_votes'] > 0:
+            await interaction.response.send_message("❌ 已經有人投票，無法再修改權重！", ephemeral=True)
+            return
+        
+        set_role_weight(poll_id, role.id, weight)
+        weights = get_role_weights(poll_id)
+        summary = "\n".join(f"<@&{role_id}>: {value:g}" for role_id, value in weights.items()) or "無（所有人權重皆為 1）"
+        await interaction.response.send_message(f"✅ 已更新投票 {poll_id} 的權重設定：\n{summary}", ephemeral=True)
+    
+    @discord.app_commands.command(name="pollexport", description="匯出投票紀錄 (創建者或伺服器管理員)")
+    @discord.app_commands.describe(poll_id="投票 ID", file_format="匯出格式（預設 CSV）")
+    @discord.app_commands.choices(file_format=[
+        discord.app_commands.Choice(name="CSV", value="csv"),
+        discord.app_commands.Choice(name="JSONL", value="jsonl")
+    ])
+    async def poll_export(self, interaction: discord.Interaction, poll_id: str,
+                          file_format: Optional[discord.app_commands.Choice[str]] = None):
+        poll = get_poll(poll_id)
+        if not poll:
+            await interaction.response.send_message("❌ 找不到該投票！", ephemeral=True)
+            return
+        
+        permissions = getattr(interaction.user, 'guild_permissions', None)
+        if interaction.user.id != poll['creator_id'] and not (permissions and permissions.manage_guild):
+            await interaction.response.send_message("❌ 只有投票創建者或伺服器管理員可以匯出投票紀錄！", ephemeral=True)
+            return
+        
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        
+        extension = file_format.value if file_format else "csv"
+        fields = EXPORT_FIELDS[poll['mode']]
+        limit = interaction.guild.filesize_limit if interaction.guild else EXPORT_FALLBACK_LIMIT
+        header = format_csv([fields]) if extension == "csv" else ""
+        writer = GzipPartWriter(f"poll_{poll_id}", extension, limit, header)
+        
+        rows = 0
+        parts = 0
+        try:
+            # 每寫滿一段就立刻送出，記憶體中最多只保留一段壓縮檔
+            for chunk in iter_export_rows(poll):
+                rows += len(chunk)
+                text = format_csv(chunk) if extension == "csv" else format_jsonl(chunk, fields)
+                part = writer.write(text)
+                if part:
+                    parts += 1
+                    await interaction.followup.send(file=discord.File(io.BytesIO(part[1]), filename=part[0]), ephemeral=True)
+                await asyncio.sleep(0)  # 大量資料時讓出事件迴圈
+            part = writer.close()
+            if part:
+                parts += 1
+                await interaction.followup.send(file=discord.File(io.BytesIO(part[1]), filename=part[0]), ephemeral=True)
+        except Exception as e:
+            print(f"匯出投票 {poll_id} 時出錯: {e}")
+            await interaction.followup.send("❌ 匯出投票紀錄時出錯！", ephemeral=True)
+            return
+        
+        await interaction.followup.send(f"✅ 已匯出 {rows} 筆投票紀錄（共 {parts} 個檔案）", ephemeral=True)
+    
     @discord.app_commands.command(name="deletepoll", description="刪除投票 (僅創建者)")
     @discord.app_commands.describe(poll_id="投票 ID")
     async def delete_poll(self, interaction: discord.Interaction, poll_id: str):
@@ -315,10 +895,8 @@ class Vote(commands.Cog):
             await interaction.response.send_message("❌ 只有投票創建者可以刪除投票！", ephemeral=True)
             return
         
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM polls WHERE poll_id = ?", (poll_id,))
-        connection.commit()
-        connection.close()
+        delete_poll_record(poll_id)
+        poll_refresher.forget(poll_id)
         
         await interaction.response.send_message(f"✅ 投票 {poll_id} 已被刪除！", ephemeral=True)
     
@@ -336,23 +914,22 @@ class Vote(commands.Cog):
             await ctx.send("❌ 最多只能有10個選項！")
             return
         
-        poll_id = str(int(datetime.now().timestamp()))
+        poll_id = str(ctx.message.id)
         poll = {
             'id': poll_id,
             'question': question,
             'options': [{'text': opt, 'votes': 0} for opt in options_list],
-            'voters': set(),
             'creator': ctx.author.display_name,
             'creator_id': ctx.author.id,
-            'active': True
+            'active': True,
+            'guild_id': ctx.guild.id if ctx.guild else None
         }
         
-        save_poll(poll)
-        
-        embed = create_poll_embed(poll)
+        embed = open_poll(poll)
         view = PollView(poll_id)
         
-        await ctx.send(embed=embed, view=view)
+        message = await ctx.send(embed=embed, view=view)
+        set_poll_message(poll_id, message.channel.id, message.id)
 
     def __del__(self):
         """銷毀實例時關閉資料庫連線"""
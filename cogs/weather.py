@@ -1,19 +1,37 @@
 import discord
 from discord.ext import commands, tasks
 import asyncio
-import aiohttp
 import json
 import os
 from datetime import datetime, timedelta
 import logging
+import ast
+import time
 from dotenv import load_dotenv
 import sqlite3
+import io
+import operator
+from collections import defaultdict
+import numpy as np
+from utils.render import render, RenderCache
+from utils.charts import render_weather_chart
+from utils.outbound import get_outbound, PRIORITY_SCHEDULED
+from utils.http import get_session
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+# 警報規則可用的指標：名稱、單位
+ALERT_METRICS = {
+    "temp": ("溫度", "°C"),
+    "rain": ("降雨機率", "%"),
+    "wind": ("風速", "km/h"),
+    "humidity": ("濕度", "%")
+}
+ALERT_OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
 class WeatherCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -32,10 +50,55 @@ class WeatherCog(commands.Cog):
                 cities TEXT
             )
         """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                query TEXT PRIMARY KEY,
+                name TEXT,
+                country TEXT,
+                lat REAL,
+                lon REAL,
+                resolved_at TEXT
+            )
+        """)
+        # 預報樣本：每個地點每個時間點一列的窄表
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS weather_samples (
+                loc_key TEXT,
+                ts INTEGER,
+                temp REAL,
+                pop REAL,
+                rain REAL,
+                PRIMARY KEY (loc_key, ts)
+            ) WITHOUT ROWID
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS weather_alert_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER,
+                channel_id INTEGER,
+                loc_key TEXT,
+                city_name TEXT,
+                lat REAL,
+                lon REAL,
+                metric TEXT,
+                op TEXT,
+                threshold REAL,
+                triggered INTEGER DEFAULT 0,
+                created_by INTEGER
+            )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_weather_alert_rules_loc ON weather_alert_rules (loc_key)")
         self.db.commit()
         
+        self.geocode_memo = {}  # 查詢字串 -> 地點（記憶體快取，資料庫為持久層）
+        self.weather_cache = {}  # (端點, 緯度, 經度) -> (過期時間, 資料)
+        self.weather_cache_ttl = 600  # 天氣資料快取秒數
+        self.chart_cache = RenderCache(max_entries=64)  # (地點, 天數, 小時) -> PNG
         self.active_votes = {}  # 儲存投票訊息 ID 與選項
+        self.alert_rules = defaultdict(dict)  # loc_key -> {規則 ID: 規則}
+        self.load_alert_rules()
         self.daily_weather_update.start()
+        self.check_weather_alerts.start()
 
     def get_weather_channels(self, guild_id):
         """獲取天氣頻道設定"""
@@ -44,69 +107,268 @@ class WeatherCog(commands.Cog):
         if result:
             return {
                 "channel_id": result[1],
-                "cities": eval(result[2]) if result[2] else ["Taipei"]
+                "cities": self.parse_cities(result[2])
             }
         return None
 
+    def parse_cities(self, raw):
+        """解析城市欄位，舊資料（城市名稱字串）會轉成尚未定位的地點"""
+        if not raw:
+            return [{"name": "Taipei", "lat": None, "lon": None}]
+        try:
+            cities = json.loads(raw)
+        except json.JSONDecodeError:
+            cities = ast.literal_eval(raw)  # 舊版以 str(list) 儲存
+        locations = []
+        for city in cities:
+            if isinstance(city, dict):
+                locations.append(city)
+            else:
+                locations.append({"name": city, "lat": None, "lon": None})
+        return locations
+
     def save_weather_channels(self, guild_id, data):
         """儲存天氣頻道設定"""
         self.cursor.execute("""
             INSERT OR REPLACE INTO weather_channels (guild_id, channel_id, cities)
             VALUES (?, ?, ?)
-        """, (guild_id, data["channel_id"], str(data["cities"])))
+        """, (guild_id, data["channel_id"], json.dumps(data["cities"], ensure_ascii=False)))
         self.db.commit()
 
-    async def fetch_current_weather(self, city="Taipei"):
-        """獲取當前天氣資料"""
+    def get_cached_geocode(self, query):
+        """從記憶體或資料庫讀取已解析的地點"""
+        if query in self.geocode_memo:
+            return self.geocode_memo[query]
+        self.cursor.execute("SELECT name, country, lat, lon FROM geocode_cache WHERE query = ?", (query,))
+        result = self.cursor.fetchone()
+        if result:
+            location = {"name": result[0], "country": result[1], "lat": result[2], "lon": result[3]}
+            self.geocode_memo[query] = location
+            return location
+        return None
+
+    async def geocode_city(self, city):
+        """將城市名稱解析為標準名稱與座標（結果永久快取）"""
+        query = " ".join(city.split()).lower()
+        location = self.get_cached_geocode(query)
+        if location:
+            return location
+
         if not self.weather_api_key:
-            logger.error("API Key 未設定，無法請求天氣資料")
+            logger.error("API Key 未設定，無法解析城市")
             return None
-            
-        url = "https://api.openweathermap.org/data/2.5/weather"
-        params = {"q": city, "appid": self.weather_api_key, "units": "metric", "lang": "zh_tw"}
-        
+
+        url = "https://api.openweathermap.org/geo/1.0/direct"
+        params = {"q": city, "limit": 1, "appid": self.weather_api_key}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    logger.debug(f"當前天氣請求URL: {response.url}")
-                    logger.debug(f"狀態碼: {response.status}")
-                    text = await response.text()
-                    logger.debug(f"回應內容: {text}")
-                    if response.status == 200:
-                        data = json.loads(text)
-                        return data
-                    else:
-                        logger.error(f"API請求失敗: {text}")
-                        return None
+            async with get_session().get(url, params=params) as response:
+                logger.debug(f"地理編碼請求URL: {response.url}")
+                text = await response.text()
+                if response.status != 200:
+                    logger.error(f"地理編碼請求失敗: {text}")
+                    return None
+                results = json.loads(text)
         except Exception as e:
-            logger.error(f"獲取當前天氣資料錯誤: {e}")
+            logger.error(f"地理編碼錯誤: {e}")
             return None
 
-    async def fetch_daily_forecast(self, city="Taipei"):
-        """獲取每日天氣預報（5天3小時間隔）"""
+        if not results:
+            logger.warning(f"找不到城市: {city}")
+            return None
+
+        result = results[0]
+        location = {
+            "name": result.get("local_names", {}).get("zh") or result["name"],
+            "country": result.get("country"),
+            "lat": round(result["lat"], 4),
+            "lon": round(result["lon"], 4)
+        }
+        self.cursor.execute("""
+            INSERT OR REPLACE INTO geocode_cache (query, name, country, lat, lon, resolved_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (query, location["name"], location["country"], location["lat"], location["lon"], datetime.now().isoformat()))
+        self.db.commit()
+        self.geocode_memo[query] = location
+        return location
+
+    async def resolve_location(self, city):
+        """接受城市名稱或地點字典，回傳含座標的地點"""
+        if isinstance(city, dict):
+            if city.get("lat") is not None and city.get("lon") is not None:
+                return city
+            city = city["name"]
+        return await self.geocode_city(city)
+
+    async def fetch_owm(self, endpoint, city):
+        """以座標向 OpenWeatherMap 請求資料，並依座標快取"""
         if not self.weather_api_key:
             logger.error("API Key 未設定，無法請求天氣資料")
             return None
-            
-        url = "https://api.openweathermap.org/data/2.5/forecast"
-        params = {"q": city, "appid": self.weather_api_key, "units": "metric", "lang": "zh_tw"}
+
+        location = await self.resolve_location(city)
+        if not location:
+            return None
+
+        cache_key = (endpoint, round(location["lat"], 2), round(location["lon"], 2))
+        cached = self.weather_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            logger.debug(f"使用快取天氣資料: {cache_key}")
+            return cached[1]
+
+        url = f"https://api.openweathermap.org/data/2.5/{endpoint}"
+        params = {
+            "lat": location["lat"], "lon": location["lon"],
+            "appid": self.weather_api_key, "units": "metric", "lang": "zh_tw"
+        }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    logger.debug(f"預報請求URL: {response.url}")
-                    logger.debug(f"狀態碼: {response.status}")
-                    text = await response.text()
-                    if response.status == 200:
-                        data = json.loads(text)
-                        return data
-                    else:
-                        logger.error(f"預報API請求失敗: {text}")
-                        return None
+            async with get_session().get(url, params=params) as response:
+                logger.debug(f"天氣請求URL: {response.url}")
+                logger.debug(f"狀態碼: {response.status}")
+                text = await response.text()
+                if response.status == 200:
+                    data = json.loads(text)
+                    self.weather_cache[cache_key] = (time.monotonic() + self.weather_cache_ttl, data)
+                    if endpoint == "forecast":
+                        self.store_forecast_samples(location, data)
+                    return data
+                else:
+                    logger.error(f"API請求失敗 ({endpoint}): {text}")
+                    return None
         except Exception as e:
-            logger.error(f"獲取預報資料錯誤: {e}")
+            logger.error(f"獲取天氣資料錯誤 ({endpoint}): {e}")
             return None
 
+    def get_loc_key(self, location):
+        """地點的儲存鍵（座標取到小數兩位）"""
+        return f"{location['lat']:.2f},{location['lon']:.2f}"
+
+    def store_forecast_samples(self, location, forecast_data):
+        """將預報資料寫入歷史樣本表"""
+        loc_key = self.get_loc_key(location)
+        rows = [
+            (loc_key, item["dt"], item["main"]["temp"], item.get("pop", 0.0), item.get("rain", {}).get("3h", 0.0))
+            for item in forecast_data.get("list", [])
+        ]
+        if rows:
+            self.cursor.executemany("""
+                INSERT OR REPLACE INTO weather_samples (loc_key, ts, temp, pop, rain)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            self.db.commit()
+
+    def load_samples(self, loc_key, start_ts):
+        """讀取指定時間之後的樣本，回傳 (時間, 溫度, 降雨機率, 降雨量) 陣列"""
+        self.cursor.execute("""
+            SELECT ts, temp, pop, rain FROM weather_samples
+            WHERE loc_key = ? AND ts >= ? ORDER BY ts
+        """, (loc_key, start_ts))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return None
+        samples = np.array(rows, dtype=np.float64)
+        return samples[:, 0].astype(np.int64), samples[:, 1], samples[:, 2], samples[:, 3]
+
+    def load_alert_rules(self):
+        """從資料庫載入所有警報規則，並依地點建立索引"""
+        self.alert_rules.clear()
+        self.cursor.execute("""
+            SELECT id, guild_id, channel_id, loc_key, city_name, lat, lon, metric, op, threshold, triggered
+            FROM weather_alert_rules
+        """)
+        for row in self.cursor.fetchall():
+            self.index_alert_rule({
+                "id": row[0], "guild_id": row[1], "channel_id": row[2], "loc_key": row[3],
+                "city_name": row[4], "lat": row[5], "lon": row[6], "metric": row[7],
+                "op": row[8], "threshold": row[9], "triggered": bool(row[10])
+            })
+
+    def index_alert_rule(self, rule):
+        self.alert_rules[rule["loc_key"]][rule["id"]] = rule
+
+    def unindex_alert_rule(self, rule):
+        rules = self.alert_rules.get(rule["loc_key"])
+        if rules is not None:
+            rules.pop(rule["id"], None)
+            if not rules:
+                del self.alert_rules[rule["loc_key"]]
+
+    def get_metric_value(self, metric, current_data, forecast_data):
+        """從天氣資料取出指標數值"""
+        if metric == "temp":
+            return current_data["main"]["temp"]
+        if metric == "humidity":
+            return current_data["main"]["humidity"]
+        if metric == "wind":
+            return current_data.get("wind", {}).get("speed", 0) * 3.6
+        if metric == "rain":
+            if not forecast_data or not forecast_data.get("list"):
+                return None
+            return forecast_data["list"][0].get("pop", 0) * 100
+        return None
+
+    @tasks.loop(minutes=10)
+    async def check_weather_alerts(self):
+        """依地點評估所有警報規則，每個地點只抓一次資料（走共用快取）"""
+        changed = []
+        for loc_key, rules in list(self.alert_rules.items()):
+            if not rules:
+                continue
+            sample = next(iter(rules.values()))
+            location = {"name": sample["city_name"], "lat": sample["lat"], "lon": sample["lon"]}
+            
+            current_data = await self.fetch_current_weather(location)
+            if not current_data or current_data.get("cod") != 200:
+                continue
+            forecast_data = None
+            if any(rule["metric"] == "rain" for rule in rules.values()):
+                forecast_data = await self.fetch_daily_forecast(location)
+            
+            for rule in list(rules.values()):
+                value = self.get_metric_value(rule["metric"], current_data, forecast_data)
+                if value is None:
+                    continue
+                matched = ALERT_OPERATORS[rule["op"]](value, rule["threshold"])
+                if matched == rule["triggered"]:
+                    continue  # 狀態未改變，已發送過的警報不重複發送
+                
+                rule["triggered"] = matched
+                changed.append((1 if matched else 0, rule["id"]))
+                if matched:
+                    await self.send_weather_alert(rule, value)
+        
+        if changed:
+            self.cursor.executemany("UPDATE weather_alert_rules SET triggered = ? WHERE id = ?", changed)
+            self.db.commit()
+
+    @check_weather_alerts.before_loop
+    async def before_check_weather_alerts(self):
+        await self.bot.wait_until_ready()
+
+    async def send_weather_alert(self, rule, value):
+        """發送天氣警報"""
+        channel = self.bot.get_channel(rule["channel_id"])
+        if not channel:
+            logger.warning(f"找不到警報頻道 {rule['channel_id']} (規則 {rule['id']})")
+            return
+        label, unit = ALERT_METRICS[rule["metric"]]
+        try:
+            await get_outbound().send(
+                channel,
+                content=f"⚠️ 天氣警報：{rule['city_name']} {label} {value:.1f}{unit} "
+                f"{rule['op']} {rule['threshold']:g}{unit}（規則 #{rule['id']}）"
+            )
+        except Exception as e:
+            logger.error(f"發送天氣警報失敗 (規則 {rule['id']}): {e}")
+
+    async def fetch_current_weather(self, city="Taipei"):
+        """獲取當前天氣資料"""
+        return await self.fetch_owm("weather", city)
+
+    async def fetch_daily_forecast(self, city="Taipei"):
+        """獲取每日天氣預報（5天3小時間隔）"""
+        return await self.fetch_owm("forecast", city)
+
     def get_weather_icon(self, weather_icon):
         """獲取天氣圖示"""
         icon_map = {
@@ -259,17 +521,19 @@ class WeatherCog(commands.Cog):
             return
         
         logger.info("開始執行每日天氣更新...")
+        outbound = get_outbound()
         for guild_id in guild_ids:
             try:
                 channel_data = self.get_weather_channels(guild_id)
                 channel_id = channel_data.get("channel_id")
-                cities = channel_data.get("cities", ["Taipei"])
+                cities = channel_data.get("cities")
                 channel = self.bot.get_channel(int(channel_id))
                 if not channel:
                     logger.warning(f"找不到頻道 {channel_id}")
                     continue
                 
                 for city in cities:
+                    city_name = city["name"]
                     # 獲取當前天氣和預報資料
                     current_weather = await self.fetch_current_weather(city)
                     forecast_data = await self.fetch_daily_forecast(city)
@@ -277,17 +541,18 @@ class WeatherCog(commands.Cog):
                     if current_weather:
                         # 使用新的綜合格式
                         embed = self.format_combined_weather_message(
-                            current_weather, forecast_data, city, is_daily=True
+                            current_weather, forecast_data, city_name, is_daily=True
                         )
                         if isinstance(embed, discord.Embed):
-                            await channel.send(embed=embed)
+                            await outbound.send(channel, PRIORITY_SCHEDULED, embed=embed)
                             temp = current_weather["main"]["temp"]
                             if temp < 10:  # 溫度提醒條件
-                                await channel.send(f"❄️ 提醒：{city} 溫度 {temp}°C 低於 10°C，請注意保暖！")
+                                await outbound.send(channel, PRIORITY_SCHEDULED,
+                                                    content=f"❄️ 提醒：{city_name} 溫度 {temp}°C 低於 10°C，請注意保暖！")
                         else:
-                            await channel.send(embed)
+                            await outbound.send(channel, PRIORITY_SCHEDULED, content=embed)
                     else:
-                        await channel.send(f"❌ 無法獲取 {city} 的天氣資料")
+                        await outbound.send(channel, PRIORITY_SCHEDULED, content=f"❌ 無法獲取 {city_name} 的天氣資料")
             except Exception as e:
                 logger.error(f"發送天氣更新失敗 (Guild: {guild_id}): {e}")
         logger.info("每日天氣更新完成")
@@ -304,9 +569,23 @@ class WeatherCog(commands.Cog):
         使用方式：!setweatherchannel #頻道 Taipei,Tokyo
         """
         guild_id = ctx.guild.id
-        city_list = [city.strip() for city in cities.split(",")]
-        self.save_weather_channels(guild_id, {"channel_id": channel.id, "cities": city_list})
-        await ctx.send(f"✅ 已為 {ctx.guild.name} 設定天氣預報：\n📍 頻道：{channel.mention}\n🏙️ 城市：{', '.join(city_list)}")
+        city_list = [city.strip() for city in cities.split(",") if city.strip()]
+        locations = []
+        failed = []
+        for city in city_list:
+            location = await self.geocode_city(city)
+            if location:
+                locations.append({"name": location["name"], "lat": location["lat"], "lon": location["lon"]})
+            else:
+                failed.append(city)
+        
+        if failed:
+            await ctx.send(f"❌ 找不到以下城市，請檢查拼寫：{', '.join(failed)}")
+            return
+        
+        self.save_weather_channels(guild_id, {"channel_id": channel.id, "cities": locations})
+        city_text = ", ".join(f"{loc['name']} ({loc['lat']}, {loc['lon']})" for loc in locations)
+        await ctx.send(f"✅ 已為 {ctx.guild.name} 設定天氣預報：\n📍 頻道：{channel.mention}\n🏙️ 城市：{city_text}")
 
     @commands.command(name="getweather")
     async def get_weather(self, ctx, *, city: str = None):
@@ -315,7 +594,7 @@ class WeatherCog(commands.Cog):
         if city:
             query_city = city.strip()
         elif self.get_weather_channels(guild_id):
-            query_city = self.get_weather_channels(guild_id).get("cities", ["Taipei"])[0]
+            query_city = self.get_weather_channels(guild_id).get("cities")[0]
         else:
             query_city = "Taipei"
         
@@ -327,24 +606,78 @@ class WeatherCog(commands.Cog):
                     await ctx.send(f"❌ 請在 {weather_channel.mention} 頻道中使用此命令")
                     return
         
+        location = await self.resolve_location(query_city)
+        if not location:
+            city_name = query_city["name"] if isinstance(query_city, dict) else query_city
+            await ctx.send(f"❌ 找不到城市 {city_name}，請檢查城市名稱或API Key")
+            return
+        city_name = location["name"]
+        
         # 獲取當前天氣和預報資料
-        current_weather = await self.fetch_current_weather(query_city)
-        forecast_data = await self.fetch_daily_forecast(query_city)
+        current_weather = await self.fetch_current_weather(location)
+        forecast_data = await self.fetch_daily_forecast(location)
         
         if current_weather:
             # 使用新的綜合格式
             embed = self.format_combined_weather_message(
-                current_weather, forecast_data, query_city, is_daily=False
+                current_weather, forecast_data, city_name, is_daily=False
             )
             if isinstance(embed, discord.Embed):
                 await ctx.send(embed=embed)
                 temp = current_weather["main"]["temp"]
                 if temp < 10:
-                    await ctx.send(f"❄️ 提醒：{query_city} 溫度 {temp}°C 低於 10°C，請注意保暖！")
+                    await ctx.send(f"❄️ 提醒：{city_name} 溫度 {temp}°C 低於 10°C，請注意保暖！")
             else:
                 await ctx.send(embed)
         else:
-            await ctx.send(f"❌ 無法獲取 {query_city} 的天氣資料，請檢查城市名稱或API Key")
+            await ctx.send(f"❌ 無法獲取 {city_name} 的天氣資料，請檢查城市名稱或API Key")
+
+    @commands.command(name="weatherchart")
+    async def weather_chart(self, ctx, city: str, days: int = 3):
+        """顯示城市的溫度與降雨趨勢圖
+        使用方式：!weatherchart Taipei 3
+        """
+        if days < 1 or days > 30:
+            await ctx.send("❌ 天數需介於 1-30 之間！")
+            return
+        
+        location = await self.resolve_location(city)
+        if not location:
+            await ctx.send(f"❌ 找不到城市 {city}，請檢查城市名稱或API Key")
+            return
+        
+        loc_key = self.get_loc_key(location)
+        now_ts = int(time.time())
+        cache_key = (loc_key, days, now_ts // 3600)
+        png = self.chart_cache.get(cache_key)
+        
+        if png is None:
+            start_ts = now_ts - days * 86400
+            samples = self.load_samples(loc_key, start_ts)
+            if samples is None:
+                # 尚無歷史資料時先抓一次預報
+                await self.fetch_daily_forecast(location)
+                samples = self.load_samples(loc_key, start_ts)
+            if samples is None:
+                await ctx.send(f"❌ 目前沒有 {location['name']} 的天氣資料")
+                return
+            
+            timestamps, temps, pops, rain = samples
+            stats = {
+                "min": float(temps.min()),
+                "max": float(temps.max()),
+                "mean": float(temps.mean()),
+                "rain": float(rain.sum())
+            }
+            try:
+                png = await render(render_weather_chart, location["name"], timestamps, temps, pops, rain, stats, now_ts)
+            except Exception as e:
+                logger.error(f"繪製天氣圖表失敗: {e}")
+                await ctx.send("❌ 繪製天氣圖表時出錯！")
+                return
+            self.chart_cache.put(cache_key, png)
+        
+        await ctx.send(file=discord.File(io.BytesIO(png), filename="weather_chart.png"))
 
     @commands.command(name="createvote")
     @commands.has_permissions(administrator=True)
@@ -415,7 +748,7 @@ class WeatherCog(commands.Cog):
         
         channel_data = self.get_weather_channels(guild_id)
         channel_id = channel_data.get("channel_id")
-        cities = channel_data.get("cities", ["Taipei"])
+        cities = channel_data.get("cities")
         
         channel = self.bot.get_channel(int(channel_id))
         if not channel:
@@ -423,8 +756,10 @@ class WeatherCog(commands.Cog):
             return
         
         await ctx.send("🔄 正在刷新天氣資料...")
+        outbound = get_outbound()
         
         for city in cities:
+            city_name = city["name"]
             # 獲取當前天氣和預報資料
             current_weather = await self.fetch_current_weather(city)
             forecast_data = await self.fetch_daily_forecast(city)
@@ -432,17 +767,18 @@ class WeatherCog(commands.Cog):
             if current_weather:
                 # 使用新的綜合格式
                 embed = self.format_combined_weather_message(
-                    current_weather, forecast_data, city, is_daily=True
+                    current_weather, forecast_data, city_name, is_daily=True
                 )
                 if isinstance(embed, discord.Embed):
-                    await channel.send(embed=embed)
+                    await outbound.send(channel, PRIORITY_SCHEDULED, embed=embed)
                     temp = current_weather["main"]["temp"]
                     if temp < 10:
-                        await channel.send(f"❄️ 提醒：{city} 溫度 {temp}°C 低於 10°C，請注意保暖！")
+                        await outbound.send(channel, PRIORITY_SCHEDULED,
+                                            content=f"❄️ 提醒：{city_name} 溫度 {temp}°C 低於 10°C，請注意保暖！")
                 else:
-                    await channel.send(embed)
+                    await outbound.send(channel, PRIORITY_SCHEDULED, content=embed)
             else:
-                await channel.send(f"❌ 無法獲取 {city} 的天氣資料")
+                await outbound.send(channel, PRIORITY_SCHEDULED, content=f"❌ 無法獲取 {city_name} 的天氣資料")
         
         await ctx.send("✅ 天氣資料刷新完成！")
 
@@ -455,13 +791,13 @@ class WeatherCog(commands.Cog):
         
         channel_data = self.get_weather_channels(guild_id)
         channel_id = channel_data.get("channel_id")
-        cities = channel_data.get("cities", ["Taipei"])
+        cities = channel_data.get("cities")
         
         channel = self.bot.get_channel(int(channel_id))
         if channel:
             embed = discord.Embed(title="🌤️ 天氣設定資訊", color=discord.Color.blue())
             embed.add_field(name="📍 頻道", value=channel.mention, inline=False)
-            embed.add_field(name="🏙️ 城市", value=", ".join(cities), inline=False)
+            embed.add_field(name="🏙️ 城市", value=", ".join(city["name"] for city in cities), inline=False)
             embed.add_field(name="⏰ 更新時間", value="每日 00:00", inline=False)
             embed.add_field(name="📊 資料內容", value="當前天氣 + 今日預報", inline=False)
             await ctx.send(embed=embed)
@@ -479,8 +815,90 @@ class WeatherCog(commands.Cog):
         else:
             await ctx.send("❌ 此伺服器沒有設定天氣功能")
 
+    @commands.group(name="weatheralert", invoke_without_command=True)
+    @commands.has_permissions(administrator=True)
+    async def weather_alert(self, ctx):
+        """天氣警報規則設定"""
+        embed = discord.Embed(title="⚠️ 天氣警報設定", color=discord.Color.orange())
+        embed.add_field(name="可用指令", value="""
+        `!weatheralert add <城市> <指標> <比較> <數值>` - 新增警報規則
+        `!weatheralert list` - 查看此伺服器的警報規則
+        `!weatheralert remove <規則ID>` - 移除警報規則
+        """, inline=False)
+        embed.add_field(name="指標", value="`temp` 溫度 (°C)、`rain` 降雨機率 (%)、`wind` 風速 (km/h)、`humidity` 濕度 (%)", inline=False)
+        embed.add_field(name="範例", value="`!weatheralert add Taipei temp < 10`", inline=False)
+        await ctx.send(embed=embed)
+
+    @weather_alert.command(name="add")
+    @commands.has_permissions(administrator=True)
+    async def add_weather_alert(self, ctx, city: str, metric: str, op: str, threshold: float):
+        """新增天氣警報規則，警報會發送到目前頻道"""
+        metric = metric.lower()
+        if metric not in ALERT_METRICS:
+            await ctx.send(f"❌ 無效指標，請使用：{', '.join(ALERT_METRICS)}")
+            return
+        if op not in ALERT_OPERATORS:
+            await ctx.send(f"❌ 無效比較符號，請使用：{' '.join(ALERT_OPERATORS)}")
+            return
+        
+        location = await self.resolve_location(city)
+        if not location:
+            await ctx.send(f"❌ 找不到城市 {city}，請檢查城市名稱或API Key")
+            return
+        
+        rule = {
+            "guild_id": ctx.guild.id, "channel_id": ctx.channel.id, "loc_key": self.get_loc_key(location),
+            "city_name": location["name"], "lat": location["lat"], "lon": location["lon"],
+            "metric": metric, "op": op, "threshold": threshold, "triggered": False
+        }
+        self.cursor.execute("""
+            INSERT INTO weather_alert_rules (guild_id, channel_id, loc_key, city_name, lat, lon, metric, op, threshold, triggered, created_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+        """, (rule["guild_id"], rule["channel_id"], rule["loc_key"], rule["city_name"], rule["lat"], rule["lon"],
+              metric, op, threshold, ctx.author.id))
+        self.db.commit()
+        rule["id"] = self.cursor.lastrowid
+        self.index_alert_rule(rule)
+        
+        label, unit = ALERT_METRICS[metric]
+        await ctx.send(f"✅ 已新增警報規則 #{rule['id']}：{location['name']} {label} {op} {threshold:g}{unit}，將通知 {ctx.channel.mention}")
+
+    @weather_alert.command(name="list")
+    @commands.has_permissions(administrator=True)
+    async def list_weather_alerts(self, ctx):
+        """列出此伺服器的警報規則"""
+        rules = [rule for rules in self.alert_rules.values() for rule in rules.values() if rule["guild_id"] == ctx.guild.id]
+        if not rules:
+            await ctx.send("❌ 此伺服器沒有設定天氣警報")
+            return
+        
+        lines = []
+        for rule in sorted(rules, key=lambda r: r["id"]):
+            label, unit = ALERT_METRICS[rule["metric"]]
+            channel = self.bot.get_channel(rule["channel_id"])
+            status = "🔴 觸發中" if rule["triggered"] else "🟢"
+            lines.append(f"#{rule['id']} {rule['city_name']} {label} {rule['op']} {rule['threshold']:g}{unit} → "
+                         f"{channel.mention if channel else '頻道已刪除'} {status}")
+        embed = discord.Embed(title="⚠️ 天氣警報規則", description="\n".join(lines), color=discord.Color.orange())
+        await ctx.send(embed=embed)
+
+    @weather_alert.command(name="remove")
+    @commands.has_permissions(administrator=True)
+    async def remove_weather_alert(self, ctx, rule_id: int):
+        """移除天氣警報規則"""
+        rule = next((rules[rule_id] for rules in self.alert_rules.values() if rule_id in rules), None)
+        if not rule or rule["guild_id"] != ctx.guild.id:
+            await ctx.send("❌ 找不到此警報規則")
+            return
+        
+        self.cursor.execute("DELETE FROM weather_alert_rules WHERE id = ?", (rule_id,))
+        self.db.commit()
+        self.unindex_alert_rule(rule)
+        await ctx.send(f"✅ 已移除警報規則 #{rule_id}")
+
     def cog_unload(self):
         self.daily_weather_update.cancel()
+        self.check_weather_alerts.cancel()
 
     @commands.Cog.listener()
     async def on_ready(self):
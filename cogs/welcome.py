@@ -1,7 +1,38 @@
 import discord
 from discord.ext import commands
 import os
+import io
+import time
+import asyncio
 import sqlite3
+from collections import defaultdict, deque
+from utils.ratelimit import RateLimiter, SlidingWindowCounter
+from utils.render import render, RenderCache
+from utils.http import get_session
+from utils.cards import render_welcome_card, prepare_card_background
+from utils.outbound import get_outbound
+
+JOIN_RATE_WINDOW = 60           # 計算加入速率的視窗（秒）
+DEFAULT_RAID_THRESHOLD = 10     # 視窗內加入人數達到此值時改為合併公告
+BATCH_INTERVAL = 30             # 合併公告的間隔（秒）
+BATCH_MENTION_LIMIT = 40        # 每則合併公告最多列出的成員數
+MEMBER_ACTION_RATE = (5, 5)     # 給予角色與私訊：每 5 秒最多 5 位成員
+CARD_BACKGROUND_DIR = "data/welcome_cards"
+CARD_LATENCY_SAMPLES = 100      # 每個伺服器保留的繪製耗時樣本數
+WELCOME_ADDED_COLUMNS = [
+    ("raid_threshold", "INTEGER"),
+    ("card_enabled", "INTEGER DEFAULT 0"),
+    ("card_background", "TEXT")
+]
+
+class GuildJoinState:
+    """單一伺服器的加入速率與待公告成員"""
+
+    def __init__(self):
+        self.joins = SlidingWindowCounter(JOIN_RATE_WINDOW)
+        self.batched = False
+        self.pending = []
+        self.flush_task = None
 
 class Welcome(commands.Cog):
     def __init__(self, bot):
@@ -15,21 +46,55 @@ class Welcome(commands.Cog):
                 welcome_message TEXT,
                 auto_role INTEGER,
                 dm_welcome INTEGER,
-                dm_message TEXT
+                dm_message TEXT,
+                raid_threshold INTEGER,
+                card_enabled INTEGER DEFAULT 0,
+                card_background TEXT
             )
         """)
+        # 舊資料表補上後來新增的欄位
+        columns = {row[1] for row in self.cursor.execute("PRAGMA table_info(welcome_config)")}
+        for column, definition in WELCOME_ADDED_COLUMNS:
+            if column not in columns:
+                self.cursor.execute(f"ALTER TABLE welcome_config ADD COLUMN {column} {definition}")
         self.db.commit()
+        self.join_states = {}
+        # 給予角色與私訊統一由背景 worker 依速率限制處理
+        self.member_actions = asyncio.Queue()
+        self.action_limiter = RateLimiter(*MEMBER_ACTION_RATE)
+        self.action_worker = None
+        self.actions_done = 0
+        # 頭像以 URL（含頭像雜湊）為鍵快取，換頭像後自然失效
+        self.avatar_cache = RenderCache(256)
+        self.card_latency = defaultdict(lambda: deque(maxlen=CARD_LATENCY_SAMPLES))
+
+    async def cog_load(self):
+        self.action_worker = asyncio.create_task(self.process_member_actions())
+
+    async def cog_unload(self):
+        if self.action_worker:
+            self.action_worker.cancel()
+        for state in self.join_states.values():
+            if state.flush_task:
+                state.flush_task.cancel()
 
     def get_welcome_config(self, guild_id):
         """獲取歡迎設定"""
-        self.cursor.execute("SELECT * FROM welcome_config WHERE guild_id = ?", (guild_id,))
+        self.cursor.execute("""
+            SELECT guild_id, welcome_channel, welcome_message, auto_role, dm_welcome, dm_message, raid_threshold,
+                   card_enabled, card_background
+            FROM welcome_config WHERE guild_id = ?
+        """, (guild_id,))
         result = self.cursor.fetchone()
         default_config = {
             "welcome_channel": None,
             "welcome_message": "🎉 歡迎 {member} 加入 **{server}**！\n希望你在這裡玩得開心！",
             "auto_role": None,
             "dm_welcome": False,
-            "dm_message": "歡迎加入 {server}！請記得閱讀規則頻道。"
+            "dm_message": "歡迎加入 {server}！請記得閱讀規則頻道。",
+            "raid_threshold": DEFAULT_RAID_THRESHOLD,
+            "card_enabled": False,
+            "card_background": None
         }
         if result:
             return {
@@ -37,26 +102,155 @@ class Welcome(commands.Cog):
                 "welcome_message": result[2],
                 "auto_role": result[3],
                 "dm_welcome": bool(result[4]),
-                "dm_message": result[5]
+                "dm_message": result[5],
+                "raid_threshold": result[6] or DEFAULT_RAID_THRESHOLD,
+                "card_enabled": bool(result[7]),
+                "card_background": result[8]
             }
         return default_config
 
     def save_welcome_config(self, guild_id, config):
         """儲存歡迎設定"""
         self.cursor.execute("""
-            INSERT OR REPLACE INTO welcome_config (guild_id, welcome_channel, welcome_message, auto_role, dm_welcome, dm_message)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT OR REPLACE INTO welcome_config (guild_id, welcome_channel, welcome_message, auto_role, dm_welcome, dm_message,
+                                                   raid_threshold, card_enabled, card_background)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (guild_id, config["welcome_channel"], config["welcome_message"], config["auto_role"],
-              1 if config["dm_welcome"] else 0, config["dm_message"]))
+              1 if config["dm_welcome"] else 0, config["dm_message"], config["raid_threshold"],
+              1 if config["card_enabled"] else 0, config["card_background"]))
         self.db.commit()
 
+    def get_join_state(self, guild_id):
+        state = self.join_states.get(guild_id)
+        if state is None:
+            state = self.join_states[guild_id] = GuildJoinState()
+        return state
+
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        """新成員加入事件"""
+        """新成員加入事件：角色與私訊排入佇列，公告依加入速率決定逐一或合併發送"""
         guild = member.guild
-        guild_id = guild.id
-        config = self.get_welcome_config(guild_id)
+        config = self.get_welcome_config(guild.id)
+        
+        if config["auto_role"] or config["dm_welcome"]:
+            self.member_actions.put_nowait((member, config))
         
+        state = self.get_join_state(guild.id)
+        join_rate = state.joins.hit()
+        if not config["welcome_channel"]:
+            return
+        
+        if not state.batched and join_rate >= config["raid_threshold"]:
+            state.batched = True
+            print(f"⚠️ {guild.name} 加入速率過高（{join_rate} 人/{JOIN_RATE_WINDOW} 秒），改為合併公告")
+        
+        if state.batched:
+            state.pending.append(member)
+            if state.flush_task is None or state.flush_task.done():
+                state.flush_task = asyncio.create_task(self.flush_join_batches(guild, state))
+            return
+        
+        await self.send_welcome(member, config)
+
+    async def send_welcome(self, member, config):
+        """發送單一成員的歡迎訊息"""
+        guild = member.guild
+        try:
+            channel = guild.get_channel(config["welcome_channel"])
+            if channel:
+                # 建立嵌入訊息
+                embed = discord.Embed(
+                    title="🎉 新成員加入！",
+                    description=config["welcome_message"].format(
+                        member=member.mention, 
+                        server=guild.name
+                    ),
+                    color=discord.Color.green()
+                )
+                embed.set_thumbnail(url=member.avatar.url if member.avatar else member.default_avatar.url)
+                embed.add_field(name="成員數", value=f"第 {guild.member_count} 位成員", inline=True)
+                embed.add_field(name="加入時間", value=member.joined_at.strftime("%Y/%m/%d %H:%M:%S"), inline=True)
+                embed.set_footer(text=f"ID: {member.id}")
+                
+                card = await self.create_welcome_card(member, config) if config["card_enabled"] else None
+                if card:
+                    embed.set_image(url="attachment://welcome.png")
+                    await get_outbound().send(channel, embed=embed, file=discord.File(io.BytesIO(card), filename="welcome.png"))
+                else:
+                    await get_outbound().send(channel, embed=embed)
+        except Exception as e:
+            print(f"⚠️ 無法發送歡迎訊息：{e}")
+
+    async def fetch_avatar(self, member):
+        """透過共用 HTTP 連線取得頭像，並以 LRU 快取"""
+        url = member.display_avatar.replace(size=256, format="png").url
+        data = self.avatar_cache.get(url)
+        if data is None:
+            try:
+                async with get_session().get(url) as response:
+                    if response.status != 200:
+                        return None
+                    data = await response.read()
+            except Exception as e:
+                print(f"⚠️ 無法取得 {member.name} 的頭像：{e}")
+                return None
+            self.avatar_cache.put(url, data)
+        return data
+
+    async def create_welcome_card(self, member, config):
+        """在繪圖行程池中產生歡迎卡片並記錄耗時；失敗時回傳 None，改發送一般歡迎訊息"""
+        start = time.perf_counter()
+        try:
+            avatar = await self.fetch_avatar(member)
+            card = await render(render_welcome_card, config["card_background"], avatar,
+                                member.display_name, f"第 {member.guild.member_count} 位成員")
+        except Exception as e:
+            print(f"⚠️ 無法產生歡迎卡片：{e}")
+            return None
+        self.card_latency[member.guild.id].append((time.perf_counter() - start) * 1000)
+        return card
+
+    async def flush_join_batches(self, guild, state):
+        """合併模式下每隔一段時間發送一則彙整公告，加入速率回落後恢復逐一公告"""
+        while state.pending:
+            await asyncio.sleep(BATCH_INTERVAL)
+            members, state.pending = state.pending, []
+            config = self.get_welcome_config(guild.id)
+            channel = guild.get_channel(config["welcome_channel"]) if config["welcome_channel"] else None
+            if channel and members:
+                mentions = " ".join(m.mention for m in members[:BATCH_MENTION_LIMIT])
+                if len(members) > BATCH_MENTION_LIMIT:
+                    mentions += f" 以及其他 {len(members) - BATCH_MENTION_LIMIT} 位成員"
+                embed = discord.Embed(
+                    title=f"🎉 {len(members)} 位新成員加入！",
+                    description=config["welcome_message"].format(member=mentions, server=guild.name),
+                    color=discord.Color.green()
+                )
+                embed.add_field(name="成員數", value=f"目前共 {guild.member_count} 位成員", inline=True)
+                embed.set_footer(text=f"加入人數較多，每 {BATCH_INTERVAL} 秒合併公告一次")
+                try:
+                    await get_outbound().send(channel, embed=embed)
+                except Exception as e:
+                    print(f"⚠️ 無法發送合併歡迎訊息：{e}")
+            if state.joins.count() < config["raid_threshold"]:
+                state.batched = False
+        state.flush_task = None
+
+    async def process_member_actions(self):
+        """依速率限制依序為新成員給予角色及發送私訊"""
+        while True:
+            member, config = await self.member_actions.get()
+            try:
+                await self.action_limiter.acquire()
+                await self.apply_member_actions(member, config)
+                self.actions_done += 1
+            except Exception as e:
+                print(f"⚠️ 處理新成員 {member.name} 時發生錯誤：{e}")
+            finally:
+                self.member_actions.task_done()
+
+    async def apply_member_actions(self, member, config):
+        guild = member.guild
         # 自動給予角色
         if config["auto_role"]:
             try:
@@ -67,29 +261,6 @@ class Welcome(commands.Cog):
             except Exception as e:
                 print(f"⚠️ 無法為 {member.name} 添加角色：{e}")
 
-        # 發送歡迎訊息到指定頻道
-        if config["welcome_channel"]:
-            try:
-                channel = guild.get_channel(config["welcome_channel"])
-                if channel:
-                    # 建立嵌入訊息
-                    embed = discord.Embed(
-                        title="🎉 新成員加入！",
-                        description=config["welcome_message"].format(
-                            member=member.mention, 
-                            server=guild.name
-                        ),
-                        color=discord.Color.green()
-                    )
-                    embed.set_thumbnail(url=member.avatar.url if member.avatar else member.default_avatar.url)
-                    embed.add_field(name="成員數", value=f"第 {guild.member_count} 位成員", inline=True)
-                    embed.add_field(name="加入時間", value=member.joined_at.strftime("%Y/%m/%d %H:%M:%S"), inline=True)
-                    embed.set_footer(text=f"ID: {member.id}")
-                    
-                    await channel.send(embed=embed)
-            except Exception as e:
-                print(f"⚠️ 無法發送歡迎訊息：{e}")
-
         # 發送私訊歡迎訊息
         if config["dm_welcome"]:
             try:
@@ -120,6 +291,10 @@ class Welcome(commands.Cog):
         `!welcome message <訊息>` - 設定歡迎訊息
         `!welcome dm <on/off>` - 開啟/關閉私訊歡迎
         `!welcome test` - 測試歡迎訊息
+        `!welcome raid <人數>` - 設定每分鐘加入多少人時改為合併公告
+        `!welcome status` - 查看加入速率與佇列狀態
+        `!welcome card <on/off>` - 開啟/關閉歡迎卡片
+        `!welcome card background` - 上傳圖片作為卡片背景（不附圖片則恢復預設）
         """, inline=False)
         
         await ctx.send(embed=embed)
@@ -187,6 +362,95 @@ class Welcome(commands.Cog):
         
         self.save_welcome_config(guild_id, config)
 
+    @welcome.command(name="raid")
+    @commands.has_permissions(manage_guild=True)
+    async def set_raid_threshold(self, ctx, joins_per_minute: int):
+        """設定改為合併公告的加入速率"""
+        if joins_per_minute < 2:
+            await ctx.send("❌ 人數至少需為 2")
+            return
+        
+        config = self.get_welcome_config(ctx.guild.id)
+        config["raid_threshold"] = joins_per_minute
+        self.save_welcome_config(ctx.guild.id, config)
+        await ctx.send(f"✅ 每 {JOIN_RATE_WINDOW} 秒加入達 {joins_per_minute} 人時，將改為每 {BATCH_INTERVAL} 秒合併公告一次")
+
+    @welcome.command(name="status")
+    @commands.has_permissions(manage_guild=True)
+    async def welcome_status(self, ctx):
+        """查看加入速率與佇列狀態"""
+        config = self.get_welcome_config(ctx.guild.id)
+        state = self.get_join_state(ctx.guild.id)
+        
+        embed = discord.Embed(title="📊 歡迎系統狀態", color=discord.Color.blue())
+        embed.add_field(name="加入速率", value=f"{state.joins.count()} 人 / {JOIN_RATE_WINDOW} 秒", inline=True)
+        embed.add_field(name="合併門檻", value=f"{config['raid_threshold']} 人 / {JOIN_RATE_WINDOW} 秒", inline=True)
+        embed.add_field(name="公告模式", value="📦 合併公告" if state.batched else "👤 逐一公告", inline=True)
+        embed.add_field(name="待公告成員", value=f"{len(state.pending)} 位", inline=True)
+        embed.add_field(name="角色/私訊佇列", value=f"{self.member_actions.qsize()} 位（所有伺服器）", inline=True)
+        embed.add_field(name="已處理", value=f"{self.actions_done} 位", inline=True)
+        
+        await ctx.send(embed=embed)
+
+    @welcome.group(name="card", invoke_without_command=True)
+    @commands.has_permissions(manage_guild=True)
+    async def welcome_card(self, ctx, status: str = None):
+        """開啟/關閉歡迎卡片，不帶參數時顯示卡片繪製耗時"""
+        config = self.get_welcome_config(ctx.guild.id)
+        if status is None:
+            samples = sorted(self.card_latency[ctx.guild.id])
+            embed = discord.Embed(title="🖼️ 歡迎卡片", color=discord.Color.blue())
+            embed.add_field(name="狀態", value="✅ 開啟" if config["card_enabled"] else "❌ 關閉", inline=True)
+            embed.add_field(name="背景", value="自訂圖片" if config["card_background"] else "預設", inline=True)
+            if samples:
+                p50 = samples[len(samples) // 2]
+                p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+                latency = f"p50 {p50:.0f} ms / p95 {p95:.0f} ms / 最大 {samples[-1]:.0f} ms（{len(samples)} 次）"
+            else:
+                latency = "尚無資料"
+            embed.add_field(name="繪製耗時", value=latency, inline=False)
+            await ctx.send(embed=embed)
+            return
+        
+        if status.lower() in ["on", "開啟", "true", "1"]:
+            config["card_enabled"] = True
+            await ctx.send("✅ 已開啟歡迎卡片")
+        elif status.lower() in ["off", "關閉", "false", "0"]:
+            config["card_enabled"] = False
+            await ctx.send("❌ 已關閉歡迎卡片")
+        else:
+            await ctx.send("❌ 請使用 `on` 或 `off`")
+            return
+        
+        self.save_welcome_config(ctx.guild.id, config)
+
+    @welcome_card.command(name="background")
+    @commands.has_permissions(manage_guild=True)
+    async def set_card_background(self, ctx):
+        """以附加的圖片設定卡片背景"""
+        config = self.get_welcome_config(ctx.guild.id)
+        if not ctx.message.attachments:
+            config["card_background"] = None
+            self.save_welcome_config(ctx.guild.id, config)
+            await ctx.send("✅ 已恢復預設卡片背景")
+            return
+        
+        attachment = ctx.message.attachments[0]
+        if not (attachment.content_type or "").startswith("image/"):
+            await ctx.send("❌ 請附加圖片檔案")
+            return
+        
+        try:
+            data = await attachment.read()
+            path = await render(prepare_card_background, data, f"{CARD_BACKGROUND_DIR}/{ctx.guild.id}.png")
+        except Exception as e:
+            await ctx.send(f"❌ 無法處理背景圖片：{e}")
+            return
+        
+        config["card_background"] = path
+        self.save_welcome_config(ctx.guild.id, config)
+        await ctx.send("✅ 已更新歡迎卡片背景")
+
     @welcome.command(name="test")
     @commands.has_permissions(manage_guild=True)
     async def test_welcome(self, ctx):
@@ -219,7 +483,12 @@ class Welcome(commands.Cog):
         embed.add_field(name="加入時間", value="測試時間", inline=True)
         embed.set_footer(text=f"ID: {member.id} | 這是測試訊息")
         
-        await channel.send(embed=embed)
+        card = await self.create_welcome_card(member, config) if config["card_enabled"] else None
+        if card:
+            embed.set_image(url="attachment://welcome.png")
+            await channel.send(embed=embed, file=discord.File(io.BytesIO(card), filename="welcome.png"))
+        else:
+            await channel.send(embed=embed)
         await ctx.send(f"✅ 測試訊息已發送到 {channel.mention}")
 
     @commands.Cog.listener()
@@ -240,7 +509,7 @@ class Welcome(commands.Cog):
                     embed.add_field(name="剩餘成員數", value=f"{member.guild.member_count} 位成員", inline=True)
                     embed.set_footer(text=f"ID: {member.id}")
                     
-                    await channel.send(embed=embed)
+                    await get_outbound().send(channel, embed=embed)
             except Exception as e:
                 print(f"⚠️ 無法發送離開訊息：{e}")
 
@@ -28,13 +28,58 @@ def create_tables():
     # Vote 表格（預留，無對應 JSON）
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS polls (
-            id TEXT PRIMARY KEY,
-            question TEXT,
-            options TEXT,
-            voters TEXT,
+            poll_id TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
             creator TEXT,
             creator_id INTEGER,
-            active INTEGER DEFAULT 1
+            active INTEGER DEFAULT 1,
+            total_votes INTEGER DEFAULT 0,
+            closes_at REAL,
+            channel_id INTEGER,
+            message_id INTEGER,
+            mode TEXT DEFAULT 'plurality',
+            guild_id INTEGER,
+            created_at REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_polls_guild_active ON polls (guild_id, active, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_polls_guild_creator ON polls (guild_id, creator_id, active, created_at)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_options (
+            poll_id TEXT,
+            option_index INTEGER,
+            text TEXT,
+            votes INTEGER DEFAULT 0,
+            score REAL DEFAULT 0,
+            PRIMARY KEY (poll_id, option_index)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_votes (
+            poll_id TEXT,
+            user_id INTEGER,
+            option_index INTEGER,
+            voted_at TEXT,
+            weight REAL DEFAULT 1,
+            PRIMARY KEY (poll_id, user_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_ballots (
+            poll_id TEXT,
+            user_id INTEGER,
+            ranks BLOB,
+            weight REAL DEFAULT 1,
+            cast_at TEXT,
+            PRIMARY KEY (poll_id, user_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS poll_role_weights (
+            poll_id TEXT,
+            role_id INTEGER,
+            weight REAL,
+            PRIMARY KEY (poll_id, role_id)
         )
     """)
 
@@ -46,7 +91,10 @@ def create_tables():
             welcome_message TEXT,
             auto_role INTEGER,
             dm_welcome INTEGER DEFAULT 0,
-            dm_message TEXT
+            dm_message TEXT,
+            raid_threshold INTEGER,
+            card_enabled INTEGER DEFAULT 0,
+            card_background TEXT
         )
     """)
 
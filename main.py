@@ -2,6 +2,9 @@ import os
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
+from utils.render import warm_render_pool, shutdown_render_pool
+from utils.http import close_session
+from utils.db_writer import close_db_writers
 
 # 讀取 .env 中的變數
 load_dotenv()
@@ -62,7 +65,13 @@ async def load_all_cogs():
 async def main():
     async with bot:
         await load_all_cogs()
-        await bot.start(TOKEN)
+        await warm_render_pool()
+        try:
+            await bot.start(TOKEN)
+        finally:
+            shutdown_render_pool()
+            await close_session()
+            await close_db_writers()
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,102 @@
+import asyncio
+import sqlite3
+import types
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("numpy")
+pytest.importorskip("matplotlib")
+
+from cogs import vote
+
+@pytest.fixture(autouse=True)
+def memory_db(monkeypatch):
+    monkeypatch.setattr(vote, "connection", sqlite3.connect(":memory:"), raising=False)
+    vote.init_poll_tables()
+
+def test_open_poll_slash_command_shape():
+    # /createpoll 建立的資料格式
+    poll = {
+        'id': "1700000000",
+        'question': "午餐吃什麼？",
+        'options': [{'text': opt, 'votes': 0} for opt in ("飯", "麵")],
+        'creator': "tester",
+        'creator_id': 1,
+        'active': True,
+        'guild_id': 10,
+        'closes_at': None,
+        'mode': 'ranked'
+    }
+    embed = vote.open_poll(poll)
+    assert len(embed.fields) == 2
+    assert embed.description
+
+def test_open_poll_prefix_command_shape():
+    # !poll 建立的資料格式（沒有 mode 與 closes_at）
+    poll = {
+        'id': "1700000001",
+        'question': "晚餐吃什麼？",
+        'options': [{'text': opt, 'votes': 0} for opt in ("飯", "麵", "粥")],
+        'creator': "tester",
+        'creator_id': 1,
+        'active': True,
+        'guild_id': None
+    }
+    embed = vote.open_poll(poll)
+    assert [field.name.split(" ", 1)[1] for field in embed.fields] == ["飯", "麵", "粥"]
+
+def test_prefix_command_creates_two_polls_in_a_row():
+    sent = []
+
+    async def send(**kwargs):
+        message = types.SimpleNamespace(id=900 + len(sent), channel=types.SimpleNamespace(id=50))
+        sent.append((message, kwargs))
+        return message
+
+    async def create_two():
+        # poll_command 不使用 self；不建立真正的 Vote，避免其 __del__ 關閉共用的資料庫連線
+        cog = types.SimpleNamespace()
+        for message_id in (1001, 1002):
+            ctx = types.SimpleNamespace(
+                message=types.SimpleNamespace(id=message_id),
+                author=types.SimpleNamespace(id=1, display_name="tester"),
+                guild=None,
+                send=send
+            )
+            await vote.Vote.poll_command.callback(cog, ctx, "同一秒的投票", options="是|否")
+
+    asyncio.run(create_two())
+    assert len(sent) == 2
+    assert vote.get_poll("1001") and vote.get_poll("1002")
+    assert vote.get_poll("1002")['message_id'] == 901
+
+def test_poll_refresher_drops_stale_refresh_times(monkeypatch):
+    edits = []
+
+    class FakeOutbound:
+        async def edit(self, message, **kwargs):
+            edits.append(message)
+
+    monkeypatch.setattr(vote, "get_outbound", lambda: FakeOutbound())
+    vote.open_poll({
+        'id': "5",
+        'question': "刷新",
+        'options': [{'text': opt, 'votes': 0} for opt in ("是", "否")],
+        'creator': "tester",
+        'creator_id': 1,
+        'active': True,
+        'guild_id': None
+    })
+
+    async def refresh():
+        refresher = vote.PollRefresher(interval=0.01)
+        loop = asyncio.get_running_loop()
+        refresher._last_refresh["closed-long-ago"] = loop.time() - 1
+        refresher.schedule("5", "message")
+        await refresher._tasks["5"]
+        return refresher
+
+    refresher = asyncio.run(refresh())
+    assert edits == ["message"]
+    assert list(refresher._last_refresh) == ["5"]
@@ -0,0 +1 @@
+# 各 Cog 共用的工具模組（不會被 main.py 當成 Cog 載入）
@@ -0,0 +1,164 @@
+import re
+import time
+from collections import defaultdict, deque
+
+# 預先編譯的連結與邀請格式，每則訊息只需執行一次搜尋
+INVITE_PATTERN = re.compile(r"(?:discord(?:app)?\.com/invite|discord\.gg|dsc\.gg)/[\w-]+", re.IGNORECASE)
+LINK_PATTERN = re.compile(r"https?://\S+|\bwww\.\S+", re.IGNORECASE)
+
+CAPS_MIN_LENGTH = 10        # 少於此字母數的訊息不檢查大寫比例
+CAPS_RATIO = 0.7            # 大寫字母比例超過此值視為全大寫訊息
+SPAM_WINDOW = 30            # 大寫與提及次數的滑動視窗（秒）
+LATENCY_SAMPLES = 2000      # 保留的檢查耗時樣本數
+
+DEFAULT_AUTOMOD_CONFIG = {
+    "enabled": False,
+    "block_links": False,
+    "block_invites": True,
+    "caps_limit": 3,        # 視窗內全大寫訊息達此數量即處理，0 為停用
+    "mention_limit": 10,    # 視窗內提及人數達此數量即處理，0 為停用
+    "spam_timeout": 5       # 洗版或重複訊息時禁言的分鐘數，0 為只刪除訊息
+}
+
+def _trie_pattern(terms):
+    """把詞彙建成字首樹再轉成正規表示式，共用字首只比對一次
+
+    直接用 a|b|c… 串接上千個詞時，每個位置都要逐一嘗試所有分支；
+    依字首合併後每個字元只需走一條分支，效果接近 Aho-Corasick。
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        branches = []
+        singles = []
+        for char in sorted(key for key in node if key):
+            child = build(node[char])
+            if child is None:
+                singles.append(re.escape(char))
+            else:
+                branches.append(re.escape(char) + child)
+        if not branches and not singles:
+            return None
+        if singles:
+            branches.append(singles[0] if len(singles) == 1 else "[" + "".join(singles) + "]")
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # 此節點本身就是某個詞的結尾時，後續部分為可選（貪婪比對，優先取較長的詞）
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class TermMatcher:
+    """把禁用詞編譯成單一的字首樹正規表示式，只有清單改變時才重新編譯"""
+
+    def __init__(self, terms):
+        self.terms = frozenset(term.lower() for term in terms if term)
+        self.pattern = re.compile(_trie_pattern(self.terms), re.IGNORECASE) if self.terms else None
+
+    def search(self, text):
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(text)
+        return match.group(0) if match else None
+
+class SlidingWindowSum:
+    """最近 window 秒內的數值總和"""
+
+    __slots__ = ("window", "events", "total")
+
+    def __init__(self, window):
+        self.window = window
+        self.events = deque()
+        self.total = 0
+
+    def add(self, now, amount=1):
+        self.events.append((now, amount))
+        self.total += amount
+        while self.events and now - self.events[0][0] > self.window:
+            self.total -= self.events.popleft()[1]
+        return self.total
+
+class AutomodEngine:
+    """每則訊息的自動審核：禁用詞、邀請、連結、大量大寫與大量提及"""
+
+    def __init__(self):
+        self.matchers = {}
+        self.configs = {}
+        self.caps_windows = defaultdict(lambda: SlidingWindowSum(SPAM_WINDOW))
+        self.mention_windows = defaultdict(lambda: SlidingWindowSum(SPAM_WINDOW))
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.checks = 0
+
+    def set_terms(self, guild_id, terms):
+        """更新伺服器的禁用詞；清單沒有改變時不重新編譯"""
+        current = self.matchers.get(guild_id)
+        if current is None or current.terms != frozenset(term.lower() for term in terms):
+            self.matchers[guild_id] = TermMatcher(terms)
+
+    def get_terms(self, guild_id):
+        matcher = self.matchers.get(guild_id)
+        return sorted(matcher.terms) if matcher else []
+
+    def set_config(self, guild_id, config):
+        self.configs[guild_id] = config
+
+    def get_config(self, guild_id):
+        return self.configs.get(guild_id, DEFAULT_AUTOMOD_CONFIG)
+
+    def check(self, guild_id, user_id, content, mention_count=0):
+        """檢查訊息，違規時回傳原因，否則回傳 None"""
+        config = self.configs.get(guild_id)
+        if not config or not config["enabled"]:
+            return None
+        self.checks += 1
+        if self.checks % 1000 == 0:
+            self.prune()
+        start = time.perf_counter()
+        try:
+            return self._check(config, guild_id, user_id, content, mention_count)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    def _check(self, config, guild_id, user_id, content, mention_count):
+        matcher = self.matchers.get(guild_id)
+        if matcher:
+            term = matcher.search(content)
+            if term:
+                return f"包含禁用詞「{term}」"
+
+        if config["block_invites"] and INVITE_PATTERN.search(content):
+            return "包含伺服器邀請連結"
+        if config["block_links"] and LINK_PATTERN.search(content):
+            return "包含連結"
+
+        now = time.monotonic()
+        key = (guild_id, user_id)
+        if config["mention_limit"] and mention_count:
+            if self.mention_windows[key].add(now, mention_count) >= config["mention_limit"]:
+                return f"{SPAM_WINDOW} 秒內提及過多成員"
+
+        if config["caps_limit"] and len(content) >= CAPS_MIN_LENGTH:
+            letters = [c for c in content if c.isalpha() and c.isascii()]
+            if len(letters) >= CAPS_MIN_LENGTH and sum(c.isupper() for c in letters) / len(letters) >= CAPS_RATIO:
+                if self.caps_windows[key].add(now) >= config["caps_limit"]:
+                    return f"{SPAM_WINDOW} 秒內多次發送全大寫訊息"
+        return None
+
+    def prune(self):
+        """移除視窗已過期的使用者計數器，避免記憶體隨使用者數量成長"""
+        now = time.monotonic()
+        for windows in (self.caps_windows, self.mention_windows):
+            for key in [key for key, window in windows.items() if now - window.events[-1][0] > SPAM_WINDOW]:
+                del windows[key]
+
+    def latency_percentiles(self):
+        """回傳 (p50, p99, 最大值)，單位為毫秒"""
+        if not self.latencies:
+            return None
+        samples = sorted(self.latencies)
+        pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+        return pick(0.5), pick(0.99), samples[-1] * 1000
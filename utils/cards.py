@@ -0,0 +1,85 @@
+import io
+import os
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+# 此模組的函式會在繪圖行程中執行；背景與字型在每個行程中只解碼一次並快取
+CARD_SIZE = (1024, 320)
+AVATAR_SIZE = 220
+CARD_BACKGROUND = (44, 47, 51)
+CARD_FONTS = [os.getenv("WELCOME_CARD_FONT", ""), "msjh.ttc", "NotoSansCJK-Regular.ttc", "wqy-microhei.ttc", "DejaVuSans.ttf"]
+
+_backgrounds = {}  # 背景路徑 -> (修改時間, 已縮放的 RGBA 圖片)
+_fonts = {}
+_avatar_mask = None
+
+def _load_font(size):
+    font = _fonts.get(size)
+    if font is None:
+        for name in CARD_FONTS:
+            if not name:
+                continue
+            try:
+                font = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        else:
+            font = ImageFont.load_default()
+        _fonts[size] = font
+    return font
+
+def _load_background(path):
+    """讀取伺服器的背景圖，檔案未變更時沿用已解碼的圖片"""
+    if not path or not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _backgrounds.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with Image.open(path) as image:
+        background = ImageOps.fit(image.convert("RGBA"), CARD_SIZE)
+    _backgrounds[path] = (mtime, background)
+    return background
+
+def _get_avatar_mask():
+    global _avatar_mask
+    if _avatar_mask is None:
+        _avatar_mask = Image.new("L", (AVATAR_SIZE, AVATAR_SIZE), 0)
+        ImageDraw.Draw(_avatar_mask).ellipse((0, 0, AVATAR_SIZE, AVATAR_SIZE), fill=255)
+    return _avatar_mask
+
+def prepare_card_background(data, path):
+    """把上傳的背景圖裁切成卡片大小後存檔，之後每次繪製只需讀取已處理好的檔案"""
+    with Image.open(io.BytesIO(data)) as image:
+        background = ImageOps.fit(image.convert("RGB"), CARD_SIZE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    background.save(path, format="PNG")
+    return path
+
+def render_welcome_card(background_path, avatar, name, subtitle):
+    """繪製歡迎卡片（頭像、名稱、成員編號），回傳 PNG bytes"""
+    background = _load_background(background_path)
+    card = background.copy() if background else Image.new("RGBA", CARD_SIZE, CARD_BACKGROUND + (255,))
+
+    # 半透明遮罩讓文字在任何背景上都清楚
+    overlay = Image.new("RGBA", CARD_SIZE, (0, 0, 0, 0))
+    ImageDraw.Draw(overlay).rounded_rectangle((20, 20, CARD_SIZE[0] - 20, CARD_SIZE[1] - 20), radius=24, fill=(0, 0, 0, 140))
+    card = Image.alpha_composite(card, overlay)
+
+    top = (CARD_SIZE[1] - AVATAR_SIZE) // 2
+    if avatar:
+        with Image.open(io.BytesIO(avatar)) as image:
+            avatar_image = ImageOps.fit(image.convert("RGBA"), (AVATAR_SIZE, AVATAR_SIZE))
+        card.paste(avatar_image, (50, top), _get_avatar_mask())
+    draw = ImageDraw.Draw(card)
+    draw.ellipse((46, top - 4, 54 + AVATAR_SIZE, top + AVATAR_SIZE + 4), outline=(255, 255, 255), width=4)
+
+    text_left = 50 + AVATAR_SIZE + 40
+    draw.text((text_left, 70), "歡迎加入！", font=_load_font(36), fill=(153, 170, 181))
+    draw.text((text_left, 120), name[:24], font=_load_font(64), fill=(255, 255, 255))
+    draw.text((text_left, 210), subtitle, font=_load_font(32), fill=(255, 234, 167))
+
+    buffer = io.BytesIO()
+    card.convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
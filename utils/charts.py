@@ -0,0 +1,141 @@
+import io
+from datetime import datetime
+
+import matplotlib
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# 此模組的函式會在繪圖行程中執行，只使用物件導向的 Figure API，不碰 pyplot 全域狀態
+matplotlib.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'Arial Unicode MS', 'DejaVu Sans']
+matplotlib.rcParams['axes.unicode_minus'] = False
+
+BACKGROUND = '#2C2F33'
+
+def _figure_to_png(fig, dpi=150):
+    FigureCanvasAgg(fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', facecolor=BACKGROUND, dpi=dpi)
+    return buffer.getvalue()
+
+def _style_axes(ax):
+    ax.set_facecolor(BACKGROUND)
+    ax.tick_params(colors='white')
+    for side in ('bottom', 'left', 'right'):
+        ax.spines[side].set_color('white')
+    ax.spines['top'].set_visible(False)
+
+def render_weather_chart(city, timestamps, temps, pops, rain, stats, now_ts):
+    """繪製溫度折線與降雨長條圖，回傳 PNG bytes"""
+    fig = Figure(figsize=(12, 6))
+    fig.patch.set_facecolor(BACKGROUND)
+    ax = fig.add_subplot(1, 1, 1)
+    _style_axes(ax)
+
+    times = [datetime.fromtimestamp(ts) for ts in timestamps]
+    ax.plot(times, temps, color='#FF6B6B', linewidth=2, marker='o', markersize=3, label='溫度 (°C)')
+    ax.axhline(stats["mean"], color='#FFEAA7', linestyle='--', linewidth=1, label=f'平均 {stats["mean"]:.1f}°C')
+    ax.set_ylabel('溫度 (°C)', color='white')
+
+    rain_ax = ax.twinx()
+    rain_ax.bar(times, rain, width=0.1, color='#45B7D1', alpha=0.6, label='降雨量 (mm)')
+    rain_ax.plot(times, pops * 100, color='#4ECDC4', linewidth=1, linestyle=':', label='降雨機率 (%)')
+    rain_ax.set_ylabel('降雨量 (mm) / 降雨機率 (%)', color='white')
+    rain_ax.tick_params(colors='white')
+    rain_ax.set_ylim(bottom=0)
+
+    if timestamps[0] <= now_ts <= timestamps[-1]:
+        ax.axvline(datetime.fromtimestamp(now_ts), color='#99AAB5', linewidth=1)
+
+    lines, labels = ax.get_legend_handles_labels()
+    rain_lines, rain_labels = rain_ax.get_legend_handles_labels()
+    legend = ax.legend(lines + rain_lines, labels + rain_labels, loc='upper left', facecolor=BACKGROUND)
+    for text in legend.get_texts():
+        text.set_color('white')
+
+    ax.set_title(f'{city} 溫度與降雨趨勢', color='white', fontsize=16, pad=20)
+    fig.text(0.5, 0.02,
+             f'最低 {stats["min"]:.1f}°C | 最高 {stats["max"]:.1f}°C | 平均 {stats["mean"]:.1f}°C | 總降雨 {stats["rain"]:.1f} mm',
+             ha='center', color='#99AAB5')
+    fig.autofmt_xdate()
+    fig.tight_layout(rect=(0, 0.05, 1, 1))
+    return _figure_to_png(fig)
+
+POLL_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7',
+               '#DDA0DD', '#98D8C8', '#F7DC6F', '#AED6F1', '#F8C471']
+
+def render_poll_chart(question, options, votes, closed=False):
+    """繪製投票結果橫向長條圖，回傳 PNG bytes"""
+    fig = Figure(figsize=(12, 8))
+    fig.patch.set_facecolor(BACKGROUND)
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_facecolor(BACKGROUND)
+    total_votes = sum(votes)
+
+    if total_votes == 0:
+        # 如果沒有投票，顯示空圖表
+        ax.text(0.5, 0.5, '尚無投票', ha='center', va='center',
+                transform=ax.transAxes, color='white', fontsize=20)
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1)
+        ax.set_xticks([])
+        ax.set_yticks([])
+    else:
+        bars = ax.barh(range(len(options)), votes, color=POLL_COLORS[:len(options)])
+        ax.set_yticks(range(len(options)))
+        ax.set_yticklabels(options, color='white')
+        ax.set_xlabel('投票數', color='white')
+
+        # 在長條上顯示數值和百分比
+        for bar, vote in zip(bars, votes):
+            percentage = (vote / total_votes) * 100
+            ax.text(bar.get_width() + max(votes) * 0.01, bar.get_y() + bar.get_height() / 2,
+                    f'{vote:g} ({percentage:.1f}%)',
+                    va='center', color='white', fontweight='bold')
+        _style_axes(ax)
+        ax.spines['right'].set_visible(False)
+
+    title = f'🔒 {question}（已結束）' if closed else question
+    ax.set_title(title, color='white', fontsize=16, pad=20)
+    fig.text(0.5, 0.02, f'總投票數: {total_votes:g}', ha='center', color='#99AAB5')
+    fig.tight_layout(rect=(0, 0.04, 1, 1))
+    return _figure_to_png(fig)
+
+def render_ranked_chart(question, options, ballots, weights, closed=False):
+    """以即時決選制計票，並把每一輪的得票畫成一列橫向長條圖，回傳 PNG bytes
+
+    ballots 為所有選票 ranks 串接後的 bytes，weights 為每張選票的權重。
+    """
+    from utils.tally import instant_runoff
+
+    option_count = len(options)
+    matrix = np.frombuffer(ballots, dtype=np.uint8).reshape(-1, option_count)
+    if len(matrix) == 0:
+        return render_poll_chart(question, options, [0] * option_count, closed)
+    rounds, losers, winner = instant_runoff(matrix, weights, option_count)
+
+    fig = Figure(figsize=(12, 3 + 2.2 * len(rounds)))
+    fig.patch.set_facecolor(BACKGROUND)
+    eliminated = np.zeros(option_count, dtype=bool)
+    for number, counts in enumerate(rounds, start=1):
+        ax = fig.add_subplot(len(rounds), 1, number)
+        colors = ['#555555' if out else POLL_COLORS[i % len(POLL_COLORS)] for i, out in enumerate(eliminated)]
+        ax.barh(range(option_count), counts, color=colors)
+        ax.set_yticks(range(option_count))
+        ax.set_yticklabels(options, color='white')
+        ax.invert_yaxis()
+        ax.set_title(f'第 {number} 輪', color='white', fontsize=11, loc='left')
+        for i, count in enumerate(counts):
+            if not eliminated[i]:
+                ax.text(count, i, f' {count:g}', va='center', color='white')
+        _style_axes(ax)
+        ax.spines['right'].set_visible(False)
+        if number <= len(losers):
+            eliminated[losers[number - 1]] = True
+
+    result = f'勝出：{options[winner]}' if winner is not None else '無法決定勝出者（同票）'
+    title = f'🔒 {question}（已結束）' if closed else question
+    fig.suptitle(f'{title}\n{result}', color='white', fontsize=15)
+    fig.text(0.5, 0.01, f'總選票數: {len(matrix)}（加權 {weights.sum():g}）', ha='center', color='#99AAB5')
+    fig.tight_layout(rect=(0, 0.03, 1, 0.95))
+    return _figure_to_png(fig)
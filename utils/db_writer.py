@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = 500  # 單次交易最多寫入的筆數
+
+class BatchWriter:
+    """非同步批次寫入器：呼叫端只把 SQL 放進佇列，背景任務在執行緒中批次寫入
+
+    submit() 不會等待也不會阻塞事件迴圈；寫入期間累積的項目會在下一次交易中一起 commit，
+    負載越高每次交易寫入的筆數越多。
+    """
+
+    def __init__(self, db_file="bot_data.db"):
+        self.db_file = db_file
+        self.queue = asyncio.Queue()
+        self.db = None
+        self._task = None
+
+    def submit(self, sql, params=()):
+        """排入一筆寫入，立即返回"""
+        self.queue.put_nowait((sql, params))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def flush(self):
+        """等待目前佇列中的寫入全部完成（查詢前呼叫，確保看得到剛排入的資料）"""
+        if self._task is not None and not self._task.done():
+            await self.queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.error(f"批次寫入 {len(batch)} 筆資料失敗: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        if self.db is None:
+            self.db = sqlite3.connect(self.db_file, check_same_thread=False)
+        # 連續相同的 SQL 合併成一次 executemany，整批在同一個交易中 commit
+        try:
+            with self.db:
+                start = 0
+                for index in range(1, len(batch) + 1):
+                    if index == len(batch) or batch[index][0] != batch[start][0]:
+                        self.db.executemany(batch[start][0], [params for _, params in batch[start:index]])
+                        start = index
+        except sqlite3.Error:
+            # 整批失敗時改為逐筆寫入，只捨棄有問題的那幾筆
+            for sql, params in batch:
+                try:
+                    with self.db:
+                        self.db.execute(sql, params)
+                except sqlite3.Error as e:
+                    logger.error(f"寫入失敗，已捨棄: {e} ({sql.split()[0]} {params})")
+
+_writers = {}
+
+def get_db_writer(db_file="bot_data.db"):
+    """取得該資料庫檔案共用的 BatchWriter"""
+    writer = _writers.get(db_file)
+    if writer is None:
+        writer = _writers[db_file] = BatchWriter(db_file)
+    return writer
+
+async def close_db_writers():
+    """關閉所有寫入器，寫完佇列中剩下的資料"""
+    for writer in list(_writers.values()):
+        await writer.close()
+    _writers.clear()
@@ -0,0 +1,65 @@
+import csv
+import gzip
+import io
+import json
+
+# gzip 內部仍可能暫存尚未寫出的壓縮資料，切檔時預留的安全空間
+PART_MARGIN_BYTES = 256 * 1024
+
+def format_csv(rows):
+    """把多筆資料列轉成 CSV 文字"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def format_jsonl(rows, fields):
+    """把多筆資料列轉成 JSON Lines 文字"""
+    return "".join(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n" for row in rows)
+
+class GzipPartWriter:
+    """把文字串流寫成 gzip 壓縮檔，壓縮後超過 max_bytes 時自動切成下一段
+
+    write() 回傳已寫滿的分段 (檔名, bytes)，呼叫端可以立即送出並釋放記憶體；
+    每一段都會重新寫入 header，讓各段都能單獨解壓使用。
+    """
+
+    def __init__(self, basename, extension, max_bytes, header=""):
+        self.basename = basename
+        self.extension = extension
+        self.limit = max(max_bytes - PART_MARGIN_BYTES, max_bytes // 2)
+        self.header = header
+        self.part_number = 0
+        self.rows_written = False
+        self._open()
+
+    def _open(self):
+        self.part_number += 1
+        self.raw = io.BytesIO()
+        self.gzip = gzip.GzipFile(fileobj=self.raw, mode="wb")
+        self.has_data = False
+        if self.header:
+            self.gzip.write(self.header.encode("utf-8"))
+
+    def _finish(self):
+        self.gzip.close()
+        return f"{self.basename}.part{self.part_number}.{self.extension}.gz", self.raw.getvalue()
+
+    def write(self, text):
+        """寫入一段文字；若目前分段已滿，回傳完成的分段，否則回傳 None"""
+        if not text:
+            return None
+        self.gzip.write(text.encode("utf-8"))
+        self.has_data = True
+        self.rows_written = True
+        if self.raw.tell() < self.limit:
+            return None
+        part = self._finish()
+        self._open()
+        return part
+
+    def close(self):
+        """結束寫入並回傳最後一段（沒有資料時為 None，除非整份匯出都是空的）"""
+        if self.has_data or not self.rows_written:
+            return self._finish()
+        self.gzip.close()
+        return None
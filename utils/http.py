@@ -0,0 +1,19 @@
+import aiohttp
+
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+_session = None
+
+def get_session():
+    """取得全機器人共用的 aiohttp 連線（重複使用連線池，不必每次請求都重新建立 TCP/TLS 連線）"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=DEFAULT_TIMEOUT)
+    return _session
+
+async def close_session():
+    """關閉共用連線，於機器人結束時呼叫"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+import discord
+
+from utils.outbound import get_outbound, PRIORITY_NOTIFICATION
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CONCURRENCY = 8          # 同時投遞的頻道數上限
+OUTBOX_MAX_ATTEMPTS = 5         # 超過此次數仍失敗的投遞保留在 outbox 中不再重試
+OUTBOX_RETRY_BASE = 30          # 第 n 次失敗後等待 OUTBOX_RETRY_BASE * 2^(n-1) 秒再重試
+OUTBOX_POLL_INTERVAL = 30       # 檢查待重試投遞的間隔（秒）
+EVENT_RETENTION = 30 * 86400    # 已處理事件的去重紀錄保留時間
+
+class NotificationHub:
+    """通知分發：生產者發布事件，依事件鍵去重，每個事件只產生一次內容，再並行投遞到所有訂閱頻道
+
+    每個投遞目標先寫入 notification_outbox 才開始發送，成功後刪除；
+    失敗或機器人中途重啟的投遞由背景任務依指數退避重試。
+    """
+
+    def __init__(self, bot, db_file="bot_data.db"):
+        self.bot = bot
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS notification_events (
+                event_key TEXT PRIMARY KEY,
+                kind TEXT,
+                created_at REAL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_key TEXT,
+                channel_id INTEGER,
+                content TEXT,
+                embed TEXT,
+                attempts INTEGER DEFAULT 0,
+                next_attempt REAL,
+                last_error TEXT
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_notification_outbox_next ON notification_outbox (attempts, next_attempt)")
+        self.db.commit()
+        self.renderers = {}  # 事件類型 -> renderer(data) -> (content, embed)
+        self.limit = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+        self.in_flight = set()  # 正在投遞中的 outbox ID，避免重試任務重複投遞
+        self._retry_task = None
+
+    def register(self, kind, renderer):
+        """註冊事件類型的內容產生函式"""
+        self.renderers[kind] = renderer
+
+    def start(self):
+        if self._retry_task is None or self._retry_task.done():
+            self._retry_task = asyncio.create_task(self._retry_loop())
+
+    def stop(self):
+        if self._retry_task:
+            self._retry_task.cancel()
+            self._retry_task = None
+
+    async def publish(self, kind, key, data, targets):
+        """發布事件並投遞到 targets（{頻道 ID: 額外文字，例如提及}）
+
+        相同事件鍵只會處理一次（包含重啟之後）；回傳成功投遞的頻道數，重複事件回傳 None。
+        """
+        event_key = f"{kind}:{key}"
+        cursor = self.db.execute("INSERT OR IGNORE INTO notification_events (event_key, kind, created_at) VALUES (?, ?, ?)",
+                                 (event_key, kind, time.time()))
+        if cursor.rowcount == 0:
+            self.db.commit()
+            logger.info(f"略過重複的通知事件 {event_key}")
+            return None
+
+        # 內容只產生一次，所有頻道共用同一個 embed
+        try:
+            content, embed = self.renderers[kind](data)
+        except Exception:
+            self.db.rollback()  # 讓事件在下次偵測到時可以重新發布
+            raise
+        embed_json = json.dumps(embed.to_dict(), ensure_ascii=False) if embed else None
+        now = time.time()
+        rows = []
+        for channel_id, extra in targets.items():
+            text = " ".join(part for part in (extra, content) if part) or None
+            cursor = self.db.execute("""
+                INSERT INTO notification_outbox (event_key, channel_id, content, embed, next_attempt)
+                VALUES (?, ?, ?, ?, ?)
+            """, (event_key, channel_id, text, embed_json, now))
+            rows.append((cursor.lastrowid, channel_id, text, embed, 0))
+        self.db.commit()
+
+        results = await asyncio.gather(*(self._deliver(*row) for row in rows))
+        delivered = sum(results)
+        logger.info(f"通知 {event_key} 已投遞到 {delivered} / {len(rows)} 個頻道")
+        return delivered
+
+    async def _deliver(self, outbox_id, channel_id, content, embed, attempts):
+        self.in_flight.add(outbox_id)
+        try:
+            async with self.limit:
+                channel = self.bot.get_channel(channel_id)
+                if channel is None:
+                    channel = await self.bot.fetch_channel(channel_id)
+                await get_outbound().send(channel, PRIORITY_NOTIFICATION, content=content, embed=embed)
+        except (discord.Forbidden, discord.NotFound) as e:
+            # 頻道已刪除或沒有權限，重試也不會成功
+            logger.error(f"無法投遞通知到頻道 {channel_id}，已放棄: {e}")
+            self._finish(outbox_id)
+            return False
+        except Exception as e:
+            attempts += 1
+            logger.warning(f"投遞通知到頻道 {channel_id} 失敗（第 {attempts} 次）: {e}")
+            self.db.execute("UPDATE notification_outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                            (attempts, time.time() + OUTBOX_RETRY_BASE * 2 ** (attempts - 1), str(e)[:500], outbox_id))
+            self.db.commit()
+            return False
+        finally:
+            self.in_flight.discard(outbox_id)
+        self._finish(outbox_id)
+        return True
+
+    def _finish(self, outbox_id):
+        self.db.execute("DELETE FROM notification_outbox WHERE id = ?", (outbox_id,))
+        self.db.commit()
+
+    async def retry_due(self):
+        """重試到期的投遞（也包含重啟前尚未完成的投遞）"""
+        rows = self.db.execute("""
+            SELECT id, channel_id, content, embed, attempts FROM notification_outbox
+            WHERE attempts < ? AND next_attempt <= ?
+        """, (OUTBOX_MAX_ATTEMPTS, time.time())).fetchall()
+        rows = [row for row in rows if row[0] not in self.in_flight]
+        if not rows:
+            return
+        logger.info(f"重試 {len(rows)} 則通知投遞")
+        await asyncio.gather(*(
+            self._deliver(outbox_id, channel_id, content, discord.Embed.from_dict(json.loads(embed)) if embed else None, attempts)
+            for outbox_id, channel_id, content, embed, attempts in rows
+        ))
+
+    def pending_counts(self):
+        """回傳 (等待重試數, 已放棄數)"""
+        return self.db.execute("""
+            SELECT COALESCE(SUM(attempts < ?), 0), COALESCE(SUM(attempts >= ?), 0) FROM notification_outbox
+        """, (OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_ATTEMPTS)).fetchone()
+
+    async def _retry_loop(self):
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await self.retry_due()
+                self.db.execute("DELETE FROM notification_events WHERE created_at < ?", (time.time() - EVENT_RETENTION,))
+                self.db.commit()
+            except Exception as e:
+                logger.error(f"重試通知投遞時發生錯誤: {e}")
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+_hub = None
+
+def get_notification_hub(bot):
+    """取得全機器人共用的 NotificationHub"""
+    global _hub
+    if _hub is None or _hub.bot is not bot:
+        _hub = NotificationHub(bot)
+    return _hub
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import random
+import time
+
+import aiohttp
+
+from utils.http import get_session
+
+logger = logging.getLogger(__name__)
+
+class ClientCredentialsToken:
+    """OAuth client credentials Token 管理
+
+    - 同一時間只會有一個刷新請求，其餘呼叫者等待同一個結果
+    - 取得 Token 後在背景排程，於過期前 refresh_margin 秒提前刷新
+    - 失敗時以隨機抖動的指數退避重試
+    """
+
+    def __init__(self, name, token_url, credentials, *, basic_auth=False, headers=None,
+                 refresh_margin=300, expiry_margin=60, max_attempts=4, base_delay=1.0, max_delay=30.0):
+        self.name = name
+        self.token_url = token_url
+        self.credentials = credentials  # 回傳 (client_id, client_secret) 的函式，設定可在執行中變更
+        self.basic_auth = basic_auth
+        self.headers = headers or {}
+        self.refresh_margin = refresh_margin
+        self.expiry_margin = expiry_margin
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.token = None
+        self.expires_at = None
+        self._refresh_task = None
+        self._proactive_task = None
+
+    @property
+    def valid(self):
+        return bool(self.token) and time.time() < self.expires_at - self.expiry_margin
+
+    async def get(self):
+        """取得有效的 Token；無法取得時回傳 None"""
+        if self.valid:
+            return self.token
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        # shield：單一呼叫者被取消時不影響其他等待中的呼叫者
+        return await asyncio.shield(self._refresh_task)
+
+    def invalidate(self, token=None):
+        """讓 Token 失效；指定 token 時只有仍是目前的 Token 才會清除，避免清掉別人剛刷新好的 Token"""
+        if token is not None and token != self.token:
+            return
+        self.token = None
+        self.expires_at = None
+        self._cancel_proactive()
+
+    def close(self):
+        self._cancel_proactive()
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+
+    def _cancel_proactive(self):
+        if self._proactive_task and not self._proactive_task.done():
+            self._proactive_task.cancel()
+        self._proactive_task = None
+
+    async def _refresh(self):
+        client_id, client_secret = self.credentials()
+        if not client_id or not client_secret:
+            logger.error(f"{self.name} Client ID 或 Client Secret 未設定")
+            return None
+
+        for attempt in range(self.max_attempts):
+            try:
+                token, expires_in = await self._request(client_id, client_secret)
+            except Exception as e:
+                logger.error(f"❌ 獲取 {self.name} Token 時發生錯誤: {e}")
+                token = None
+            if token:
+                self.token = token
+                self.expires_at = time.time() + expires_in
+                self._schedule_proactive(expires_in)
+                logger.info(f"✅ 成功獲取 {self.name} Token")
+                return token
+            if attempt < self.max_attempts - 1:
+                # full jitter：在 0 到指數上限之間隨機等待，避免多個客戶端同時重試
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                logger.warning(f"第 {attempt + 1} 次獲取 {self.name} Token 失敗，{delay:.1f} 秒後重試")
+                await asyncio.sleep(delay)
+        return None
+
+    async def _request(self, client_id, client_secret):
+        data = {"grant_type": "client_credentials"}
+        auth = None
+        if self.basic_auth:
+            auth = aiohttp.BasicAuth(client_id, client_secret)
+        else:
+            data.update(client_id=client_id, client_secret=client_secret)
+
+        async with get_session().post(self.token_url, data=data, auth=auth, headers=self.headers) as response:
+            if response.status != 200:
+                logger.error(f"❌ {self.name} Token 請求失敗: {response.status} - {await response.text()}")
+                return None, 0
+            payload = await response.json()
+            return payload.get("access_token"), payload.get("expires_in", 3600)
+
+    def _schedule_proactive(self, expires_in):
+        self._cancel_proactive()
+        delay = max(expires_in - self.refresh_margin, self.expiry_margin)
+        self._proactive_task = asyncio.create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay):
+        await asyncio.sleep(delay)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        await asyncio.shield(self._refresh_task)
+
+_managers = {}
+
+def get_token_manager(name, token_url, credentials, **options):
+    """取得（或建立）全機器人共用的 Token 管理器；重新載入 Cog 時會沿用同一個實例與 Token"""
+    manager = _managers.get(name)
+    if manager is None:
+        manager = ClientCredentialsToken(name, token_url, credentials, **options)
+        _managers[name] = manager
+    else:
+        manager.credentials = credentials
+    return manager
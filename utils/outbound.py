@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from utils.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# 數字越小越優先
+PRIORITY_MODERATION = 0     # 審核提示、清除進度
+PRIORITY_NOTIFICATION = 1   # 直播、新影片、歡迎、警報、投票刷新
+PRIORITY_SCHEDULED = 2      # 每日天氣等定時大量訊息
+PRIORITY_NAMES = {PRIORITY_MODERATION: "審核", PRIORITY_NOTIFICATION: "通知", PRIORITY_SCHEDULED: "定時"}
+
+GUILD_SEND_RATE = (5, 5)    # 每個伺服器每 5 秒最多 5 則主動發送的訊息
+WAIT_SAMPLES = 1000         # 每個優先順序保留的等待時間樣本數
+
+class OutboundJob:
+    __slots__ = ("kind", "target", "kwargs", "priority", "future", "enqueued", "started")
+
+    def __init__(self, kind, target, kwargs, priority):
+        self.kind = kind
+        self.target = target
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        # 呼叫端不等待結果時，避免出現 "exception was never retrieved" 警告
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self.enqueued = time.monotonic()
+        self.started = False
+
+class GuildLane:
+    """單一伺服器的發送排程：每個頻道一個優先佇列，共用一個速率限制
+
+    每次從所有頻道的佇列頭中挑出最優先的工作；同一頻道同時只會有一則在傳送中，
+    以維持頻道內的訊息順序，其他頻道不受影響。
+    """
+
+    def __init__(self, dispatcher, rate):
+        self.dispatcher = dispatcher
+        self.limiter = RateLimiter(*rate) if rate else None
+        self.channels = {}  # 頻道 ID -> [(優先順序, 序號, 工作)]
+        self.busy = set()
+        self.deliveries = set()  # 保留傳送中任務的參照，避免被垃圾回收
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def push(self, channel_id, job, seq):
+        heapq.heappush(self.channels.setdefault(channel_id, []), (job.priority, seq, job))
+        self.wake.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def _pick(self):
+        best = None
+        for channel_id, queue in self.channels.items():
+            if channel_id not in self.busy and (best is None or queue[0][:2] < self.channels[best][0][:2]):
+                best = channel_id
+        return best
+
+    async def _run(self):
+        while self.channels:
+            if self._pick() is None:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            if self.limiter:
+                await self.limiter.acquire()
+            # 等待配額期間可能有更優先的工作進來，取得配額後再挑一次
+            channel_id = self._pick()
+            if channel_id is None:
+                continue
+            queue = self.channels[channel_id]
+            job = heapq.heappop(queue)[2]
+            if not queue:
+                del self.channels[channel_id]
+            self.busy.add(channel_id)
+            task = asyncio.create_task(self._deliver(channel_id, job))
+            self.deliveries.add(task)
+            task.add_done_callback(self.deliveries.discard)
+
+    async def _deliver(self, channel_id, job):
+        try:
+            await self.dispatcher.deliver(job)
+        finally:
+            self.busy.discard(channel_id)
+            self.wake.set()
+
+class OutboundDispatcher:
+    """集中處理主動發送的訊息與編輯，依優先順序與伺服器速率限制排程
+
+    send()/edit() 立即回傳 Future：需要結果或錯誤的呼叫端可以 await，
+    不需要的可以直接忽略。尚未開始的編輯會與同一則訊息的新編輯合併。
+    """
+
+    def __init__(self, guild_rate=GUILD_SEND_RATE):
+        self.guild_rate = guild_rate
+        self.lanes = {}  # 伺服器 ID（私訊為 None）-> GuildLane
+        self.pending_edits = {}  # 訊息 ID -> 尚未開始的編輯工作
+        self.sequence = itertools.count()
+        self.wait_times = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITY_NAMES}
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def _lane(self, guild_id):
+        lane = self.lanes.get(guild_id)
+        if lane is None:
+            lane = self.lanes[guild_id] = GuildLane(self, self.guild_rate if guild_id else None)
+        return lane
+
+    def send(self, channel, priority=PRIORITY_NOTIFICATION, **kwargs):
+        """排入 channel.send(**kwargs)，回傳會得到 discord.Message 的 Future"""
+        job = OutboundJob("send", channel, kwargs, priority)
+        guild = getattr(channel, "guild", None)
+        self._lane(guild.id if guild else None).push(channel.id, job, next(self.sequence))
+        return job.future
+
+    def edit(self, message, priority=PRIORITY_NOTIFICATION, **kwargs):
+        """排入 message.edit(**kwargs)；同一則訊息尚未送出的編輯會合併，只送出最新內容"""
+        pending = self.pending_edits.get(message.id)
+        if pending and not pending.started:
+            pending.kwargs.update(kwargs)
+            if priority < pending.priority:
+                # 提高優先順序：舊的項目留在佇列中，開始時會因為已合併而跳過
+                pending.started = True
+                merged = pending.kwargs
+                job = OutboundJob("edit", message, merged, priority)
+                job.future.add_done_callback(lambda future, old=pending.future: self._chain(future, old))
+                self._push_edit(message, job)
+                return job.future
+            self.coalesced += 1
+            return pending.future
+        job = OutboundJob("edit", message, kwargs, priority)
+        self._push_edit(message, job)
+        return job.future
+
+    def _push_edit(self, message, job):
+        self.pending_edits[message.id] = job
+        guild = getattr(message, "guild", None)
+        self._lane(guild.id if guild else None).push(message.channel.id, job, next(self.sequence))
+
+    @staticmethod
+    def _chain(source, target):
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception():
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    async def deliver(self, job):
+        if job.kind == "edit":
+            if job.started:
+                return  # 已被合併到較優先的新工作
+            job.started = True
+            if self.pending_edits.get(job.target.id) is job:
+                del self.pending_edits[job.target.id]
+        else:
+            job.started = True
+        self.wait_times[job.priority].append(time.monotonic() - job.enqueued)
+        try:
+            if job.kind == "send":
+                result = await job.target.send(**job.kwargs)
+            else:
+                result = await job.target.edit(**job.kwargs)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"發送訊息失敗（頻道 {job.target.channel.id if job.kind == 'edit' else job.target.id}）: {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        self.sent += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def queued(self):
+        return sum(len(queue) for lane in self.lanes.values() for queue in lane.channels.values())
+
+    def wait_percentiles(self, priority):
+        """回傳該優先順序的 (樣本數, p50, p99, 最大值)，單位為毫秒"""
+        samples = sorted(self.wait_times[priority])
+        if not samples:
+            return None
+        pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+        return len(samples), pick(0.5), pick(0.99), samples[-1] * 1000
+
+_dispatcher = None
+
+def get_outbound():
+    """取得全機器人共用的 OutboundDispatcher"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = OutboundDispatcher()
+    return _dispatcher
@@ -0,0 +1,49 @@
+import asyncio
+import time
+from collections import deque
+
+class RateLimiter:
+    """Token bucket：平均每 per 秒最多 rate 次，允許短暫突發到 rate 次"""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    async def acquire(self):
+        """取得一個配額，不足時等待"""
+        async with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class SlidingWindowCounter:
+    """計算最近 window 秒內發生的次數"""
+
+    def __init__(self, window):
+        self.window = window
+        self.events = deque()
+
+    def _trim(self, now):
+        while self.events and now - self.events[0] > self.window:
+            self.events.popleft()
+
+    def hit(self):
+        """記錄一次事件並回傳目前視窗內的次數"""
+        now = time.monotonic()
+        self.events.append(now)
+        self._trim(now)
+        return len(self.events)
+
+    def count(self):
+        self._trim(time.monotonic())
+        return len(self.events)
@@ -0,0 +1,62 @@
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# 圖表等 CPU 密集的繪圖工作統一交給行程池，避免阻塞事件迴圈
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+_pool = None
+
+def get_render_pool():
+    """取得共用的繪圖行程池（第一次使用時建立）"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    return _pool
+
+async def render(func, *args):
+    """在行程池中執行繪圖函式，func 與參數必須可被 pickle"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_render_pool(), func, *args)
+
+def _warm_up():
+    # 在工作行程中預先載入 matplotlib 與 Pillow，讓第一次繪圖不用等待匯入
+    import utils.charts  # noqa: F401
+    import utils.cards  # noqa: F401
+    return os.getpid()
+
+async def warm_render_pool():
+    """啟動所有繪圖行程並預先載入繪圖模組"""
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    await asyncio.gather(*(loop.run_in_executor(pool, _warm_up) for _ in range(RENDER_WORKERS)))
+
+def shutdown_render_pool():
+    """關閉行程池"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+class RenderCache:
+    """以 LRU 方式快取已繪製的圖片（PNG bytes）"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+
+    def get(self, key):
+        data = self._items.get(key)
+        if data is not None:
+            self._items.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        self._items[key] = data
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
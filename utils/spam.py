@@ -0,0 +1,109 @@
+import time
+from collections import deque
+
+RING_SIZE = 16              # 每位使用者保留的最近訊息數
+FLOOD_MESSAGES = 6          # FLOOD_WINDOW 秒內達此訊息數視為洗版
+FLOOD_WINDOW = 8
+DUPLICATE_LIMIT = 3         # DUPLICATE_WINDOW 秒內相同內容達此數量視為重複訊息
+DUPLICATE_WINDOW = 60
+FLAG_DURATION = 300         # 被標記後的持續秒數（期間不獲得經驗值）
+PRUNE_INTERVAL = 1000       # 每處理多少則訊息清理一次閒置的使用者
+
+class UserActivity:
+    """單一使用者最近的訊息：固定大小的環狀緩衝區加上內容雜湊計數"""
+
+    __slots__ = ("recent", "hash_counts", "flagged_until", "last_message_id", "last_verdict")
+
+    def __init__(self):
+        self.recent = deque(maxlen=RING_SIZE)  # (時間, 內容雜湊)
+        self.hash_counts = {}
+        self.flagged_until = 0.0
+        self.last_message_id = None
+        self.last_verdict = None
+
+    def _forget(self, content_hash):
+        if content_hash is None:
+            return
+        count = self.hash_counts[content_hash] - 1
+        if count:
+            self.hash_counts[content_hash] = count
+        else:
+            del self.hash_counts[content_hash]
+
+    def add(self, now, content_hash):
+        # 移除超過重複視窗的舊訊息；每則訊息只會被移除一次，攤銷後為 O(1)
+        while self.recent and now - self.recent[0][0] > DUPLICATE_WINDOW:
+            self._forget(self.recent.popleft()[1])
+        if len(self.recent) == RING_SIZE:
+            self._forget(self.recent[0][1])
+        self.recent.append((now, content_hash))
+        if content_hash is not None:
+            self.hash_counts[content_hash] = self.hash_counts.get(content_hash, 0) + 1
+
+class SpamDetector:
+    """以滑動視窗偵測洗版與重複訊息，審核與等級系統共用同一份狀態"""
+
+    def __init__(self):
+        self.users = {}  # (guild_id, user_id) -> UserActivity
+        self.observed = 0
+
+    def observe(self, message):
+        """記錄一則訊息並回傳判定：None、"flood" 或 "duplicate"
+
+        同一則訊息只會被計算一次，多個 Cog 的 on_message 都可以呼叫。
+        只有剛被標記的那則訊息會回傳判定，避免重複處罰。
+        """
+        key = (message.guild.id, message.author.id)
+        activity = self.users.get(key)
+        if activity is None:
+            activity = self.users[key] = UserActivity()
+        elif activity.last_message_id == message.id:
+            return activity.last_verdict
+
+        self.observed += 1
+        if self.observed % PRUNE_INTERVAL == 0:
+            self.prune()
+
+        now = time.monotonic()
+        content = " ".join(message.content.lower().split())
+        content_hash = hash(content) if content else None
+        activity.add(now, content_hash)
+
+        verdict = None
+        if len(activity.recent) >= FLOOD_MESSAGES and now - activity.recent[-FLOOD_MESSAGES][0] <= FLOOD_WINDOW:
+            verdict = "flood"
+        elif content_hash is not None and activity.hash_counts[content_hash] >= DUPLICATE_LIMIT:
+            verdict = "duplicate"
+        if verdict:
+            already_flagged = activity.flagged_until > now
+            activity.flagged_until = now + FLAG_DURATION
+            if already_flagged:
+                verdict = None  # 已在標記期間內，只延長標記時間
+        activity.last_message_id = message.id
+        activity.last_verdict = verdict
+        return verdict
+
+    def is_flagged(self, guild_id, user_id):
+        activity = self.users.get((guild_id, user_id))
+        return activity is not None and activity.flagged_until > time.monotonic()
+
+    def clear(self, guild_id, user_id):
+        """解除使用者的標記（例如管理員手動解除禁言時）"""
+        self.users.pop((guild_id, user_id), None)
+
+    def prune(self):
+        """移除沒有近期訊息且未被標記的使用者，讓記憶體不隨使用者總數成長"""
+        now = time.monotonic()
+        idle = [key for key, activity in self.users.items()
+                if activity.flagged_until <= now and (not activity.recent or now - activity.recent[-1][0] > DUPLICATE_WINDOW)]
+        for key in idle:
+            del self.users[key]
+
+_detector = None
+
+def get_spam_detector():
+    """取得全機器人共用的 SpamDetector"""
+    global _detector
+    if _detector is None:
+        _detector = SpamDetector()
+    return _detector
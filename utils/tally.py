@@ -0,0 +1,48 @@
+import numpy as np
+
+# 排序選票以固定長度的 uint8 陣列儲存：依序為第 1、2、3... 志願的選項索引，未排序的位置填 UNRANKED
+UNRANKED = 255
+
+def encode_ranking(ranking, option_count):
+    """將志願順序編碼成固定長度的 bytes"""
+    return bytes(ranking) + bytes([UNRANKED]) * (option_count - len(ranking))
+
+def instant_runoff(ballots, weights, option_count):
+    """即時決選制計票
+
+    ballots 為 (選票數, 選項數) 的 uint8 矩陣，weights 為每張選票的權重。
+    回傳 (每一輪各選項得票的陣列列表, 每一輪淘汰的選項索引列表, 勝出選項索引；無人勝出時為 None)。
+    """
+    ballot_count = len(ballots)
+    # 未排序的位置對應到一個永遠被淘汰的虛擬選項
+    ranks = np.where(ballots == UNRANKED, option_count, ballots).astype(np.intp)
+    eliminated = np.zeros(option_count + 1, dtype=bool)
+    eliminated[option_count] = True
+    rows = np.arange(ballot_count)
+    rounds = []
+    losers = []
+
+    while True:
+        # 每張選票目前的最高志願：第一個尚未被淘汰的選項
+        valid = ~eliminated[ranks]
+        live = valid.any(axis=1)
+        choice = ranks[rows, valid.argmax(axis=1)]
+        counts = np.bincount(choice[live], weights=weights[live], minlength=option_count + 1)[:option_count]
+        rounds.append(counts)
+
+        remaining = np.flatnonzero(~eliminated[:option_count])
+        total = counts.sum()
+        if total == 0:
+            return rounds, losers, None
+
+        leader = remaining[np.argmax(counts[remaining])]
+        if counts[leader] * 2 > total or len(remaining) == 1:
+            return rounds, losers, int(leader)
+
+        # 淘汰得票最少者；同票時比較第一輪得票，再淘汰索引較大者
+        lowest = remaining[counts[remaining] == counts[remaining].min()]
+        if len(lowest) == len(remaining):
+            return rounds, losers, None  # 所有剩餘選項同票
+        loser = max(lowest, key=lambda option: (-rounds[0][option], option))
+        eliminated[loser] = True
+        losers.append(int(loser))
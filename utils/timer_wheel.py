@@ -0,0 +1,76 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TimerWheel:
+    """Hashed timer wheel：所有計時器共用一個 tick 任務
+
+    每個 key 只會存在於一個槽位中；排程、重設與取消都是 O(1)，
+    每次 tick 只處理當前槽位，過期時呼叫 on_expire(key)。
+    """
+
+    def __init__(self, on_expire, tick=1.0, slots=512):
+        self.on_expire = on_expire
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]  # key -> 還需繞幾圈
+        self.positions = {}  # key -> 槽位索引
+        self.cursor = 0
+        self._task = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, key, delay):
+        """在 delay 秒後讓 key 過期；已排程的 key 會被移到新的位置"""
+        self.cancel(key)
+        ticks = max(1, round(delay / self.tick))
+        rounds, offset = divmod(ticks, len(self.slots))
+        if offset == 0:
+            rounds, offset = rounds - 1, len(self.slots)
+        slot = (self.cursor + offset) % len(self.slots)
+        self.slots[slot][key] = rounds
+        self.positions[key] = slot
+
+    def cancel(self, key):
+        slot = self.positions.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self):
+        """前進一格並處理該槽位中到期的 key"""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        bucket = self.slots[self.cursor]
+        expired = []
+        for key, rounds in bucket.items():
+            if rounds:
+                bucket[key] = rounds - 1
+            else:
+                expired.append(key)
+        for key in expired:
+            del bucket[key]
+            del self.positions[key]
+            try:
+                self.on_expire(key)
+            except Exception as e:
+                logger.error(f"計時器 {key} 過期處理時發生錯誤: {e}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            self.advance()
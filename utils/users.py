@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import sqlite3
+import time
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+USER_NAME_TTL = 3600            # 記憶體中名稱快取的有效秒數
+USER_NAME_DB_TTL = 7 * 86400    # 資料表中的名稱超過此時間才會重新向 API 查詢
+USER_FETCH_CONCURRENCY = 4      # 同時進行的 REST 查詢上限
+FETCH_FAILED = object()         # REST 查詢暫時失敗（429、5xx 等），與查無此人區分
+
+class UserResolver:
+    """把使用者 ID 轉成顯示名稱
+
+    依序查詢：記憶體快取 → gateway 快取 → user_names 資料表 → REST API（限制並行數），
+    排行榜等常見情況下完全不需要呼叫 API。
+    """
+
+    def __init__(self, bot, db_file="bot_data.db"):
+        self.bot = bot
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS user_names (
+                user_id INTEGER PRIMARY KEY,
+                name TEXT,
+                updated_at REAL
+            )
+        """)
+        self.db.commit()
+        self.memo = {}  # user_id -> (名稱, 過期時間)；名稱為 None 表示查無此人
+        self.fetch_limit = asyncio.Semaphore(USER_FETCH_CONCURRENCY)
+
+    def _remember(self, names, persist=True):
+        now = time.time()
+        for user_id, name in names.items():
+            self.memo[user_id] = (name, now + USER_NAME_TTL)
+        if persist and names:
+            self.db.executemany("INSERT OR REPLACE INTO user_names (user_id, name, updated_at) VALUES (?, ?, ?)",
+                                [(user_id, name, now) for user_id, name in names.items()])
+            self.db.commit()
+
+    async def _fetch(self, user_id):
+        async with self.fetch_limit:
+            try:
+                return await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                return None
+            except discord.HTTPException as e:
+                logger.warning(f"查詢使用者 {user_id} 失敗: {e}")
+                return FETCH_FAILED
+
+    async def resolve_many(self, user_ids):
+        """回傳 {user_id: 名稱}；完全查不到的使用者不會出現在結果中"""
+        now = time.time()
+        names = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = self.memo.get(user_id)
+            if cached and cached[1] > now:
+                if cached[0] is not None:
+                    names[user_id] = cached[0]
+            else:
+                missing.append(user_id)
+        if not missing:
+            return names
+
+        # gateway 快取
+        from_gateway = {}
+        remaining = []
+        for user_id in missing:
+            user = self.bot.get_user(user_id)
+            if user:
+                from_gateway[user_id] = user.display_name
+            else:
+                remaining.append(user_id)
+        self._remember(from_gateway)
+        names.update(from_gateway)
+        if not remaining:
+            return names
+
+        # 資料表中的名稱
+        placeholders = ",".join("?" * len(remaining))
+        rows = self.db.execute(f"SELECT user_id, name, updated_at FROM user_names WHERE user_id IN ({placeholders})",
+                               remaining).fetchall()
+        stored = {user_id: (name, updated_at) for user_id, name, updated_at in rows}
+        fresh = {user_id: name for user_id, (name, updated_at) in stored.items() if now - updated_at < USER_NAME_DB_TTL}
+        self._remember(fresh, persist=False)
+        names.update(fresh)
+
+        # 最後才以 REST API 查詢，查詢失敗時沿用資料表中較舊的名稱
+        to_fetch = [user_id for user_id in remaining if user_id not in fresh]
+        if to_fetch:
+            users = await asyncio.gather(*(self._fetch(user_id) for user_id in to_fetch))
+            fetched = {user.id: user.display_name for user in users if user is not None and user is not FETCH_FAILED}
+            self._remember(fetched)
+            names.update(fetched)
+            for user_id, user in zip(to_fetch, users):
+                if user_id in fetched:
+                    continue
+                if user_id in stored:
+                    names[user_id] = stored[user_id][0]
+                elif user is None:
+                    # 確定查無此人才記住，避免每次排行榜都重新查詢；暫時失敗則下次再試
+                    self.memo[user_id] = (None, now + USER_NAME_TTL)
+        return names
+
+    async def resolve(self, user_id):
+        return (await self.resolve_many([user_id])).get(user_id)
+
+_resolver = None
+
+def get_user_resolver(bot):
+    """取得全機器人共用的 UserResolver"""
+    global _resolver
+    if _resolver is None or _resolver.bot is not bot:
+        _resolver = UserResolver(bot)
+    return _resolver